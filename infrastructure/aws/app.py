@@ -1,6 +1,9 @@
 """AWS CDK application for the stac-fastapi-geoparquet Stack
 
 Generates a Lambda function with an API Gateway trigger and an S3 bucket.
+With ``STACK_STREAMING=true`` the function is served from a function URL
+that streams its responses instead, so large searches aren't cut off at
+API Gateway's 6 MB limit.
 
 After deploying the stack you will need to make sure the geoparquet file
 specified in the config gets uploaded to the bucket associated with this stack!
@@ -20,7 +23,14 @@ from aws_cdk import (
 from aws_cdk.aws_apigatewayv2 import HttpApi, HttpStage, ThrottleSettings
 from aws_cdk.aws_apigatewayv2_integrations import HttpLambdaIntegration
 from aws_cdk.aws_iam import AnyPrincipal, Effect, PolicyStatement
-from aws_cdk.aws_lambda import Code, Function, Runtime
+from aws_cdk.aws_lambda import (
+    Code,
+    Function,
+    FunctionUrlAuthType,
+    InvokeMode,
+    LayerVersion,
+    Runtime,
+)
 from aws_cdk.aws_logs import RetentionDays
 from aws_cdk.aws_s3 import BlockPublicAccess, Bucket
 from aws_cdk.custom_resources import (
@@ -99,11 +109,39 @@ class StacFastApiGeoparquetStack(Stack):
 
         CfnOutput(self, "BucketName", value=bucket.bucket_name)
 
+        environment = {
+            "STAC_FASTAPI_GEOPARQUET_HREF": f"s3://{bucket.bucket_name}/{config.geoparquet_key}",
+            "HOME": "/tmp",  # for duckdb's home_directory
+        }
+        layers = []
+        handler = "handler.handler"
+        if config.streaming:
+            # The Lambda Web Adapter runs stream.sh as a web server and streams
+            # what it writes back through the function URL.
+            handler = "stream.sh"
+            layers.append(
+                LayerVersion.from_layer_version_arn(
+                    self,
+                    "lambda-web-adapter",
+                    f"arn:aws:lambda:{self.region}:753240598075:layer:"
+                    f"LambdaAdapterLayerX86:{config.lambda_web_adapter_version}",
+                )
+            )
+            environment.update(
+                {
+                    "AWS_LAMBDA_EXEC_WRAPPER": "/opt/bootstrap",
+                    "AWS_LWA_INVOKE_MODE": "response_stream",
+                    "AWS_LWA_PORT": "8080",
+                    "AWS_LWA_READINESS_CHECK_PATH": "/_mgmt/ping",
+                    "STAC_FASTAPI_STREAM_RESPONSES": "true",
+                }
+            )
+
         api_lambda = Function(
             scope=self,
             id="lambda",
             runtime=runtime,
-            handler="handler.handler",
+            handler=handler,
             memory_size=config.memory,
             log_retention=RetentionDays.ONE_WEEK,
             timeout=Duration.seconds(config.timeout),
@@ -114,14 +152,21 @@ class StacFastApiGeoparquetStack(Stack):
                     "PYTHON_VERSION": runtime.to_string().replace("python", ""),
                 },
             ),
-            environment={
-                "STAC_FASTAPI_GEOPARQUET_HREF": f"s3://{bucket.bucket_name}/{config.geoparquet_key}",
-                "HOME": "/tmp",  # for duckdb's home_directory
-            },
+            environment=environment,
+            layers=layers,
         )
 
         bucket.grant_read(api_lambda)
 
+        if config.streaming:
+            # API Gateway buffers responses, so streaming skips it.
+            function_url = api_lambda.add_function_url(
+                auth_type=FunctionUrlAuthType.NONE,
+                invoke_mode=InvokeMode.RESPONSE_STREAM,
+            )
+            CfnOutput(self, "ApiURL", value=function_url.url)
+            return
+
         api = HttpApi(
             scope=self,
             id="api",
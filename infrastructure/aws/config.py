@@ -23,6 +23,12 @@ class Config(BaseSettings):
     timeout: int = 30
     memory: int = 3009
 
+    # Stream search responses from a function URL, instead of buffering them
+    # behind API Gateway, which caps them at 6 MB.
+    streaming: bool = False
+    # The version of the Lambda Web Adapter layer that streaming runs behind.
+    lambda_web_adapter_version: int = 25
+
     # The maximum of concurrent executions you want to reserve for the function.
     # Default: - No specific limit - account limit.
     max_concurrent: int | None = None
@@ -0,0 +1,11 @@
+#!/bin/sh
+# AWS Lambda entry point that streams responses.
+#
+# Lambda's Python runtime sends a handler's response once it's complete, so
+# streaming deployments run the app under uvicorn instead, behind the Lambda
+# Web Adapter, which passes each chunk on to the response stream as it's
+# written.
+PATH=$PATH:$LAMBDA_TASK_ROOT/bin \
+  PYTHONPATH=$PYTHONPATH:$LAMBDA_TASK_ROOT:$LAMBDA_RUNTIME_DIR \
+  exec python -m uvicorn --host 127.0.0.1 --port "${AWS_LWA_PORT:-8080}" \
+  --log-level warning stac_fastapi.geoparquet.main:app
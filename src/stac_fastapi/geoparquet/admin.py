@@ -0,0 +1,25 @@
+import hmac
+from typing import cast
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from .settings import Settings
+
+
+def require_admin(request: Request) -> None:
+    """Rejects requests that don't send the admin secret as a bearer token.
+
+    Admin endpoints are only registered when ``stac_fastapi_admin_secret`` is
+    set, and this dependency keeps them to the operators who know it.
+    """
+    secret = cast(Settings, request.app.state.settings).stac_fastapi_admin_secret
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if (
+        secret is None
+        or scheme.lower() != "bearer"
+        or not hmac.compare_digest(token.encode(), secret.get_secret_value().encode())
+    ):
+        raise HTTPException(
+            401, "admin secret required", headers={"WWW-Authenticate": "Bearer"}
+        )
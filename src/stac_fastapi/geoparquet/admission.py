@@ -0,0 +1,317 @@
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import re
+import urllib.parse
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, NamedTuple
+
+import anyio
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .deadline import Deadline
+from .etag import HrefVersion
+from .settings import Settings
+from .storage import from_href
+
+logger = logging.getLogger(__name__)
+
+FILTER_COST_FACTOR = 4
+"""CQL2 filters rarely prune row groups, so filtered queries scan more."""
+
+SIZE_COST_BYTES = 1_000_000_000
+"""Every this-many bytes of data behind a query adds one unit to its multiplier."""
+
+DEFAULT_PAGE_SIZE = 10
+"""The ``limit`` of searches that don't set one."""
+
+COLLECTION_PATH = re.compile(
+    r"^/collections/(?P<collection_id>[^/]+)"
+    r"/(?:items(?:/(?P<item_id>[^/]+))?|tiles/\d+/\d+/\d+)$"
+)
+"""Paths of a collection's items, one item, or a tile."""
+
+
+class AdmissionController:
+    """Limits how many cheap and expensive searches run at the same time.
+
+    Searches are classified by :py:meth:`estimate_cost` and then have to acquire
+    a slot from the matching budget, which :py:class:`AdmissionMiddleware`
+    does before they reach the app.  If no slot frees up before the queue
+    deadline, the search is rejected with a 503 and a ``Retry-After`` header so
+    that expensive work can't starve small lookups like ``get_item``.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.expensive_cost = settings.stac_fastapi_admission_expensive_cost
+        self.queue_seconds = settings.stac_fastapi_admission_queue_seconds
+        cheap = settings.stac_fastapi_admission_cheap_concurrency
+        expensive = settings.stac_fastapi_admission_expensive_concurrency
+        self.cheap = anyio.Semaphore(cheap, max_value=max(cheap, 1))
+        self.expensive = anyio.Semaphore(expensive, max_value=max(expensive, 1))
+        self.sizes: dict[str, int] = {}
+        self.cheap_concurrency = cheap
+        self.running = 0
+        self.waiting = 0
+
+    def size(self, href: str) -> int:
+        """Returns the size of the file at ``href`` in bytes, or zero if unknown.
+
+        Sizes are cached per href and normally come from :py:meth:`update`, so
+        files are only looked up here if they aren't served yet.
+        """
+        if (size := self.sizes.get(href)) is None:
+            try:
+                store, path = from_href(href)
+                size = int(store.head(path)["size"])
+            except Exception:
+                logger.warning("Could not determine the size of %s", href)
+                size = 0
+            self.sizes[href] = size
+        return size
+
+    def update(self, versions: dict[str, HrefVersion]) -> None:
+        """Takes the sizes of the served hrefs from a collections reload."""
+        self.sizes = {href: version.size or 0 for href, version in versions.items()}
+
+    def estimate_cost(
+        self,
+        hrefs: list[str],
+        limit: int,
+        *,
+        ids: list[str] | None = None,
+        has_filter: bool = False,
+    ) -> float:
+        """Estimates the relative cost of a search.
+
+        The estimate is the number of rows that might be returned across all
+        collections, weighted up for filters and for the amount of data behind
+        the hrefs.  Id lookups only cost the number of ids requested.
+        """
+        if not hrefs:
+            return 0
+        rows = min(len(ids), limit) if ids else limit
+        cost = float(rows * len(hrefs))
+        if has_filter and not ids:
+            cost *= FILTER_COST_FACTOR
+        total_size = sum(self.size(href) for href in hrefs)
+        return cost * (1 + total_size / SIZE_COST_BYTES)
+
+    @asynccontextmanager
+    async def admit(
+        self, cost: float, timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """Holds a slot in the budget for ``cost`` while the context is active.
+
+        Searches wait for a slot on the event loop, so a queue of them doesn't
+        tie up the threadpool that running searches need.  Raises a 503 if no
+        slot is available before the queue deadline, which is shortened to
+        ``timeout`` if that is sooner.
+        """
+        semaphore = self.expensive if cost >= self.expensive_cost else self.cheap
+        queue_seconds = self.queue_seconds
+        if timeout is not None:
+            queue_seconds = min(queue_seconds, timeout)
+        try:
+            semaphore.acquire_nowait()
+            acquired = True
+        except anyio.WouldBlock:
+            acquired = False
+        if not acquired:
+            self.waiting += 1
+            try:
+                with anyio.move_on_after(queue_seconds):
+                    await semaphore.acquire()
+                    acquired = True
+            finally:
+                self.waiting -= 1
+        if not acquired:
+            raise HTTPException(
+                503,
+                "too many searches in progress, try again later",
+                headers={"Retry-After": str(max(1, math.ceil(self.queue_seconds)))},
+            )
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    def busy(self) -> bool:
+        """Returns True if searches are queueing or half the cheap slots are in use.
+
+        Optional work, like prefetching, should be skipped while busy.
+        """
+        return self.waiting > 0 or self.running * 2 >= self.cheap_concurrency
+
+
+class Searched(NamedTuple):
+    """What a request searches, as far as :py:meth:`estimate_cost` cares."""
+
+    hrefs: list[str]
+    limit: int
+    ids: list[str] | None
+    has_filter: bool
+
+
+class AdmissionMiddleware:
+    """Admits searches, tiles and batch lookups before they reach the app.
+
+    The cost of a request is estimated from its path, query and JSON body,
+    and it waits for a slot on the event loop; only admitted requests go on to
+    the threadpool.  The slot is held until the response, including a streamed
+    one, has been sent.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Settings) -> None:
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        admission: AdmissionController | None = getattr(
+            scope["app"].state, "admission", None
+        )
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path) :]
+        path = path.rstrip("/")
+        if admission is None or not admitted(scope["method"], path):
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        if scope["method"] == "POST":
+            # The body is read for the estimate, and replayed for the app.
+            more_body = True
+            while more_body:
+                message = await receive()
+                body += message.get("body", b"")
+                more_body = message.get("more_body", False)
+            receive = replay(body, receive)
+
+        searched = self.searched(
+            path, scope.get("query_string", b""), body, scope["app"].state.hrefs
+        )
+        if all(href in admission.sizes for s in searched for href in s.hrefs):
+            cost = estimate(admission, searched)
+        else:
+            # Sizes of new hrefs are looked up with a HEAD request.
+            cost = await run_in_threadpool(estimate, admission, searched)
+
+        deadline: Deadline | None = scope.get("state", {}).get("deadline")
+        async with contextlib.AsyncExitStack() as slot:
+            try:
+                await slot.enter_async_context(
+                    admission.admit(cost, deadline.remaining() if deadline else None)
+                )
+            except HTTPException as e:
+                response = JSONResponse(
+                    {"detail": e.detail}, e.status_code, headers=e.headers
+                )
+                await response(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+
+    def searched(
+        self, path: str, query_string: bytes, body: bytes, hrefs: dict[str, str]
+    ) -> list[Searched]:
+        """Returns what a request searches.
+
+        Parameters that don't parse are ignored here; the app rejects them.
+        """
+        parameters: dict[str, Any] = {
+            key: values[-1]
+            for key, values in urllib.parse.parse_qs(query_string.decode()).items()
+        }
+        if body:
+            try:
+                parameters.update(json.loads(body))
+            except (ValueError, TypeError):
+                pass
+
+        if path == "/items":
+            groups: dict[str, list[str]] = {}
+            for reference in parameters.get("items") or []:
+                if isinstance(reference, dict) and reference.get("collection") in hrefs:
+                    groups.setdefault(reference["collection"], []).append(
+                        str(reference.get("id"))
+                    )
+            return [
+                Searched([hrefs[collection]], len(ids), ids, False)
+                for collection, ids in groups.items()
+            ]
+
+        collections = parameters.get("collections") or list(hrefs)
+        if isinstance(collections, str):
+            collections = collections.split(",")
+        ids = parameters.get("ids") or None
+        if isinstance(ids, str):
+            ids = ids.split(",")
+        try:
+            limit = int(parameters.get("limit") or DEFAULT_PAGE_SIZE)
+        except (TypeError, ValueError):
+            limit = DEFAULT_PAGE_SIZE
+        if match := COLLECTION_PATH.match(path):
+            collections = [match["collection_id"]]
+            if match["item_id"] is not None:
+                ids, limit = [match["item_id"]], 1
+        if "/tiles/" in path:
+            limit = self.settings.stac_fastapi_tile_max_features
+        searched_hrefs = [
+            hrefs[collection]
+            for collection in collections
+            if isinstance(collection, str) and collection in hrefs
+        ]
+        return [
+            Searched(searched_hrefs, limit, ids, parameters.get("filter") is not None)
+        ]
+
+
+def admitted(method: str, path: str) -> bool:
+    """Returns True for requests that search, and so need a slot."""
+    if method == "GET":
+        return (
+            path == "/search"
+            or path.startswith("/tiles/")
+            or COLLECTION_PATH.match(path) is not None
+        )
+    return method == "POST" and path in ("/search", "/search/explain", "/items")
+
+
+def estimate(admission: AdmissionController, searched: list[Searched]) -> float:
+    return sum(
+        admission.estimate_cost(s.hrefs, s.limit, ids=s.ids, has_filter=s.has_filter)
+        for s in searched
+    )
+
+
+def replay(body: bytes, receive: Receive | None) -> Receive:
+    """Returns a receive channel that yields ``body`` once.
+
+    After that it defers to ``receive``, or waits forever if there isn't one
+    (a prefetch has no client that could disconnect).
+    """
+    sent = False
+
+    async def receive_body() -> Message:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        if receive is not None:
+            return await receive()
+        await asyncio.Event().wait()
+        raise AssertionError("unreachable")
+
+    return receive_body
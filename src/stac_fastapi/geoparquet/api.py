@@ -1,50 +1,88 @@
 import json
 import logging
-import urllib.parse
 from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import Any, TypedDict, cast
+from typing import Any, NamedTuple, TypedDict, cast
 
-import obstore.store
 import pystac.utils
 from fastapi import FastAPI, Request, Response
 from rustac import DuckdbClient
 from stac_fastapi.api.app import StacApi
+from stac_fastapi.extensions.core.filter import ItemCollectionFilterExtension
 from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
+from .admission import AdmissionController, AdmissionMiddleware
+from .batch import ItemsExtension
 from .client import Client
+from .collection_index import CollectionIndex
+from .connection import configure, create_client
+from .deadline import DeadlineMiddleware
+from .etag import data_versions, matches, validators
+from .explain import ExplainExtension
+from .freetext import TextIndexes
+from .materialize import MaterializedCollections
 from .models import (
+    COLLECTION_SEARCH_EXTENSION,
     EXTENSIONS,
     GetSearchRequestModel,
     ItemsGetRequestModel,
     PostSearchRequestModel,
 )
+from .prefetch import PrefetchMiddleware
+from .profiling import ProfilingMiddleware
+from .queryables import FiltersClient, HrefQueryables
+from .rangeread import RangeReader
+from .schema import HrefSchemas
 from .settings import Settings
+from .shared import SharedCollections, max_age
+from .slowlog import SlowQueriesExtension, SlowQueryLog
+from .storage import from_href
+from .tiles import TilesExtension
 
 logger = logging.getLogger(__name__)
 
 GEOPARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
 
+MATERIALIZE_ASSET_FIELD = "stac-fastapi-geoparquet:materialize"
+
 
 async def load_collections(settings: Settings) -> list[dict[str, Any]]:
     if settings.stac_fastapi_collections_href:
-        if urllib.parse.urlparse(settings.stac_fastapi_collections_href).scheme:
-            href = settings.stac_fastapi_collections_href
-        else:
-            href = "file://" + str(
-                Path(settings.stac_fastapi_collections_href).absolute()
-            )
-        prefix, file_name = href.rsplit("/", 1)
-        store = obstore.store.from_url(prefix)
-        result = store.get(file_name)
+        store, path = from_href(settings.stac_fastapi_collections_href)
+        result = store.get(path)
         collections = cast(list[dict[str, Any]], json.loads(bytes(result.bytes())))
     else:
         collections = []
     return collections
 
 
+async def read_collections(
+    settings: Settings, shared: SharedCollections | None
+) -> list[dict[str, Any]]:
+    """Loads collections, going through the shared snapshot if there is one.
+
+    Only the reloader process reads the collections href; other workers use
+    the snapshot it published, or read the href themselves if there isn't one
+    yet.  They also read it themselves if the reloader hasn't published for
+    several reload intervals (see :py:func:`~.shared.max_age`), e.g. because
+    it's stuck but still holds its lock.
+    """
+    if shared is None or shared.acquire():
+        collections = await load_collections(settings)
+        if shared is not None:
+            await run_in_threadpool(shared.publish, collections)
+        return collections
+    snapshot = await run_in_threadpool(
+        shared.read, max_age(settings.stac_fastapi_collections_reload_seconds)
+    )
+    if snapshot is not None:
+        return snapshot
+    logger.warning("The shared collections snapshot is missing or stale")
+    return await load_collections(settings)
+
+
 def _parse_collections(
     collections: list[dict[str, Any]], settings: Settings
 ) -> tuple[dict[str, dict[str, Any]], dict[str, str]]:
@@ -68,6 +106,58 @@ def _parse_collections(
     return collection_dict, hrefs
 
 
+class CollectionsDiff(NamedTuple):
+    """What changed between two versions of the collections."""
+
+    added: set[str]
+    removed: set[str]
+    changed: set[str]
+    """Collections whose JSON changed."""
+
+    hrefs_changed: set[str]
+    """Collections whose geoparquet href was added, removed, or changed."""
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.removed or self.changed or self.hrefs_changed)
+
+
+def _diff_collections(
+    old_collections: dict[str, dict[str, Any]],
+    old_hrefs: dict[str, str],
+    new_collections: dict[str, dict[str, Any]],
+    new_hrefs: dict[str, str],
+) -> CollectionsDiff:
+    return CollectionsDiff(
+        added=new_collections.keys() - old_collections.keys(),
+        removed=old_collections.keys() - new_collections.keys(),
+        changed={
+            collection_id
+            for collection_id in new_collections.keys() & old_collections.keys()
+            if new_collections[collection_id] != old_collections[collection_id]
+        },
+        hrefs_changed={
+            collection_id
+            for collection_id in new_hrefs.keys() | old_hrefs.keys()
+            if new_hrefs.get(collection_id) != old_hrefs.get(collection_id)
+        },
+    )
+
+
+def _materialized_collection_ids(
+    collection_dict: dict[str, dict[str, Any]], settings: Settings
+) -> set[str]:
+    """Return the ids of collections that should be loaded into memory."""
+    collection_ids = set(settings.stac_fastapi_materialized_collections)
+    for collection_id, collection in collection_dict.items():
+        for asset in collection["assets"].values():
+            if asset.get("type") == GEOPARQUET_MEDIA_TYPE and asset.get(
+                MATERIALIZE_ASSET_FIELD
+            ):
+                collection_ids.add(collection_id)
+    return collection_ids
+
+
 class State(TypedDict):
     """Application state."""
 
@@ -77,6 +167,27 @@ class State(TypedDict):
     It's just an in-memory DuckDB connection with the spatial extension enabled.
     """
 
+    admission: AdmissionController
+    """Limits the number of cheap and expensive searches running at once."""
+
+    materialized: MaterializedCollections
+    """Collections served from in-memory DuckDB tables."""
+
+    slow_queries: SlowQueryLog
+    """Search timings by fingerprint."""
+
+    schemas: HrefSchemas
+    """The columns of each href."""
+
+    text_indexes: TextIndexes
+    """The free-text index of each href that's been searched with ``q``."""
+
+    queryables: HrefQueryables
+    """The queryable properties of each href."""
+
+    range_reader: RangeReader | None
+    """Reads remote hrefs with obstore, if ``stac_fastapi_range_reads`` is set."""
+
 
 def make_collections_middleware(
     settings: Settings,
@@ -92,24 +203,99 @@ def make_collections_middleware(
 
     async def _refresh(app: FastAPI) -> None:
         try:
-            raw = await load_collections(settings)
+            raw = await read_collections(settings, app.state.shared)
             collection_dict, hrefs = _parse_collections(raw, settings)
         except Exception:
             logger.exception("Failed to reload collections; keeping stale state")
             return
+        diff = _diff_collections(
+            app.state.collections, app.state.hrefs, collection_dict, hrefs
+        )
+        # Files can be replaced without the catalog changing, so href versions
+        # are checked on every reload, once, and everything that depends on
+        # them uses the same lookup.
+        versions = await run_in_threadpool(
+            data_versions, collection_dict, hrefs, app.state.versions
+        )
+        await run_in_threadpool(
+            app.state.materialized.refresh,
+            app.state.client,
+            hrefs,
+            _materialized_collection_ids(collection_dict, settings),
+            versions.hrefs,
+        )
+        app.state.admission.update(versions.hrefs)
+        app.state.collections_last_updated = datetime.now()
+        # Text indexes of files that changed are rebuilt here, rather than by
+        # the next search that needs them.
+        await run_in_threadpool(
+            app.state.text_indexes.refresh,
+            app.state.client,
+            {
+                href: version
+                for href, version in versions.hrefs.items()
+                if version.e_tag or version.last_modified
+            },
+            lambda href, version: app.state.schemas.columns(
+                app.state.client, href, version
+            ),
+        )
+        if app.state.range_reader is not None:
+            # Staged copies of replaced files are only deleted once the next
+            # reload comes around, so searches still reading them can finish.
+            app.state.range_reader.forget(set(hrefs.values()))
+        if diff.empty:
+            app.state.versions = versions
+            logger.debug("Collections reloaded; nothing changed")
+            return
+
+        # Unchanged collections keep their existing objects, and the index is
+        # only rebuilt if the collections themselves changed.
+        collection_dict = {
+            collection_id: (
+                collection
+                if collection_id in diff.added or collection_id in diff.changed
+                else app.state.collections[collection_id]
+            )
+            for collection_id, collection in collection_dict.items()
+        }
+        if diff.added or diff.removed or diff.changed:
+            index = await run_in_threadpool(CollectionIndex, collection_dict.values())
+        else:
+            index = app.state.collections_index
+        # No awaits from here on, so requests see either the old or the new
+        # state, never a mix.
         app.state.collections = collection_dict
         app.state.hrefs = hrefs
-        app.state.collections_last_updated = datetime.now()
-        logger.debug(
-            "Collections reloaded; %d collection(s) active", len(collection_dict)
+        app.state.collections_index = index
+        app.state.versions = versions
+        app.state.schemas.forget(set(hrefs.values()))
+        app.state.text_indexes.forget(set(hrefs.values()))
+        app.state.queryables.forget(set(hrefs.values()))
+        logger.info(
+            "Collections reloaded; %d added, %d removed, %d changed, "
+            "%d href(s) changed; %d collection(s) active",
+            len(diff.added),
+            len(diff.removed),
+            len(diff.changed),
+            len(diff.hrefs_changed),
+            len(collection_dict),
         )
 
     async def middleware(
         request: Request, call_next: Callable[[Request], Awaitable[Response]]
     ) -> Response:
         request.state.client = request.app.state.client
+        request.state.admission = request.app.state.admission
+        request.state.materialized = request.app.state.materialized
+        request.state.slow_queries = request.app.state.slow_queries
+        request.state.schemas = request.app.state.schemas
+        request.state.text_indexes = request.app.state.text_indexes
+        request.state.queryables = request.app.state.queryables
+        request.state.range_reader = request.app.state.range_reader
         request.state.collections = request.app.state.collections
         request.state.hrefs = request.app.state.hrefs
+        request.state.collections_index = request.app.state.collections_index
 
         background: BackgroundTask | None = None
         last_updated: datetime | None = getattr(
@@ -122,7 +308,21 @@ def make_collections_middleware(
             request.app.state.collections_last_updated = datetime.now()
             background = BackgroundTask(_refresh, request.app)
 
-        response = await call_next(request)
+        # Conditional requests are answered here, before any DuckDB work.
+        headers = validators(
+            request,
+            request.app.state.versions,
+            request.state.collections,
+            request.state.hrefs,
+            settings.stac_fastapi_cache_control,
+        )
+        if_none_match = request.headers.get("if-none-match")
+        if headers and if_none_match and matches(if_none_match, headers["ETag"]):
+            response = Response(status_code=304, headers=headers)
+        else:
+            response = await call_next(request)
+            if headers and response.status_code == 200:
+                response.headers.update(headers)
         if background is not None:
             response.background = background
         return response
@@ -135,30 +335,78 @@ async def lifespan(app: FastAPI) -> AsyncIterator[State]:
     client: DuckdbClient = app.extra["duckdb_client"]
     settings: Settings = app.extra["settings"]
 
+    if settings.stac_fastapi_shared_state_directory:
+        shared = SharedCollections(settings.stac_fastapi_shared_state_directory)
+    else:
+        shared = None
+
     # Perform an initial blocking load so the first request is never served
     # with an empty catalog.
-    raw = await load_collections(settings)
+    raw = await read_collections(settings, shared)
     collection_dict, hrefs = _parse_collections(raw, settings)
+    admission = AdmissionController(settings)
+    materialized = MaterializedCollections()
+    slow_queries = SlowQueryLog(settings)
+    schemas = HrefSchemas()
+    text_indexes = TextIndexes()
+    queryables = HrefQueryables()
+    range_reader = RangeReader(settings) if settings.stac_fastapi_range_reads else None
+    versions = await run_in_threadpool(data_versions, collection_dict, hrefs)
+    admission.update(versions.hrefs)
+    await run_in_threadpool(
+        materialized.refresh,
+        client,
+        hrefs,
+        _materialized_collection_ids(collection_dict, settings),
+        versions.hrefs,
+    )
     app.state.client = client
+    app.state.admission = admission
+    app.state.materialized = materialized
+    app.state.slow_queries = slow_queries
+    app.state.schemas = schemas
+    app.state.text_indexes = text_indexes
+    app.state.queryables = queryables
+    app.state.range_reader = range_reader
+    app.state.shared = shared
     app.state.collections = collection_dict
     app.state.hrefs = hrefs
+    app.state.collections_index = CollectionIndex(collection_dict.values())
+    app.state.versions = versions
     app.state.collections_last_updated = datetime.now()
 
-    yield {"client": client}
+    try:
+        yield {
+            "client": client,
+            "admission": admission,
+            "materialized": materialized,
+            "slow_queries": slow_queries,
+            "schemas": schemas,
+            "text_indexes": text_indexes,
+            "queryables": queryables,
+            "range_reader": range_reader,
+        }
+    finally:
+        if shared is not None:
+            shared.close()
+        if range_reader is not None:
+            range_reader.close()
 
 
 def create(
     settings: Settings | None = None,
     duckdb_client: DuckdbClient | None = None,
 ) -> StacApi:
-    if duckdb_client is None:
-        duckdb_client = DuckdbClient()
     if settings is None:
         settings = Settings(
             stac_fastapi_landing_id="stac-fastapi-geoparquet",
             stac_fastapi_title="stac-fastapi-geoparquet",
             stac_fastapi_description="A stac-fastapi server backend by stac-geoparquet",
         )
+    if duckdb_client is None:
+        duckdb_client = create_client(settings)
+    else:
+        configure(duckdb_client, settings)
 
     # Collections from stac_fastapi_collections_href are loaded in the lifespan
     # and kept fresh by the hot-reload middleware.
@@ -183,15 +431,36 @@ def create(
     )
     # Add hot-reload middleware
     app.middleware("http")(make_collections_middleware(settings))
+    # Admission waits inside the deadline, and before the threadpool.
+    app.add_middleware(AdmissionMiddleware, settings=settings)
+    app.add_middleware(DeadlineMiddleware, settings=settings)
+    if settings.stac_fastapi_prefetch:
+        app.add_middleware(PrefetchMiddleware, settings=settings)
+    if settings.stac_fastapi_profiling_secret:
+        app.add_middleware(ProfilingMiddleware, settings=settings)
 
+    client = Client()
+    admin_extensions = []
+    if settings.stac_fastapi_admin_secret:
+        admin_extensions.extend(
+            [ExplainExtension(client=client), SlowQueriesExtension()]
+        )
     api = StacApi(
         settings=settings,
-        client=Client(),
+        client=client,
         app=app,
         search_get_request_model=GetSearchRequestModel,
         search_post_request_model=PostSearchRequestModel,
         items_get_request_model=ItemsGetRequestModel,
-        extensions=EXTENSIONS,
+        collections_get_request_model=COLLECTION_SEARCH_EXTENSION.GET,
+        extensions=[
+            *EXTENSIONS,
+            COLLECTION_SEARCH_EXTENSION,
+            ItemCollectionFilterExtension(client=FiltersClient()),
+            TilesExtension(settings=settings),
+            ItemsExtension(client=client, settings=settings),
+            *admin_extensions,
+        ],
     )
     return api
 
@@ -0,0 +1,114 @@
+import json
+from collections.abc import Iterator
+from typing import Any, cast
+
+import attr
+from fastapi import APIRouter, FastAPI, HTTPException
+from pydantic import BaseModel
+from stac_fastapi.types.extension import ApiExtension
+from stac_fastapi.types.stac import Item
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from .client import Client, ItemLinks
+from .deadline import Deadline
+from .settings import Settings
+
+BATCH_SIZE = 1000
+"""The most ids looked up by a single query."""
+
+
+class ItemReference(BaseModel):
+    """An item to fetch."""
+
+    collection: str
+    id: str
+
+
+class ItemsRequest(BaseModel):
+    """A batch of items to fetch."""
+
+    items: list[ItemReference]
+
+
+def group_ids(references: list[ItemReference]) -> dict[str, list[str]]:
+    """Groups item ids by collection, dropping duplicates but keeping order."""
+    groups: dict[str, dict[str, None]] = {}
+    for reference in references:
+        groups.setdefault(reference.collection, {})[reference.id] = None
+    return {collection: list(ids) for collection, ids in groups.items()}
+
+
+@attr.s
+class ItemsExtension(ApiExtension):
+    """Fetches many items, from any number of collections, in one request.
+
+    Ids are grouped by collection and looked up with one ``id IN (...)`` query
+    per collection (per :py:data:`BATCH_SIZE` ids), and the items are streamed
+    back as a feature collection as each query finishes.  Items that don't
+    exist are left out, so clients should match on ``collection`` and ``id``
+    rather than on position.
+    """
+
+    client: Client = attr.ib(factory=Client)
+    settings: Settings = attr.ib(factory=Settings)
+
+    def register(self, app: FastAPI) -> None:
+        router = APIRouter()
+        router.add_api_route(
+            name="Get Items",
+            path="/items",
+            endpoint=self.get_items,
+            methods=["POST"],
+            response_class=StreamingResponse,
+            responses={200: {"content": {"application/geo+json": {}}}},
+        )
+        app.include_router(router, tags=["Items"])
+
+    def get_items(self, request: Request, body: ItemsRequest) -> StreamingResponse:
+        """Returns the requested items as a feature collection."""
+        max_items = self.settings.stac_fastapi_batch_max_items
+        if len(body.items) > max_items:
+            raise HTTPException(
+                400, f"too many items: {len(body.items)} (maximum {max_items})"
+            )
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        groups = group_ids(body.items)
+        if unknown := [collection for collection in groups if collection not in hrefs]:
+            raise HTTPException(
+                404, f"Collection does not exist: {', '.join(sorted(unknown))}"
+            )
+        # The admission slot, taken by the middleware, is held until the stream
+        # has been sent.
+        return StreamingResponse(
+            self.stream(request, groups), media_type="application/geo+json"
+        )
+
+    def stream(self, request: Request, groups: dict[str, list[str]]) -> Iterator[str]:
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        deadline = cast(Deadline, request.state.deadline)
+
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ""
+        for collection, collection_ids in groups.items():
+            add_links = ItemLinks(request, collection)
+            for start in range(0, len(collection_ids), BATCH_SIZE):
+                deadline.check()
+                batch = collection_ids[start : start + BATCH_SIZE]
+                items = self.client.search_collection(
+                    request,
+                    collection,
+                    hrefs[collection],
+                    {"ids": batch, "limit": len(batch)},
+                )
+                for item in items:
+                    yield separator + json.dumps(add_links(cast(Item, item)))
+                    separator = ", "
+        links: list[dict[str, Any]] = [
+            {
+                "href": str(request.url_for("Landing Page")),
+                "rel": "root",
+                "type": "application/json",
+            }
+        ]
+        yield '], "links": ' + json.dumps(links) + "}"
@@ -1,45 +1,106 @@
+import contextlib
 import copy
+import itertools
 import json
+import math
+import time
 import urllib.parse
 from typing import Any, cast
 
 from fastapi import HTTPException
 from pydantic import ValidationError
 from rustac import DuckdbClient
+from stac_fastapi.api.models import GeoJSONResponse
 from stac_fastapi.types.core import BaseCoreClient
 from stac_fastapi.types.errors import NotFoundError
 from stac_fastapi.types.search import BaseSearchPostRequest
 from stac_fastapi.types.stac import Collection, Collections, Item, ItemCollection
 from stac_pydantic.shared import BBox
 from starlette.requests import Request
+from starlette.responses import Response
 
+from .collection_index import CollectionIndex
+from .deadline import Deadline
+from .etag import current_version
+from .freetext import TextIndexes
+from .intersects import PreparedIntersects, prepare
+from .materialize import MaterializedCollections, search_href
+from .merge import decode_token, encode_token, merge, tiebroken
 from .models import PostSearchRequestModel
+from .profiling import Profile
+from .rangeread import RangeReader
+from .schema import HrefSchemas
+from .settings import Settings
+from .slowlog import SlowQueryLog, fingerprint
+from .stream import ItemBatches, collect, stream
 
 DEFAULT_LIMIT = 10_000
 
+FIRST_BATCH_SIZE = 100
+"""How many items are fetched before their sizes are known, with a byte budget."""
+
 
 class Client(BaseCoreClient):
     """A stac-fastapi-geoparquet client."""
 
-    def all_collections(self, **kwargs: Any) -> Collections:
+    def all_collections(
+        self,
+        bbox: BBox | None = None,
+        datetime: str | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        q: list[str] | None = None,
+        **kwargs: Any,
+    ) -> Collections:
         request = kwargs.pop("request")
         collections = cast(dict[str, Collection], request.state.collections)
-        return Collections(
-            collections=[
-                collection_with_links(c, request) for c in collections.values()
-            ],
-            links=[
+        index = cast(CollectionIndex, request.state.collections_index)
+        ids = index.search(bbox=list(bbox) if bbox else None, datetime=datetime, q=q)
+        offset = offset or 0
+        page = ids[offset : offset + limit] if limit else ids[offset:]
+
+        url = str(request.url_for("Get Collections"))
+        links = [
+            {
+                "href": str(request.url_for("Landing Page")),
+                "rel": "root",
+                "type": "application/json",
+            },
+            {
+                "href": str(request.url),
+                "rel": "self",
+                "type": "application/json",
+            },
+        ]
+        if limit and offset + limit < len(ids):
+            params = dict(request.query_params)
+            params["offset"] = str(offset + limit)
+            links.append(
                 {
-                    "href": str(request.url_for("Landing Page")),
-                    "rel": "root",
+                    "href": url + "?" + urllib.parse.urlencode(params),
+                    "rel": "next",
                     "type": "application/json",
-                },
+                }
+            )
+        if limit and offset > 0:
+            params = dict(request.query_params)
+            params["offset"] = str(max(0, offset - limit))
+            links.append(
                 {
-                    "href": str(request.url_for("Get Collections")),
-                    "rel": "self",
+                    "href": url + "?" + urllib.parse.urlencode(params),
+                    "rel": "prev",
                     "type": "application/json",
-                },
+                }
+            )
+        return Collections(
+            collections=[
+                collection_with_links(collections[id], request)
+                for id in page
+                if id in collections
             ],
+            links=links,
+            numberMatched=len(ids),
+            numberReturned=len(page),
         )
 
     def get_collection(self, collection_id: str, **kwargs: Any) -> Collection:
@@ -51,9 +112,11 @@ class Client(BaseCoreClient):
             raise NotFoundError(f"Collection does not exist: {collection_id}")
 
     def get_item(self, item_id: str, collection_id: str, **kwargs: Any) -> Item:
-        item_collection = self.get_search(
-            ids=[item_id],
-            collections=[collection_id],
+        request = kwargs.pop("request")
+        item_collection = self.search(
+            request=request,
+            search=BaseSearchPostRequest(ids=[item_id], collections=[collection_id]),
+            url=str(request.url_for("Search")),
             **kwargs,
         )
         if len(item_collection["features"]) == 1:
@@ -72,7 +135,7 @@ class Client(BaseCoreClient):
         datetime: str | None = None,
         limit: int | None = 10,
         **kwargs: Any,
-    ) -> ItemCollection:
+    ) -> Response:
         request = kwargs.pop("request")
 
         if intersects:
@@ -102,14 +165,14 @@ class Client(BaseCoreClient):
         except ValidationError as e:
             raise HTTPException(400, f"invalid request: {e}")
 
-        return self.search(
+        return self.respond(
             request=request,
             search=search,
             url=str(request.url_for("Search")),
             **kwargs,
         )
 
-    def item_collection(
+    def item_collection(  # type: ignore[override]
         self,
         collection_id: str,
         bbox: BBox | None = None,
@@ -117,8 +180,10 @@ class Client(BaseCoreClient):
         limit: int = 10,
         token: str | None = None,
         **kwargs: Any,
-    ) -> ItemCollection:
+    ) -> Response:
         request = kwargs.pop("request")
+        if collection_id not in request.state.collections:
+            raise NotFoundError(f"Collection does not exist: {collection_id}")
         offset = kwargs.pop("offset", None)
         search = PostSearchRequestModel(
             collections=[collection_id],
@@ -127,24 +192,39 @@ class Client(BaseCoreClient):
             limit=limit,
             offset=offset,
         )
-        return self.search(
+        return self.respond(
             request=request,
             search=cast(BaseSearchPostRequest, search),
             url=str(request.url_for("Get ItemCollection", collection_id=collection_id)),
             **kwargs,
         )
 
-    def post_search(
+    def post_search(  # type: ignore[override]
         self, search_request: BaseSearchPostRequest, **kwargs: Any
-    ) -> ItemCollection:
+    ) -> Response:
         request = kwargs.pop("request")
-        return self.search(
+        return self.respond(
             search=search_request,
             request=request,
             url=str(request.url_for("Search")),
             **kwargs,
         )
 
+    def respond(self, *, request: Request, **kwargs: Any) -> Response:
+        """Searches, sending the page as one body or as it's read."""
+        settings = cast(Settings, request.app.state.settings)
+        if settings.stac_fastapi_stream_responses and getattr(
+            request.state, "stream", True
+        ):
+            return stream(
+                self.iter_search(
+                    request=request,
+                    batch_size=settings.stac_fastapi_stream_batch_size,
+                    **kwargs,
+                )
+            )
+        return GeoJSONResponse(self.search(request=request, **kwargs))
+
     def search(
         self,
         *,
@@ -153,85 +233,123 @@ class Client(BaseCoreClient):
         search: BaseSearchPostRequest,
         **kwargs: Any,
     ) -> ItemCollection:
-        client = cast(DuckdbClient, request.state.client)
+        """Searches, returning the whole page at once."""
+        return collect(
+            self.iter_search(request=request, url=url, search=search, **kwargs)
+        )
+
+    def iter_search(
+        self,
+        *,
+        request: Request,
+        url: str,
+        search: BaseSearchPostRequest,
+        batch_size: int | None = None,
+        **kwargs: Any,
+    ) -> ItemBatches:
+        """Searches, yielding the page's items in batches as they're read.
+
+        The generator returns the page without its items, because its links
+        are only known once they've all been read.  Without a ``batch_size``,
+        each collection is read in one batch.
+        """
         hrefs = cast(dict[str, str], request.state.hrefs)
+        deadline = cast(Deadline, request.state.deadline)
 
         if search.collections:
             collections = search.collections
         else:
             collections = list(hrefs.keys())
 
-        search_dict = search.model_dump(exclude_none=True, by_alias=True)
-        search_dict.update(**kwargs)
-
-        search_dict.pop("filter_crs", None)
-        if filter_expr := search_dict.pop("filter_expr", None):
-            search_dict["filter"] = filter_expr
-        if filter_lang := search_dict.pop("filter_lang", None):
-            search_dict["filter-lang"] = filter_lang
-        if "filter" not in search_dict:
-            search_dict.pop("filter_lang", None)
-            search_dict.pop("filter-lang", None)
-        if fields := search_dict.pop("fields", None):
-            if isinstance(fields, list):
-                include = []
-                exclude = []
-                for field in fields:
-                    if field.startswith("-"):
-                        exclude.append(field)
-                    else:
-                        include.append(field)
-                search_dict.update({"include": include, "exclude": exclude})
-            elif isinstance(fields, dict):
-                search_dict.update(
-                    {
-                        "include": list(fields.get("include", [])),
-                        "exclude": list(fields.get("exclude", [])),
-                    }
-                )
-            else:
-                raise HTTPException(400, f"unexpected fields type: {fields}")
-        if sortby := search_dict.pop("sortby", None):
-            search_dict["sortby"] = sortby
+        search_dict = self.search_dict(search, **kwargs)
+        token = search_dict.pop("token", None)
+        started = time.perf_counter()
+        request.state.collection_timings = []
+        # The AOI is prepared once and shared by every collection searched.
+        request.state.intersects = None
+        if intersects := search_dict.get("intersects"):
+            request.state.intersects = prepare(intersects)
+        shape = fingerprint(
+            search_dict,
+            collections,
+            search_dict.get("limit", DEFAULT_LIMIT),
+        )
 
         limit = search_dict.get("limit", DEFAULT_LIMIT)
         offset = search_dict.get("offset", 0) or 0
-        items: list[Item] = []
-        while collections:
-            collection = collections.pop(0)
-            if href := hrefs.get(collection):
-                collection_search_dict = copy.deepcopy(search_dict)
-                collection_search_dict.update(
-                    {
+        next_search: dict[str, Any] | None = None
+        settings = cast(Settings, request.app.state.settings)
+        budget = None
+        if max_bytes := settings.stac_fastapi_max_response_bytes:
+            budget = ByteBudget(max_bytes)
+        profile: Profile | None = getattr(request.state, "profile", None)
+        with profile.sample() if profile else contextlib.nullcontext():
+            if "sortby" in search_dict and (token is not None or len(collections) > 1):
+                items, next_search = self.merge_search(
+                    request=request,
+                    search_dict=search_dict,
+                    collections=collections,
+                    token=token,
+                    limit=limit,
+                    offset=offset,
+                    budget=budget,
+                )
+                yield items
+            else:
+                full = False
+                while collections and limit > 0 and not full:
+                    deadline.check()
+                    collection = collections[0]
+                    if (href := hrefs.get(collection)) is None:
+                        collections.pop(0)
+                        continue
+                    # With a byte budget, items are fetched in batches sized to
+                    # what's left of it, so big items aren't all held at once.
+                    fetch = limit if budget is None else budget.batch_size(limit)
+                    if batch_size:
+                        fetch = min(fetch, batch_size)
+                    # rustac doesn't modify its arguments, so a shallow copy is
+                    # enough.
+                    collection_search_dict = {
+                        **search_dict,
                         "collections": [],
-                        "limit": limit,
+                        "limit": fetch,
                         "offset": offset,
                     }
-                )
-                collection_items = client.search(href, **collection_search_dict)
-                for item in collection_items:
-                    # Careful ... we aren't updating `collection_items` with the
-                    # correct links.
-                    items.append(
-                        self.item_with_links(cast(Item, item), request, collection)
+                    if sortby := search_dict.get("sortby"):
+                        # Offsets into tied rows need a unique last key too.
+                        collection_search_dict["sortby"] = tiebroken(sortby)
+                    collection_items = self.search_collection(
+                        request, collection, href, collection_search_dict
                     )
-                if len(items) >= limit:
-                    collections.insert(0, collection)
-                    offset = offset + len(collection_items)
-                    break
-                else:
-                    limit = limit - len(collection_items)
-                    offset = 0
+                    add_links = ItemLinks(request, collection)
+                    batch: list[Item] = []
+                    for collection_item in collection_items:
+                        item = add_links(cast(Item, collection_item))
+                        if budget is not None and not budget.add(item):
+                            full = True
+                            break
+                        batch.append(item)
+                        offset += 1
+                        limit -= 1
+                    if not full and len(collection_items) < fetch:
+                        collections.pop(0)
+                        offset = 0
+                    if batch:
+                        yield batch
 
-        num_items = len(items)
+                if collections and (limit <= 0 or full):
+                    next_search = copy.deepcopy(search_dict)
+                    next_search["limit"] = search.limit or DEFAULT_LIMIT
+                    next_search["offset"] = offset
+                    next_search["collections"] = collections
 
-        if collections and ((search.limit or DEFAULT_LIMIT) <= num_items):
-            next_search = copy.deepcopy(search_dict)
-            next_search["limit"] = search.limit or DEFAULT_LIMIT
-            next_search["offset"] = offset
-            next_search["collections"] = collections
-        else:
-            next_search = None
+        if slow_queries := getattr(request.state, "slow_queries", None):
+            cast(SlowQueryLog, slow_queries).record(
+                shape,
+                time.perf_counter() - started,
+                request.state.collection_timings,
+            )
 
         links: list[dict[str, Any]] = [
             {
@@ -251,9 +369,15 @@ class Client(BaseCoreClient):
             )
             if next_search:
                 if "collections" in next_search:
-                    next_search["collections"] = ",".join(collections)
+                    next_search["collections"] = ",".join(next_search["collections"])
+                if sortby := next_search.get("sortby"):
+                    next_search["sortby"] = ",".join(sortby)
                 if bbox := next_search.get("bbox"):
                     next_search["bbox"] = ",".join(map(str, bbox))
+                if intersects := next_search.get("intersects"):
+                    next_search["intersects"] = json.dumps(intersects)
+                if q := next_search.get("q"):
+                    next_search["q"] = ",".join(q)
                 links.append(
                     {
                         "href": url + "?" + urllib.parse.urlencode(next_search),
@@ -283,34 +407,268 @@ class Client(BaseCoreClient):
                     }
                 )
 
+        # Lets the prefetch middleware fetch the next page ahead of time.
+        request.state.next_link = links[-1] if links[-1]["rel"] == "next" else None
         return {
             "type": "FeatureCollection",
-            "features": items,
+            "features": [],
             "links": links,
         }
 
+    def search_dict(
+        self, search: BaseSearchPostRequest, **kwargs: Any
+    ) -> dict[str, Any]:
+        """Converts a search request into keyword arguments for rustac."""
+        search_dict = search.model_dump(exclude_none=True, by_alias=True)
+        search_dict.update(**kwargs)
+
+        search_dict.pop("filter_crs", None)
+        if not search_dict.get("q"):
+            search_dict.pop("q", None)
+        if filter_expr := search_dict.pop("filter_expr", None):
+            search_dict["filter"] = filter_expr
+        if filter_lang := search_dict.pop("filter_lang", None):
+            search_dict["filter-lang"] = filter_lang
+        if "filter" not in search_dict:
+            search_dict.pop("filter_lang", None)
+            search_dict.pop("filter-lang", None)
+        if fields := search_dict.pop("fields", None):
+            if isinstance(fields, list):
+                include = []
+                exclude = []
+                for field in fields:
+                    if field.startswith("-"):
+                        exclude.append(field)
+                    else:
+                        include.append(field)
+                search_dict.update({"include": include, "exclude": exclude})
+            elif isinstance(fields, dict):
+                search_dict.update(
+                    {
+                        "include": list(fields.get("include", [])),
+                        "exclude": list(fields.get("exclude", [])),
+                    }
+                )
+            else:
+                raise HTTPException(400, f"unexpected fields type: {fields}")
+        if sortby := search_dict.pop("sortby", None):
+            search_dict["sortby"] = sortby
+
+        return search_dict
+
+    def search_collection(
+        self,
+        request: Request,
+        collection: str,
+        href: str,
+        search_dict: dict[str, Any],
+    ) -> list[dict[str, Any]]:
+        """Searches one collection, from memory if it's materialized."""
+        client = cast(DuckdbClient, request.state.client)
+        materialized = cast(MaterializedCollections, request.state.materialized)
+        profile: Profile | None = getattr(request.state, "profile", None)
+        schemas = cast(HrefSchemas, request.state.schemas)
+        started = time.perf_counter()
+        prepared: PreparedIntersects | None = getattr(request.state, "intersects", None)
+        with profile.duckdb(client, href) if profile else contextlib.nullcontext():
+            items: list[dict[str, Any]] | None = None
+            rows = None
+            if q := search_dict.get("q"):
+                # Free text is answered by the href's index, which narrows the
+                # search to the matching rows before any parquet is read.
+                version = current_version(request, href)
+                index = cast(TextIndexes, request.state.text_indexes).index(
+                    client, href, version, schemas.columns(client, href, version)
+                )
+                positions = index.search(q, search_dict.get("ids"))
+                search_dict = {
+                    **{key: value for key, value in search_dict.items() if key != "q"},
+                    "ids": [index.ids[position] for position in positions],
+                }
+                if index.positional:
+                    rows = positions
+                if not positions:
+                    items = []
+            if items is None:
+                items = materialized.search(client, collection, search_dict, prepared)
+            reader = cast(RangeReader | None, request.state.range_reader)
+            if items is None and reader is not None:
+                version = current_version(request, href)
+                columns = schemas.columns(client, href, version)
+                href_search = search_dict
+                if rows is not None:
+                    href_search = {k: v for k, v in search_dict.items() if k != "ids"}
+                items = reader.search(
+                    client,
+                    href,
+                    version,
+                    href_search,
+                    columns,
+                    prepared,
+                    rows,
+                    cast(Deadline, request.state.deadline),
+                )
+            if items is None and (prepared is not None or rows is not None):
+                # rustac checks intersects against every row, so these searches
+                # go through SQL that rules out most rows by their bbox first.
+                # Row numbers from a text index let DuckDB skip the rest too.
+                version = current_version(request, href)
+                columns = schemas.columns(client, href, version)
+                href_search = search_dict
+                if rows is not None:
+                    href_search = {k: v for k, v in search_dict.items() if k != "ids"}
+                items = search_href(client, href, href_search, columns, prepared, rows)
+            if items is None:
+                items = client.search(href, **search_dict)
+        timings: list[dict[str, Any]] | None = getattr(
+            request.state, "collection_timings", None
+        )
+        if timings is not None:
+            timings.append(
+                {
+                    "collection": collection,
+                    "seconds": time.perf_counter() - started,
+                    "rows": len(items),
+                }
+            )
+        return items
+
+    def merge_search(
+        self,
+        *,
+        request: Request,
+        search_dict: dict[str, Any],
+        collections: list[str],
+        token: str | None,
+        limit: int,
+        offset: int,
+        budget: "ByteBudget | None" = None,
+    ) -> tuple[list[Item], dict[str, Any] | None]:
+        """Searches several collections and merges them into one sorted page.
+
+        Each collection only needs to return its own top ``offset + limit``
+        items, or ``limit`` items starting at the position recorded for it in
+        ``token``.  The returned next search carries a token with the new
+        per-collection positions, so later pages don't re-read earlier ones.
+        Collections are sorted with ``id`` as the last key, so those positions
+        mean the same thing from one page to the next.
+        """
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        deadline = cast(Deadline, request.state.deadline)
+        if token is None:
+            positions = {c: 0 for c in collections if c in hrefs}
+            skip = offset
+        else:
+            token_positions = decode_token(token)
+            positions = {
+                c: token_positions.get(c, 0) for c in collections if c in hrefs
+            }
+            skip = 0
+
+        pages: dict[str, list[dict[str, Any]]] = {}
+        for collection, position in positions.items():
+            deadline.check()
+            collection_search_dict = {
+                **search_dict,
+                "collections": [],
+                "limit": skip + limit,
+                "offset": position,
+                "sortby": tiebroken(search_dict["sortby"]),
+            }
+            pages[collection] = self.search_collection(
+                request, collection, hrefs[collection], collection_search_dict
+            )
+
+        items: list[Item] = []
+        consumed = dict.fromkeys(pages, 0)
+        links = {collection: ItemLinks(request, collection) for collection in pages}
+        merged = merge(pages, search_dict["sortby"])
+        for i, (collection, merged_item) in enumerate(
+            itertools.islice(merged, skip + limit)
+        ):
+            if i >= skip:
+                item = links[collection](cast(Item, merged_item))
+                if budget is not None and not budget.add(item):
+                    break
+                items.append(item)
+            consumed[collection] += 1
+
+        # A collection is done once it came back short and all of it was used.
+        remaining = {
+            collection: positions[collection] + consumed[collection]
+            for collection, page in pages.items()
+            if consumed[collection] < len(page) or len(page) == skip + limit
+        }
+        if not remaining:
+            return items, None
+        next_search = copy.deepcopy(search_dict)
+        next_search.pop("offset", None)
+        next_search["limit"] = limit
+        next_search["collections"] = list(remaining)
+        next_search["token"] = encode_token(remaining)
+        return items, next_search
+
     def item_with_links(self, item: Item, request: Request, collection: str) -> Item:
-        links = [
-            {
-                "href": str(request.url_for("Landing Page")),
-                "rel": "root",
-                "type": "application/json",
-            },
-        ]
-        item["collection"] = collection
+        return ItemLinks(request, collection)(item)
+
+
+class ByteBudget:
+    """Keeps the items of a page under a maximum serialized size.
+
+    Sizes are measured as compact JSON, which is close to what is sent.  The
+    first item is always accepted, so every page makes progress.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.count = 0
+
+    def add(self, item: Item) -> bool:
+        """Counts ``item`` against the budget, or returns False if it doesn't fit."""
+        size = len(json.dumps(item, separators=(",", ":")))
+        if self.count and self.used + size > self.max_bytes:
+            return False
+        self.used += size
+        self.count += 1
+        return True
+
+    def batch_size(self, limit: int) -> int:
+        """Returns how many items to fetch next, based on the sizes seen so far."""
+        if not self.count:
+            return min(limit, FIRST_BATCH_SIZE)
+        average = self.used / self.count
+        remaining = max(0, self.max_bytes - self.used)
+        return max(1, min(limit, math.ceil(remaining / average) + 1))
+
+
+class ItemLinks:
+    """Replaces an item's server links with links into this API.
+
+    Routes are only resolved once per collection, not once per item, which
+    matters for large pages.
+    """
+
+    def __init__(self, request: Request, collection: str) -> None:
+        self.collection = collection
+        root = str(request.url_for("Landing Page"))
         href = str(request.url_for("Get Collection", collection_id=collection))
-        links.append({"href": href, "rel": "collection", "type": "application/json"})
-        links.append({"href": href, "rel": "parent", "type": "application/json"})
+        self.links = [
+            {"href": root, "rel": "root", "type": "application/json"},
+            {"href": href, "rel": "collection", "type": "application/json"},
+            {"href": href, "rel": "parent", "type": "application/json"},
+        ]
+        self.items_href = str(
+            request.url_for("Get ItemCollection", collection_id=collection)
+        )
+
+    def __call__(self, item: Item) -> Item:
+        item["collection"] = self.collection
+        links = list(self.links)
         if item_id := item.get("id"):
             links.append(
                 {
-                    "href": str(
-                        request.url_for(
-                            "Get Item",
-                            collection_id=collection,
-                            item_id=item_id,
-                        )
-                    ),
+                    "href": f"{self.items_href}/{item_id}",
                     "rel": "self",
                     "type": "application/geo+json",
                 }
@@ -323,6 +681,9 @@ class Client(BaseCoreClient):
 
 
 def collection_with_links(collection: Collection, request: Request) -> Collection:
+    # Copy so the loaded collections stay as they were parsed, which lets
+    # reloads tell which collections changed.
+    collection = cast(Collection, {**collection})
     collection["links"] = [
         {
             "href": str(request.url_for("Landing Page")),
@@ -0,0 +1,165 @@
+import datetime
+import math
+import re
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+from stac_fastapi.types.rfc3339 import str_to_interval
+
+GRID_DEGREES = 10
+"""The size of a spatial grid cell, in degrees."""
+
+TEXT_FIELDS = ("id", "title", "description", "keywords")
+"""Collection fields that free-text queries search."""
+
+BBox = tuple[float, float, float, float]
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase words."""
+    return re.findall(r"\w+", text.lower())
+
+
+def parse_datetime(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.UTC)
+    return parsed
+
+
+def split_antimeridian(bbox: list[float]) -> list[BBox]:
+    """Returns 2D bboxes, splitting one that crosses the antimeridian."""
+    if len(bbox) == 6:
+        bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+    xmin, ymin, xmax, ymax = (float(v) for v in bbox)
+    if xmin > xmax:
+        return [(xmin, ymin, 180.0, ymax), (-180.0, ymin, xmax, ymax)]
+    return [(xmin, ymin, xmax, ymax)]
+
+
+def cells(bbox: BBox) -> Iterator[tuple[int, int]]:
+    """Yields the grid cells that a bbox touches."""
+    xmin, ymin, xmax, ymax = bbox
+    columns = range(
+        math.floor(max(xmin, -180) / GRID_DEGREES),
+        math.floor(min(xmax, 180) / GRID_DEGREES) + 1,
+    )
+    rows = range(
+        math.floor(max(ymin, -90) / GRID_DEGREES),
+        math.floor(min(ymax, 90) / GRID_DEGREES) + 1,
+    )
+    for column in columns:
+        for row in rows:
+            yield column, row
+
+
+def intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+class CollectionIndex:
+    """An in-memory index of collections for collection search.
+
+    Collections are registered in a grid of :py:data:`GRID_DEGREES` cells by
+    their spatial extent, and in an inverted index by the words of their
+    :py:data:`TEXT_FIELDS`.  Indexes are immutable: a reload builds a new one
+    and swaps it in.
+    """
+
+    def __init__(self, collections: Iterable[dict[str, Any]]) -> None:
+        self.ids: list[str] = []
+        self.bboxes: list[list[BBox]] = []
+        self.intervals: list[
+            tuple[datetime.datetime | None, datetime.datetime | None]
+        ] = []
+        self.grid: dict[tuple[int, int], set[int]] = {}
+        self.words: dict[str, set[int]] = {}
+
+        for position, collection in enumerate(collections):
+            self.ids.append(collection["id"])
+            extent = collection.get("extent") or {}
+
+            bboxes = (extent.get("spatial") or {}).get("bbox") or []
+            # The first bbox is the overall extent; any others are more precise
+            boxes = [
+                box
+                for bbox in (bboxes[1:] if len(bboxes) > 1 else bboxes)
+                for box in split_antimeridian(bbox)
+            ]
+            self.bboxes.append(boxes)
+            for box in boxes:
+                for cell in cells(box):
+                    self.grid.setdefault(cell, set()).add(position)
+
+            intervals = (extent.get("temporal") or {}).get("interval") or [[]]
+            start, end = (list(intervals[0]) + [None, None])[:2]
+            self.intervals.append((parse_datetime(start), parse_datetime(end)))
+
+            for field in TEXT_FIELDS:
+                value = collection.get(field)
+                texts = value if isinstance(value, list) else [value]
+                for text in texts:
+                    if isinstance(text, str):
+                        for word in tokenize(text):
+                            self.words.setdefault(word, set()).add(position)
+
+    def search(
+        self,
+        *,
+        bbox: list[float] | None = None,
+        datetime: str | None = None,
+        q: list[str] | None = None,
+    ) -> list[str]:
+        """Returns the ids of matching collections, in their original order.
+
+        Every term in ``q`` is a separate alternative; a term matches a
+        collection if all of its words do.
+        """
+        candidates: set[int] | None = None
+        if q:
+            candidates = set()
+            for term in q:
+                words = tokenize(term)
+                if words:
+                    matches = set.intersection(
+                        *(self.words.get(word, set()) for word in words)
+                    )
+                    candidates |= matches
+        if bbox:
+            boxes = split_antimeridian(bbox)
+            spatial = {
+                position
+                for box in boxes
+                for cell in cells(box)
+                for position in self.grid.get(cell, ())
+                if any(
+                    intersects(box, collection_box)
+                    for collection_box in self.bboxes[position]
+                )
+            }
+            candidates = spatial if candidates is None else candidates & spatial
+        if datetime:
+            start, end = self.interval(datetime)
+            temporal = set()
+            for position in range(len(self.ids)) if candidates is None else candidates:
+                collection_start, collection_end = self.intervals[position]
+                if end and collection_start and collection_start > end:
+                    continue
+                if start and collection_end and collection_end < start:
+                    continue
+                temporal.add(position)
+            candidates = temporal
+        if candidates is None:
+            return list(self.ids)
+        return [self.ids[position] for position in sorted(candidates)]
+
+    @staticmethod
+    def interval(
+        value: str,
+    ) -> tuple[datetime.datetime | None, datetime.datetime | None]:
+        interval = str_to_interval(value)
+        if isinstance(interval, tuple):
+            return interval[0], interval[1]
+        return interval, interval
@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import Any
+
+from rustac import DuckdbClient
+
+from .settings import Settings
+
+DUCKDB_SETTINGS = {
+    "threads": "stac_fastapi_duckdb_threads",
+    "memory_limit": "stac_fastapi_duckdb_memory_limit",
+    "temp_directory": "stac_fastapi_duckdb_temp_directory",
+    "max_temp_directory_size": "stac_fastapi_duckdb_max_temp_directory_size",
+    "enable_external_file_cache": "stac_fastapi_duckdb_external_file_cache",
+    "parquet_metadata_cache": "stac_fastapi_duckdb_parquet_metadata_cache",
+    "enable_http_metadata_cache": "stac_fastapi_duckdb_http_metadata_cache",
+}
+"""DuckDB settings, and the :py:class:`Settings` fields they're taken from."""
+
+
+def create_client(settings: Settings) -> DuckdbClient:
+    """Creates a DuckDB client with the resource limits in ``settings``."""
+    if settings.stac_fastapi_duckdb_extension_directory:
+        client = DuckdbClient(
+            extension_directory=Path(settings.stac_fastapi_duckdb_extension_directory)
+        )
+    else:
+        client = DuckdbClient()
+    configure(client, settings)
+    return client
+
+
+def configure(client: DuckdbClient, settings: Settings) -> None:
+    """Applies the DuckDB settings that are set in ``settings`` to ``client``.
+
+    DuckDB's limits are for the whole connection, which every search shares,
+    rather than for each query.
+    """
+    for name, field in DUCKDB_SETTINGS.items():
+        if (value := getattr(settings, field)) is not None:
+            client.execute(f"SET {name} = {literal(value)}")
+
+
+def literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
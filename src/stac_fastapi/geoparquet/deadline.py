@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import TypeVar
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import Settings
+
+QUERY_TIMEOUT_HEADER = "X-Query-Timeout"
+"""Request header that overrides the default query deadline, in seconds."""
+
+CLIENT_CLOSED_REQUEST = 499
+"""Non-standard status code (borrowed from nginx) for a disconnected client."""
+
+POLL_SECONDS = 0.05
+"""How often a request waiting on a fetch checks if its client has gone away."""
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """A per-request deadline that can also be cancelled when the client goes away.
+
+    Checked by the search fan-out between collections, so abandoned or overdue
+    requests stop issuing new DuckDB queries.  rustac holds the GIL for the
+    whole of a DuckDB query and doesn't expose DuckDB's ``interrupt()``, so a
+    query can't be stopped once it's started, but range reads wait on their
+    fetches with :py:meth:`wait`.
+    """
+
+    def __init__(self, seconds: float | None = None) -> None:
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self.cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """Marks the request as abandoned by the client."""
+        self.cancelled.set()
+
+    def remaining(self) -> float | None:
+        """Returns the number of seconds left, or None if there's no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self) -> None:
+        """Raises if the client has disconnected or the deadline has passed."""
+        if self.cancelled.is_set():
+            raise HTTPException(CLIENT_CLOSED_REQUEST, "client disconnected")
+        if self.remaining() == 0:
+            raise HTTPException(504, "search did not complete before its deadline")
+
+    def wait(self, future: Future[T]) -> T:
+        """Returns the result of ``future``, raising as :py:meth:`check` would
+        as soon as the deadline passes or the client disconnects.
+
+        The work behind ``future`` isn't cancelled.
+        """
+        while True:
+            self.check()
+            remaining = self.remaining()
+            try:
+                return future.result(
+                    POLL_SECONDS if remaining is None else min(POLL_SECONDS, remaining)
+                )
+            except TimeoutError:
+                pass
+
+
+class DeadlineMiddleware:
+    """Attaches a :py:class:`Deadline` to every request as ``request.state.deadline``.
+
+    The deadline comes from ``stac_fastapi_query_timeout_seconds`` and can be
+    overridden per request with the ``X-Query-Timeout`` header, capped at
+    ``stac_fastapi_query_timeout_max_seconds``.  The middleware also reads the
+    ASGI receive channel on behalf of the app so that it notices an
+    ``http.disconnect`` while the search is still running.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Settings) -> None:
+        self.app = app
+        self.settings = settings
+
+    def timeout(self, headers: Headers) -> float | None:
+        timeout = self.settings.stac_fastapi_query_timeout_seconds
+        if value := headers.get(QUERY_TIMEOUT_HEADER):
+            timeout = float(value)
+            if timeout <= 0:
+                raise ValueError(f"must be positive: {value}")
+        if timeout is None:
+            return None
+        return min(timeout, self.settings.stac_fastapi_query_timeout_max_seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            timeout = self.timeout(Headers(scope=scope))
+        except ValueError as e:
+            response = JSONResponse(
+                {"detail": f"invalid {QUERY_TIMEOUT_HEADER} header: {e}"}, 400
+            )
+            await response(scope, receive, send)
+            return
+
+        deadline = Deadline(timeout)
+        scope.setdefault("state", {})["deadline"] = deadline
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+
+        async def listen() -> None:
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    deadline.cancel()
+                    return
+
+        async def receive_from_listener() -> Message:
+            return await messages.get()
+
+        listener = asyncio.create_task(listen())
+        try:
+            await self.app(scope, receive_from_listener, send)
+        finally:
+            listener.cancel()
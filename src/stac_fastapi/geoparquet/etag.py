@@ -0,0 +1,192 @@
+import datetime
+import email.utils
+import hashlib
+import json
+import logging
+import re
+from collections.abc import Collection, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+from starlette.requests import Request
+
+from .storage import from_href
+
+logger = logging.getLogger(__name__)
+
+HEAD_CONCURRENCY = 16
+"""The most hrefs whose versions are looked up at the same time."""
+
+COLLECTION_PATH = re.compile(r"^/collections/(?P<collection_id>[^/]+)(?P<rest>/.*)?$")
+
+
+class HrefVersion(NamedTuple):
+    """What an object store reports about the file behind an href.
+
+    It's looked up once per collections reload, and everything that depends
+    on whether a file changed (validators, materialized tables, admission
+    costs and range reads) uses the same lookup.
+    """
+
+    e_tag: str | None
+    last_modified: datetime.datetime | None
+    size: int | None = None
+
+
+class DataVersions(NamedTuple):
+    """The versions of everything responses are built from."""
+
+    collections: str
+    """A hash of the collections document."""
+
+    collections_modified: datetime.datetime
+    """When the collections document was last seen to change."""
+
+    hrefs: dict[str, HrefVersion]
+    """The version of each collection's geoparquet href."""
+
+
+def current_version(request: Request, href: str) -> HrefVersion | None:
+    """Returns the version of ``href`` as of the last collections reload.
+
+    Returns None if the href's version isn't known.
+    """
+    versions: DataVersions | None = getattr(request.app.state, "versions", None)
+    if versions is None or (version := versions.hrefs.get(href)) is None:
+        return None
+    if version.e_tag is None and version.last_modified is None:
+        return None
+    return version
+
+
+def collections_version(collections: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(collections, sort_keys=True).encode()).hexdigest()
+
+
+def href_versions(hrefs: Iterable[str]) -> dict[str, HrefVersion]:
+    """Looks up the version of every href, a few at a time.
+
+    Hrefs that can't be looked up get an empty version, and responses that
+    depend on them aren't given validators.
+    """
+
+    def head(href: str) -> HrefVersion:
+        try:
+            store, path = from_href(href)
+            meta = store.head(path)
+        except Exception:
+            logger.warning("Could not determine the version of %s", href)
+            return HrefVersion(None, None)
+        return HrefVersion(meta.get("e_tag"), meta.get("last_modified"), meta["size"])
+
+    hrefs = sorted(set(hrefs))
+    with ThreadPoolExecutor(max_workers=HEAD_CONCURRENCY) as executor:
+        return dict(zip(hrefs, executor.map(head, hrefs)))
+
+
+def data_versions(
+    collections: dict[str, Any],
+    hrefs: dict[str, str],
+    previous: DataVersions | None = None,
+) -> DataVersions:
+    version = collections_version(collections)
+    if previous is not None and previous.collections == version:
+        modified = previous.collections_modified
+    else:
+        modified = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+    return DataVersions(version, modified, href_versions(hrefs.values()))
+
+
+def touched_hrefs(
+    request: Request, collections: Collection[str], hrefs: dict[str, str]
+) -> list[str] | None:
+    """Returns the hrefs a response to ``request`` is built from.
+
+    Returns None for requests whose responses can't be validated, e.g. POST
+    requests, endpoints that don't only depend on the data, or paths under a
+    collection id that isn't in ``collections``, which are left to routing
+    to answer with a 404.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    path = request.url.path
+    root_path = request.scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    path = path.rstrip("/")
+    if path in ("", "/collections"):
+        return []
+    if path in ("/search", "/queryables") or path.startswith("/tiles/"):
+        if selected := request.query_params.get("collections"):
+            return [hrefs[c] for c in selected.split(",") if c in hrefs]
+        return list(hrefs.values())
+    if match := COLLECTION_PATH.match(path):
+        if match["collection_id"] not in collections:
+            return None
+        rest = match["rest"] or ""
+        if not rest:
+            return []
+        if rest in ("/items", "/queryables") or rest.startswith(("/items/", "/tiles/")):
+            href = hrefs.get(match["collection_id"])
+            return [href] if href else []
+    return None
+
+
+def etag(request: Request, versions: DataVersions, hrefs: list[str]) -> str | None:
+    """Returns a strong ETag for a response built from ``hrefs``.
+
+    The tag covers the request headers that change the response bytes (the
+    host, which links are built from, and content negotiation), so the same
+    tag always means the same body.
+    """
+    parts = [versions.collections]
+    for href in sorted(set(hrefs)):
+        version = versions.hrefs.get(href)
+        if version is None or (version.e_tag is None and version.last_modified is None):
+            return None
+        parts.append(f"{href}:{version.e_tag}:{version.last_modified}")
+    for header in ("host", "x-forwarded-host", "x-forwarded-proto", "forwarded"):
+        parts.append(request.headers.get(header, ""))
+    for header in ("accept", "accept-encoding"):
+        parts.append(request.headers.get(header, ""))
+    digest = hashlib.sha256("\n".join(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def last_modified(versions: DataVersions, hrefs: list[str]) -> str | None:
+    times = [versions.collections_modified]
+    for href in hrefs:
+        version = versions.hrefs.get(href)
+        if version is None or version.last_modified is None:
+            return None
+        times.append(version.last_modified)
+    return email.utils.format_datetime(max(times), usegmt=True)
+
+
+def matches(if_none_match: str, tag: str) -> bool:
+    """Checks an ``If-None-Match`` header with the weak comparison it calls for."""
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or tag in (c.removeprefix("W/") for c in candidates)
+
+
+def validators(
+    request: Request,
+    versions: DataVersions,
+    collections: Collection[str],
+    hrefs: dict[str, str],
+    cache_control: str | None,
+) -> dict[str, str]:
+    """Returns validator and caching headers for a response to ``request``.
+
+    Responses that can't be validated get no headers at all.
+    """
+    if (touched := touched_hrefs(request, collections, hrefs)) is None:
+        return {}
+    if (tag := etag(request, versions, touched)) is None:
+        return {}
+    headers = {"ETag": tag}
+    if modified := last_modified(versions, touched):
+        headers["Last-Modified"] = modified
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return headers
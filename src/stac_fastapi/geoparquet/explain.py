@@ -0,0 +1,213 @@
+import copy
+from typing import Any, cast
+
+import attr
+from fastapi import APIRouter, Depends, FastAPI
+from rustac import DuckdbClient
+from stac_fastapi.types.extension import ApiExtension
+from stac_fastapi.types.search import BaseSearchPostRequest
+from starlette.requests import Request
+
+from .admin import require_admin
+from .client import DEFAULT_LIMIT, Client
+from .collection_index import CollectionIndex
+from .deadline import Deadline
+from .intersects import PreparedIntersects, prepare
+from .materialize import MaterializedCollections, supported
+from .models import PostSearchRequestModel
+from .profiling import Profile
+from .rangeread import RangeReader, is_remote
+
+
+def row_groups(client: DuckdbClient, href: str) -> list[dict[str, Any]]:
+    """Returns the size and bbox and datetime statistics of each row group."""
+
+    def stat(column: str, kind: str, cast: str) -> str:
+        return (
+            f"max(CASE WHEN path_in_schema = '{column}' "
+            f"THEN TRY_CAST(stats_{kind}_value AS {cast}) END)"
+        )
+
+    return list(
+        client.query_to_table(
+            "SELECT row_group_id, any_value(row_group_num_rows) AS num_rows, "
+            "sum(total_compressed_size) AS bytes, "
+            f"{stat('bbox, xmin', 'min', 'DOUBLE')} AS xmin, "
+            f"{stat('bbox, ymin', 'min', 'DOUBLE')} AS ymin, "
+            f"{stat('bbox, xmax', 'max', 'DOUBLE')} AS xmax, "
+            f"{stat('bbox, ymax', 'max', 'DOUBLE')} AS ymax, "
+            f"{stat('datetime', 'min', 'TIMESTAMPTZ')} AS start, "
+            f"{stat('datetime', 'max', 'TIMESTAMPTZ')} AS end "
+            "FROM parquet_metadata(?) GROUP BY row_group_id ORDER BY row_group_id",
+            [href],
+        )
+        .to_struct_array()
+        .to_pylist()
+    )
+
+
+def matches_statistics(
+    group: dict[str, Any],
+    search: dict[str, Any],
+    prepared: PreparedIntersects | None = None,
+) -> bool:
+    """Returns False if a row group's statistics rule out every match of ``search``.
+
+    Only ``bbox``, the bounds of ``intersects`` and ``datetime`` are checked,
+    and row groups without statistics always match, so this is what pruning
+    could do at best.
+    """
+    for bbox in [search.get("bbox"), list(prepared.bbox) if prepared else None]:
+        if not bbox:
+            continue
+        if len(bbox) == 6:
+            bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+        xmin, ymin, xmax, ymax = bbox
+        if None not in (group["xmin"], group["ymin"], group["xmax"], group["ymax"]):
+            if xmin <= xmax and (group["xmin"] > xmax or group["xmax"] < xmin):
+                return False
+            if group["ymin"] > ymax or group["ymax"] < ymin:
+                return False
+    if datetime := search.get("datetime"):
+        start, end = CollectionIndex.interval(datetime)
+        if group["start"] is not None and end and group["start"] > end:
+            return False
+        if group["end"] is not None and start and group["end"] < start:
+            return False
+    return True
+
+
+def plan(node: dict[str, Any]) -> dict[str, Any]:
+    """Trims a node of DuckDB's JSON profile down to the EXPLAIN ANALYZE fields."""
+    return {
+        "operator": node.get("operator_name") or node.get("operator_type"),
+        "seconds": node.get("operator_timing"),
+        "rows": node.get("operator_cardinality"),
+        "rows_scanned": node.get("operator_rows_scanned"),
+        "info": node.get("extra_info") or {},
+        "children": [plan(child) for child in node.get("children", [])],
+    }
+
+
+@attr.s
+class ExplainExtension(ApiExtension):
+    """Explains how a search would run, instead of returning its items.
+
+    For each collection, the search runs with DuckDB's profiler on, and the
+    response reports the SQL that ran, the analyzed plan, how many rows and
+    bytes were read compared to the whole file, and how many row groups
+    survive the file's bbox and datetime statistics.  It's an admin endpoint
+    (see :py:func:`~stac_fastapi.geoparquet.admin.require_admin`).
+
+    DuckDB only profiles the last query, so when a remote href is searched
+    with range reads (one query per row group), the SQL, plan, rows and bytes
+    are those of the last row group searched, and ``range_reads`` is true.
+    """
+
+    client: Client = attr.ib(factory=Client)
+
+    def register(self, app: FastAPI) -> None:
+        router = APIRouter()
+        router.add_api_route(
+            name="Explain Search",
+            path="/search/explain",
+            endpoint=self.explain,
+            methods=["POST"],
+            dependencies=[Depends(require_admin)],
+        )
+        app.include_router(router, tags=["Item Search"])
+
+    def explain(
+        self,
+        request: Request,
+        search: PostSearchRequestModel,  # type: ignore[valid-type]
+    ) -> dict[str, Any]:
+        """Explains a ``POST /search`` body."""
+        client = cast(DuckdbClient, request.state.client)
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        deadline = cast(Deadline, request.state.deadline)
+        materialized = cast(MaterializedCollections, request.state.materialized)
+        reader = cast(RangeReader | None, request.state.range_reader)
+
+        search = cast(BaseSearchPostRequest, search)
+        collections = [c for c in search.collections or hrefs if c in hrefs]
+        search_dict = self.client.search_dict(search)
+        search_dict.pop("token", None)
+        search_dict.update(
+            {
+                "collections": [],
+                "limit": search_dict.get("limit", DEFAULT_LIMIT),
+                "offset": search_dict.get("offset", 0) or 0,
+            }
+        )
+        # Like ``/search``, the AOI is prepared once for every collection.
+        request.state.intersects = None
+        if intersects := search_dict.get("intersects"):
+            request.state.intersects = prepare(intersects)
+        explanations = []
+        for collection in collections:
+            deadline.check()
+            href = hrefs[collection]
+            profile = Profile()
+            # DuckDB profiles the last query, so free-text index builds
+            # and schema reads don't hide the search itself.
+            with profile.duckdb(client, href):
+                items = self.client.search_collection(
+                    request, collection, href, copy.deepcopy(search_dict)
+                )
+            is_materialized = collection in materialized.tables
+            explanation = self.explain_collection(
+                client,
+                collection,
+                href,
+                search_dict,
+                profile.queries[0],
+                len(items),
+                is_materialized,
+                request.state.intersects,
+            )
+            explanation["range_reads"] = (
+                reader is not None
+                and not is_materialized
+                and is_remote(href)
+                and supported({k: v for k, v in search_dict.items() if k != "q"})
+            )
+            explanations.append(explanation)
+        return {"search": search_dict, "collections": explanations}
+
+    def explain_collection(
+        self,
+        client: DuckdbClient,
+        collection: str,
+        href: str,
+        search_dict: dict[str, Any],
+        query: dict[str, Any],
+        returned: int,
+        is_materialized: bool,
+        prepared: PreparedIntersects | None = None,
+    ) -> dict[str, Any]:
+        profile = query["profile"] or {}
+        groups = row_groups(client, href)
+        return {
+            "collection": collection,
+            "href": href,
+            "materialized": is_materialized,
+            "sql": profile.get("query_name"),
+            "seconds": query["seconds"],
+            "returned": returned,
+            "rows": {
+                "scanned": profile.get("cumulative_rows_scanned"),
+                "total": sum(group["num_rows"] for group in groups),
+            },
+            "bytes": {
+                "read": profile.get("total_bytes_read"),
+                "total": sum(int(group["bytes"]) for group in groups),
+            },
+            "row_groups": {
+                "matching_statistics": sum(
+                    matches_statistics(group, search_dict, prepared) for group in groups
+                ),
+                "total": len(groups),
+            },
+            "plan": [plan(child) for child in profile.get("children", [])],
+        }
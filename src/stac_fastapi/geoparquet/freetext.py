@@ -0,0 +1,138 @@
+import logging
+import threading
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any
+
+from rustac import DuckdbClient
+
+from .collection_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ("title", "description", "keywords")
+"""Item fields that free-text queries search."""
+
+
+class TextIndex:
+    """An inverted index of the words in one href's :py:data:`TEXT_FIELDS`.
+
+    Items are identified by their position in the href, which for a single
+    file is its ``file_row_number``, so a query can be answered by reading
+    just the matching rows.
+    """
+
+    def __init__(
+        self, ids: list[str], texts: Iterable[Iterable[Any]], positional: bool
+    ) -> None:
+        self.ids = ids
+        """The item ids, by position."""
+
+        self.positional = positional
+        """Whether positions are row numbers in the href, i.e. it's one file."""
+
+        self.words: dict[str, set[int]] = {}
+        for position, values in enumerate(texts):
+            for value in values:
+                for text in value if isinstance(value, list) else [value]:
+                    if isinstance(text, str):
+                        for word in tokenize(text):
+                            self.words.setdefault(word, set()).add(position)
+
+    def search(self, q: list[str], ids: list[str] | None = None) -> list[int]:
+        """Returns the positions of matching items, in order.
+
+        Every term in ``q`` is a separate alternative; a term matches an item
+        if all of its words do.  Matches can be narrowed to ``ids``.
+        """
+        positions: set[int] = set()
+        for term in q:
+            if words := tokenize(term):
+                positions |= set.intersection(
+                    *(self.words.get(word, set()) for word in words)
+                )
+        if ids is not None:
+            wanted = set(ids)
+            positions = {p for p in positions if self.ids[p] in wanted}
+        return sorted(positions)
+
+
+def build(client: DuckdbClient, href: str, columns: dict[str, str]) -> TextIndex:
+    """Reads the id and text columns of ``href`` into a :py:class:`TextIndex`."""
+    fields = [field for field in TEXT_FIELDS if field in columns]
+    select = "".join(f', "{field}"' for field in fields)
+    table = client.query_to_table(
+        f"SELECT filename, id{select} FROM read_parquet(?, hive_partitioning=false, "
+        "filename=true, file_row_number=true) ORDER BY filename, file_row_number",
+        [href],
+    )
+    rows = table.to_struct_array().to_pylist()
+    return TextIndex(
+        ids=[row["id"] for row in rows],
+        texts=([row[field] for field in fields] for row in rows),
+        positional=len({row["filename"] for row in rows}) <= 1,
+    )
+
+
+class TextIndexes:
+    """The :py:class:`TextIndex` of each href, kept until the href changes.
+
+    An index is built the first time an href is searched with ``q``, and is
+    cached by the version of the href it was built from, like
+    :py:class:`~stac_fastapi.geoparquet.schema.HrefSchemas`.
+    """
+
+    def __init__(self) -> None:
+        self.indexes: dict[str, tuple[Hashable, TextIndex]] = {}
+        self.lock = threading.Lock()
+        self.building: dict[str, threading.Lock] = {}
+
+    def index(
+        self,
+        client: DuckdbClient,
+        href: str,
+        version: Hashable | None,
+        columns: dict[str, str],
+    ) -> TextIndex:
+        """Returns the index of ``href``, building it if it's missing or stale."""
+        with self.lock:
+            building = self.building.setdefault(href, threading.Lock())
+        # Concurrent searches of the same href wait for one build.
+        with building:
+            with self.lock:
+                cached = self.indexes.get(href)
+            if version is not None and cached is not None and cached[0] == version:
+                return cached[1]
+            index = build(client, href, columns)
+            if version is not None:
+                with self.lock:
+                    self.indexes[href] = (version, index)
+            return index
+
+    def refresh(
+        self,
+        client: DuckdbClient,
+        versions: dict[str, Hashable],
+        columns: Callable[[str, Hashable], dict[str, str]],
+    ) -> None:
+        """Rebuilds indexes whose hrefs changed, so searches don't wait for them."""
+        with self.lock:
+            stale = [
+                href
+                for href, (version, _) in self.indexes.items()
+                if href in versions and versions[href] != version
+            ]
+        for href in stale:
+            try:
+                self.index(client, href, versions[href], columns(href, versions[href]))
+            except Exception:
+                logger.exception("Failed to rebuild the text index of %s", href)
+
+    def forget(self, hrefs: set[str]) -> None:
+        """Drops the indexes of hrefs that are no longer served."""
+        with self.lock:
+            self.indexes = {
+                href: index for href, index in self.indexes.items() if href in hrefs
+            }
+            self.building = {
+                href: lock for href, lock in self.building.items() if href in hrefs
+            }
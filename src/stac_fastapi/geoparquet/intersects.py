@@ -0,0 +1,70 @@
+import json
+from collections.abc import Collection, Iterator
+from typing import Any, NamedTuple
+
+
+class PreparedIntersects(NamedTuple):
+    """An ``intersects`` geometry, prepared once for every collection searched."""
+
+    geojson: str
+    """The geometry, serialized once."""
+
+    bbox: tuple[float, float, float, float]
+    """The geometry's bounds, for the cheap first pass."""
+
+
+def prepare(intersects: dict[str, Any] | str) -> PreparedIntersects:
+    """Serializes a geometry and computes its bounds."""
+    geometry = json.loads(intersects) if isinstance(intersects, str) else intersects
+    positions = list(_positions(geometry))
+    if not positions:
+        raise ValueError("intersects geometry has no coordinates")
+    xs = [position[0] for position in positions]
+    ys = [position[1] for position in positions]
+    return PreparedIntersects(
+        geojson=json.dumps(geometry, separators=(",", ":")),
+        bbox=(min(xs), min(ys), max(xs), max(ys)),
+    )
+
+
+def _positions(geometry: dict[str, Any]) -> Iterator[list[float]]:
+    if geometry.get("type") == "GeometryCollection":
+        for child in geometry.get("geometries", []):
+            yield from _positions(child)
+        return
+    stack = [geometry.get("coordinates", [])]
+    while stack:
+        value = stack.pop()
+        if value and isinstance(value[0], int | float):
+            yield value
+        else:
+            stack.extend(value)
+
+
+def intersects_predicates(
+    prepared: PreparedIntersects, columns: Collection[str]
+) -> tuple[list[str], list[str]]:
+    """Returns predicates for ``intersects``, cheapest first.
+
+    Items whose ``bbox`` doesn't overlap the AOI's bounds are ruled out by
+    plain column comparisons, which DuckDB pushes into the parquet scan, so
+    row groups are skipped by their statistics and the geometry column is
+    only read and decoded for rows that survive.  Only those are checked
+    against the AOI itself.
+    """
+    where: list[str] = []
+    params: list[str] = []
+    if "bbox" in columns:
+        xmin, ymin, xmax, ymax = prepared.bbox
+        where.extend(
+            [
+                "bbox.xmin <= ?::DOUBLE",
+                "bbox.xmax >= ?::DOUBLE",
+                "bbox.ymin <= ?::DOUBLE",
+                "bbox.ymax >= ?::DOUBLE",
+            ]
+        )
+        params.extend(str(v) for v in (xmax, xmin, ymax, ymin))
+    where.append("ST_Intersects(geometry, ST_GeomFromGeoJSON(?::VARCHAR))")
+    params.append(prepared.geojson)
+    return where, params
@@ -0,0 +1,333 @@
+import itertools
+import logging
+import threading
+from collections.abc import Collection
+from typing import Any, NamedTuple
+
+import rustac
+from arro3.core import DataType, Table
+from rustac import DuckdbClient
+
+from .etag import HrefVersion
+from .intersects import PreparedIntersects, intersects_predicates, prepare
+
+logger = logging.getLogger(__name__)
+
+ROW_COLUMN = "__stac_fastapi_row"
+"""Column that keeps the file's row order, so paging matches the parquet href."""
+
+SUPPORTED_KEYS = {
+    "bbox",
+    "collections",
+    "datetime",
+    "exclude",
+    "filter-lang",
+    "ids",
+    "include",
+    "intersects",
+    "limit",
+    "offset",
+}
+"""Search parameters that can be answered from a materialized table.
+
+Anything else (e.g. ``filter`` or ``sortby``) falls back to the parquet href.
+"""
+
+
+class MaterializedTable(NamedTuple):
+    """An in-memory DuckDB table holding all of a collection's items."""
+
+    name: str
+    """The table name."""
+
+    href: str
+    """The href the table was loaded from."""
+
+    version: HrefVersion | None
+    """The version of the href when it was loaded."""
+
+    columns: frozenset[str]
+    """The table's column names."""
+
+
+class MaterializedCollections:
+    """Collections that are loaded into memory and served from DuckDB tables.
+
+    Each table has an R-tree index on ``geometry`` and ART indexes on ``id``
+    and ``datetime``.  Tables are swapped in one collection at a time, and
+    replaced tables are only dropped on the next refresh so that searches that
+    already picked up the old table can finish.
+    """
+
+    def __init__(self) -> None:
+        self.tables: dict[str, MaterializedTable] = {}
+        self.retired: list[str] = []
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def refresh(
+        self,
+        client: DuckdbClient,
+        hrefs: dict[str, str],
+        collection_ids: set[str],
+        versions: dict[str, HrefVersion],
+    ) -> None:
+        """Loads new or changed collections and forgets about removed ones.
+
+        A collection is reloaded if its href or the href's version in
+        ``versions`` (see :py:func:`~stac_fastapi.geoparquet.etag.href_versions`)
+        changed.
+        """
+        with self.lock:
+            for name in self.retired:
+                client.execute(f"DROP TABLE IF EXISTS {name}")
+            self.retired = []
+
+            for collection_id, table in list(self.tables.items()):
+                if collection_id not in collection_ids or collection_id not in hrefs:
+                    self.tables = {
+                        k: v for k, v in self.tables.items() if k != collection_id
+                    }
+                    self.retired.append(table.name)
+
+            for collection_id in sorted(collection_ids):
+                if (href := hrefs.get(collection_id)) is None:
+                    logger.warning(
+                        "Cannot materialize %s: it has no geoparquet href",
+                        collection_id,
+                    )
+                    continue
+                version = versions.get(href)
+                current = self.tables.get(collection_id)
+                if current and current.href == href and current.version == version:
+                    continue
+                try:
+                    table = self.load(client, href, version)
+                except Exception:
+                    logger.exception("Failed to materialize %s", collection_id)
+                    continue
+                self.tables = {**self.tables, collection_id: table}
+                if current:
+                    self.retired.append(current.name)
+                logger.info("Materialized %s into %s", collection_id, table.name)
+
+    def load(
+        self, client: DuckdbClient, href: str, version: HrefVersion | None
+    ) -> MaterializedTable:
+        """Creates and indexes a new table from the parquet file at ``href``."""
+        name = f"materialized_{next(self.counter)}"
+        client.execute(
+            f"CREATE TABLE {name} AS SELECT *, row_number() OVER () AS {ROW_COLUMN} "
+            "FROM read_parquet(?)",
+            [href],
+        )
+        columns = frozenset(
+            client.query_to_table(f"SELECT column_name FROM (DESCRIBE {name})", [])
+            .column(0)
+            .to_pylist()
+        )
+        if "geometry" in columns:
+            client.execute(
+                f"CREATE INDEX {name}_geometry ON {name} USING RTREE (geometry)"
+            )
+        for column in ("id", "datetime"):
+            if column in columns:
+                client.execute(f"CREATE INDEX {name}_{column} ON {name} ({column})")
+        return MaterializedTable(name=name, href=href, version=version, columns=columns)
+
+    def search(
+        self,
+        client: DuckdbClient,
+        collection_id: str,
+        search: dict[str, Any],
+        prepared: PreparedIntersects | None = None,
+    ) -> list[dict[str, Any]] | None:
+        """Searches a materialized collection.
+
+        Returns None if the collection isn't materialized or the search uses
+        parameters that the table path doesn't support.
+        """
+        if (table := self.tables.get(collection_id)) is None:
+            return None
+        if query := table_query(table.name, search, table.columns, prepared):
+            sql, params = query
+            return to_items(client.query_to_table(sql, params))
+        return None
+
+
+def to_items(table: Table) -> list[dict[str, Any]]:
+    """Converts the result of a SQL search into items like ``DuckdbClient.search``.
+
+    :py:func:`rustac.from_arrow` renders them a little differently: it writes
+    timestamps with ``Z`` instead of ``+00:00``, adds a ``type`` even if the
+    table has none, keeps a null ``datetime`` and returns ``bbox`` as a tuple,
+    so the same search would return different JSON depending on its path.
+    """
+    schema = table.schema
+    names = set(schema.names)
+    timestamps = [
+        name for name in names if DataType.is_timestamp(schema.field(name).type)
+    ]
+    items = list(rustac.from_arrow(table)["features"])
+    for item in items:
+        if "type" not in names:
+            item.pop("type", None)
+        if (bbox := item.get("bbox")) is not None:
+            item["bbox"] = list(bbox)
+        properties = item.get("properties", {})
+        if properties.get("datetime", False) is None:
+            del properties["datetime"]
+        for name in timestamps:
+            value = properties.get(name)
+            if isinstance(value, str) and value.endswith("Z"):
+                properties[name] = value[:-1] + "+00:00"
+    return items
+
+
+def supported(search: dict[str, Any]) -> bool:
+    """Returns True if ``search`` can be answered with :py:func:`predicates`."""
+    for key, value in search.items():
+        if value and key not in SUPPORTED_KEYS:
+            return False
+    return not (
+        search.get("collections") or search.get("include") or search.get("exclude")
+    )
+
+
+def table_query(
+    table: str,
+    search: dict[str, Any],
+    columns: Collection[str],
+    prepared: PreparedIntersects | None = None,
+) -> tuple[str, list[str]] | None:
+    """Builds SQL for ``search`` against a materialized table.
+
+    Returns None for searches that can't be expressed here.
+    """
+    if not supported(search):
+        return None
+
+    where, params = predicates(search, columns, prepared)
+    sql = f"SELECT * EXCLUDE ({ROW_COLUMN}) REPLACE (ST_AsWKB(geometry) AS geometry) "
+    sql += f"FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {ROW_COLUMN}"
+    if (limit := search.get("limit")) is not None:
+        sql += f" LIMIT {int(limit)}"
+    if offset := search.get("offset"):
+        sql += f" OFFSET {int(offset)}"
+    return sql, params
+
+
+def href_query(
+    href: str,
+    search: dict[str, Any],
+    columns: Collection[str],
+    prepared: PreparedIntersects | None = None,
+    rows: list[int] | None = None,
+    row_range: tuple[int, int] | None = None,
+) -> tuple[str, list[str]] | None:
+    """Builds SQL for ``search`` against a parquet href, like rustac would.
+
+    ``rows`` limits the search to those row numbers, and ``row_range`` to the
+    ``[start, end)`` row numbers of e.g. one row group, which DuckDB uses to
+    skip the rest of the file.  Returns None for searches that can't be
+    expressed here.
+    """
+    if not supported(search):
+        return None
+    where, params = predicates(search, columns, prepared)
+    if rows is None and row_range is None:
+        sql = (
+            "SELECT * REPLACE (ST_AsWKB(geometry) AS geometry) "
+            "FROM read_parquet(?, hive_partitioning=false)"
+        )
+    else:
+        sql = (
+            "SELECT * EXCLUDE (file_row_number) "
+            "REPLACE (ST_AsWKB(geometry) AS geometry) "
+            "FROM read_parquet(?, hive_partitioning=false, file_row_number=true)"
+        )
+        if rows is not None:
+            where.insert(0, "file_row_number IN ({})".format(",".join(map(str, rows))))
+        if row_range is not None:
+            start, end = (int(row) for row in row_range)
+            where.insert(0, f"file_row_number BETWEEN {start} AND {end - 1}")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if (limit := search.get("limit")) is not None:
+        sql += f" LIMIT {int(limit)}"
+    if offset := search.get("offset"):
+        sql += f" OFFSET {int(offset)}"
+    return sql, [href, *params]
+
+
+def search_href(
+    client: DuckdbClient,
+    href: str,
+    search: dict[str, Any],
+    columns: Collection[str],
+    prepared: PreparedIntersects | None = None,
+    rows: list[int] | None = None,
+    row_range: tuple[int, int] | None = None,
+) -> list[dict[str, Any]] | None:
+    """Searches a parquet href with :py:func:`href_query`.
+
+    Returns None if the search has to go through rustac instead.
+    """
+    query = href_query(href, search, columns, prepared, rows, row_range)
+    if query is None:
+        return None
+    sql, params = query
+    return to_items(client.query_to_table(sql, params))
+
+
+def predicates(
+    search: dict[str, Any],
+    columns: Collection[str],
+    prepared: PreparedIntersects | None = None,
+) -> tuple[list[str], list[str]]:
+    """Returns SQL predicates and parameters for ids, bbox, intersects and datetime.
+
+    These mirror the predicates rustac generates for parquet hrefs, including
+    matching items by ``start_datetime`` and ``end_datetime`` when the source
+    has those ``columns``.  ``intersects`` is checked in two phases (see
+    :py:func:`intersects_predicates`), with ``prepared`` saving every
+    collection of a search from preparing the same geometry again.
+    """
+    where: list[str] = []
+    params: list[str] = []
+    if ids := search.get("ids"):
+        where.append("id IN ({})".format(",".join("?" * len(ids))))
+        params.extend(ids)
+    if bbox := search.get("bbox"):
+        if len(bbox) == 6:
+            bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+        where.append(
+            "ST_Intersects(geometry, ST_MakeEnvelope("
+            "?::DOUBLE, ?::DOUBLE, ?::DOUBLE, ?::DOUBLE))"
+        )
+        params.extend(str(float(v)) for v in bbox)
+    if intersects := search.get("intersects"):
+        if prepared is None:
+            prepared = prepare(intersects)
+        intersects_where, intersects_params = intersects_predicates(prepared, columns)
+        where.extend(intersects_where)
+        params.extend(intersects_params)
+    if datetime := search.get("datetime"):
+        start, separator, end = datetime.partition("/")
+        if not separator:
+            end = start
+        item_start = item_end = "datetime"
+        if "start_datetime" in columns:
+            item_start = "coalesce(start_datetime, datetime)"
+        if "end_datetime" in columns:
+            item_end = "coalesce(end_datetime, datetime)"
+        if start not in ("", ".."):
+            where.append(f"?::TIMESTAMPTZ <= {item_end}")
+            params.append(start)
+        if end not in ("", ".."):
+            where.append(f"?::TIMESTAMPTZ >= {item_start}")
+            params.append(end)
+    return where, params
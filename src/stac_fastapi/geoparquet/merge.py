@@ -0,0 +1,115 @@
+import base64
+import binascii
+import functools
+import heapq
+import itertools
+import json
+from collections.abc import Iterator
+from typing import Any
+
+from fastapi import HTTPException
+
+TOP_LEVEL_FIELDS = {"id", "collection", "bbox", "geometry"}
+"""Sort fields that live at the top level of an item rather than in properties."""
+
+
+def sort_fields(sortby: list[Any]) -> list[tuple[str, bool]]:
+    """Normalizes GET (``-datetime``) and POST (``{"field": ...}``) sortby values.
+
+    Returns a list of ``(field, descending)`` pairs.
+    """
+    fields = []
+    for sort in sortby:
+        if isinstance(sort, str):
+            descending = sort.startswith("-")
+            field = sort.lstrip("+-")
+        else:
+            descending = str(sort.get("direction", "asc")).lower() == "desc"
+            field = sort["field"]
+        fields.append((field, descending))
+    return fields
+
+
+def tiebroken(sortby: list[Any]) -> list[Any]:
+    """Returns ``sortby`` with ascending ``id`` appended, unless it sorts by id.
+
+    DuckDB returns tied rows in a different order from one query to the
+    next, so without a unique last key, positions into a sorted collection
+    skip some items and repeat others.
+    """
+    if any(field == "id" for field, _ in sort_fields(sortby)):
+        return sortby
+    if all(isinstance(sort, str) for sort in sortby):
+        return [*sortby, "id"]
+    return [*sortby, {"field": "id", "direction": "asc"}]
+
+
+def sort_value(item: dict[str, Any], field: str) -> Any:
+    """Returns the value of ``field`` for ``item``, or None if it isn't set."""
+    if field.startswith("properties."):
+        return item.get("properties", {}).get(field.removeprefix("properties."))
+    if field in TOP_LEVEL_FIELDS:
+        return item.get(field)
+    return item.get("properties", {}).get(field, item.get(field))
+
+
+def compare(a: Any, b: Any) -> int:
+    """Compares two sort values, putting nulls last like DuckDB does."""
+    if a is None or b is None:
+        return (a is None) - (b is None)
+    try:
+        return int(a > b) - int(a < b)
+    except TypeError:
+        return (str(a) > str(b)) - (str(a) < str(b))
+
+
+def item_key(fields: list[tuple[str, bool]]) -> Any:
+    def cmp(a: dict[str, Any], b: dict[str, Any]) -> int:
+        for field, descending in fields:
+            value_a, value_b = sort_value(a, field), sort_value(b, field)
+            if value_a is None or value_b is None:
+                result = compare(value_a, value_b)
+            else:
+                result = compare(value_a, value_b) * (-1 if descending else 1)
+            if result:
+                return result
+        return 0
+
+    return functools.cmp_to_key(cmp)
+
+
+def merge(
+    pages: dict[str, list[dict[str, Any]]], sortby: list[Any]
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """K-way merges per-collection pages that are each already sorted by ``sortby``.
+
+    Pages are sorted, and merged, by :py:func:`tiebroken` ``sortby``.  Yields
+    ``(collection, item)`` pairs.  Ties keep the order of ``pages``.
+    """
+    key = item_key(sort_fields(tiebroken(sortby)))
+    return heapq.merge(
+        *(
+            zip(itertools.repeat(collection), items)
+            for collection, items in pages.items()
+        ),
+        key=lambda pair: key(pair[1]),
+    )
+
+
+def encode_token(positions: dict[str, int]) -> str:
+    """Encodes per-collection positions into an opaque pagination token."""
+    return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+
+def decode_token(token: str) -> dict[str, int]:
+    """Decodes a pagination token created by :py:func:`encode_token`."""
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(400, f"invalid token: {token}")
+    if not isinstance(positions, dict) or not all(
+        isinstance(key, str) and isinstance(value, int) and value >= 0
+        for key, value in positions.items()
+    ):
+        raise HTTPException(400, f"invalid token: {token}")
+    return positions
@@ -1,18 +1,34 @@
 import stac_fastapi.api.models
 from stac_fastapi.api.models import ItemCollectionUri
+from stac_fastapi.extensions.core.collection_search import CollectionSearchExtension
 from stac_fastapi.extensions.core.fields import FieldsExtension
 from stac_fastapi.extensions.core.filter import SearchFilterExtension
-from stac_fastapi.extensions.core.pagination import OffsetPaginationExtension
+from stac_fastapi.extensions.core.free_text import (
+    FreeTextConformanceClasses,
+    FreeTextExtension,
+)
+from stac_fastapi.extensions.core.pagination import (
+    OffsetPaginationExtension,
+    TokenPaginationExtension,
+)
 from stac_fastapi.extensions.core.sort import SortExtension
 from stac_fastapi.types.search import BaseSearchPostRequest
 
+from .queryables import FiltersClient
 from .search import FixedSearchGetRequest
 
 EXTENSIONS = [
     OffsetPaginationExtension(),
-    SearchFilterExtension(),
+    TokenPaginationExtension(),
+    SearchFilterExtension(client=FiltersClient()),
     FieldsExtension(),
     SortExtension(),
+    FreeTextExtension(
+        conformance_classes=[
+            FreeTextConformanceClasses.SEARCH,
+            FreeTextConformanceClasses.ITEMS,
+        ]
+    ),
 ]
 
 GetSearchRequestModel = stac_fastapi.api.models.create_get_request_model(
@@ -24,3 +40,10 @@ PostSearchRequestModel = stac_fastapi.api.models.create_post_request_model(
 ItemsGetRequestModel = stac_fastapi.api.models.create_get_request_model(
     base_model=ItemCollectionUri, extensions=EXTENSIONS
 )
+
+COLLECTION_SEARCH_EXTENSION = CollectionSearchExtension.from_extensions(
+    [
+        FreeTextExtension(conformance_classes=[FreeTextConformanceClasses.COLLECTIONS]),
+        OffsetPaginationExtension(),
+    ]
+)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .admission import AdmissionController, replay
+from .deadline import QUERY_TIMEOUT_HEADER
+from .etag import DataVersions
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_HEADER = "X-Prefetch"
+"""Response header that is ``hit`` when a page was served from the prefetch cache."""
+
+PAGED_PATHS = ("/search", "/items")
+"""Suffixes of the paths whose responses have next links."""
+
+
+class PrefetchedPage(NamedTuple):
+    """A response that was computed before it was asked for."""
+
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    expires_at: float
+    versions: DataVersions | None
+    """The data versions the page was computed with."""
+
+    next_link: dict[str, Any] | None
+    """The page's own next link, to prefetch once the page is served."""
+
+
+def cache_key(method: str, host: str, path: str, query: str, body: bytes) -> str:
+    """Identifies a page request, ignoring how its JSON body is formatted."""
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode()
+        except ValueError:
+            pass
+    return "\n".join((method, host, path, query, body.decode(errors="replace")))
+
+
+class PrefetchCache:
+    """A small, short-lived cache of prefetched pages.
+
+    Pages are served at most once, and are dropped once they expire or the
+    data they were computed from changes.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.pages: OrderedDict[str, PrefetchedPage] = OrderedDict()
+        self.pending: set[str] = set()
+        self.lock = threading.Lock()
+
+    def take(self, key: str, versions: DataVersions | None) -> PrefetchedPage | None:
+        with self.lock:
+            page = self.pages.pop(key, None)
+        if page is None or page.expires_at < time.monotonic():
+            return None
+        if page.versions != versions:
+            return None
+        return page
+
+    def start(self, key: str) -> bool:
+        """Claims a key for prefetching, unless it's cached or being fetched."""
+        with self.lock:
+            if key in self.pending or key in self.pages:
+                return False
+            self.pending.add(key)
+            return True
+
+    def finish(self, key: str, page: PrefetchedPage | None) -> None:
+        with self.lock:
+            self.pending.discard(key)
+            if page is not None:
+                self.pages[key] = page
+                while len(self.pages) > self.size:
+                    self.pages.popitem(last=False)
+
+
+class PrefetchMiddleware:
+    """Computes the next page of a paginated search after serving a page.
+
+    When a response has a ``next`` link, the request is replayed through the
+    app for that link once the response has been sent, with a deadline of
+    ``stac_fastapi_prefetch_timeout_seconds``.  A successful page is kept for
+    ``stac_fastapi_prefetch_ttl_seconds``, so a harvester that follows the
+    link gets it without waiting.  Prefetching is skipped while searches are
+    queueing or the server is otherwise busy.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Settings) -> None:
+        self.app = app
+        self.settings = settings
+        self.cache = PrefetchCache(settings.stac_fastapi_prefetch_cache_size)
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].endswith(PAGED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        if scope["method"] == "POST":
+            # The body is part of the key, so it's read up front and replayed.
+            more_body = True
+            while more_body:
+                message = await receive()
+                body += message.get("body", b"")
+                more_body = message.get("more_body", False)
+            receive = replay(body, receive)
+
+        headers = Headers(scope=scope)
+        host = headers.get("host", "")
+        query = scope.get("query_string", b"").decode()
+        key = cache_key(scope["method"], host, scope["path"], query, body)
+        versions: DataVersions | None = getattr(scope["app"].state, "versions", None)
+        # The app adds to the scope as it routes the request, so prefetches
+        # start from a copy of it as it was received.
+        received = {
+            **scope,
+            "state": {
+                k: v
+                for k, v in scope.get("state", {}).items()
+                if k not in ("profile", "stream")
+            },
+        }
+        if (page := self.cache.take(key, versions)) is not None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": page.status,
+                    "headers": [
+                        *page.headers,
+                        (PREFETCH_HEADER.lower().encode(), b"hit"),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": page.body})
+            next_link = page.next_link
+        else:
+            await self.app(scope, receive, send)
+            next_link = scope.get("state", {}).get("next_link")
+
+        admission: AdmissionController | None = getattr(
+            scope["app"].state, "admission", None
+        )
+        if not next_link or admission is None or admission.busy():
+            return
+        # The response has been sent; the prefetch runs on its own so that the
+        # connection is free for the request that will want it.
+        task = asyncio.create_task(self.prefetch(received, host, next_link, versions))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def prefetch(
+        self,
+        scope: Scope,
+        host: str,
+        link: dict[str, Any],
+        versions: DataVersions | None,
+    ) -> None:
+        url = urllib.parse.urlsplit(link["href"])
+        method = link.get("method", "GET")
+        body = json.dumps(link["body"]).encode() if "body" in link else b""
+        key = cache_key(method, host, url.path, url.query, body)
+        if not self.cache.start(key):
+            return
+
+        timeout = self.settings.stac_fastapi_prefetch_timeout_seconds
+        headers = [
+            (name, value)
+            for name, value in scope["headers"]
+            if name not in (b"content-length", b"if-none-match", b"x-profile")
+        ]
+        headers.append((QUERY_TIMEOUT_HEADER.lower().encode(), str(timeout).encode()))
+        if body:
+            headers.append((b"content-length", str(len(body)).encode()))
+        prefetch_scope = {
+            **scope,
+            "method": method,
+            "path": url.path,
+            "raw_path": url.path.encode(),
+            "query_string": url.query.encode(),
+            "headers": headers,
+            "state": dict(scope["state"]),
+        }
+        status = 0
+        response_headers: list[tuple[bytes, bytes]] = []
+        chunks: list[bytes] = []
+
+        async def capture(message: Message) -> None:
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        page = None
+        try:
+            await asyncio.wait_for(
+                self.app(prefetch_scope, replay(body, None), capture), timeout
+            )
+            if status == 200:
+                page = PrefetchedPage(
+                    status,
+                    response_headers,
+                    b"".join(chunks),
+                    time.monotonic() + self.settings.stac_fastapi_prefetch_ttl_seconds,
+                    versions,
+                    prefetch_scope["state"].get("next_link"),
+                )
+        except Exception:
+            logger.debug("Prefetch of %s failed", link["href"], exc_info=True)
+        finally:
+            self.cache.finish(key, page)
@@ -0,0 +1,202 @@
+import datetime
+import hmac
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from rustac import DuckdbClient
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+"""Request header that must carry the profiling secret to profile a request."""
+
+PROFILE_LOCATION_HEADER = "X-Profile-Location"
+"""Response header with the path a profile was written to."""
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+"""How often the Python stack of a profiled search is sampled."""
+
+
+class Profile:
+    """Python stack samples and DuckDB query profiles for one request."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stacks: Counter[str] = Counter()
+        self.queries: list[dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def sample(self) -> Iterator[None]:
+        """Samples the calling thread's stack until the context exits.
+
+        Stacks are counted in the collapsed ``outer;inner`` format that flame
+        graph tools read.
+        """
+        thread_id = threading.get_ident()
+        stop = threading.Event()
+
+        def run() -> None:
+            while not stop.wait(SAMPLE_INTERVAL_SECONDS):
+                frame = sys._current_frames().get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(
+                        f"{code.co_qualname} ({code.co_filename}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                with self.lock:
+                    self.stacks[";".join(reversed(names))] += 1
+
+        sampler = threading.Thread(
+            target=run, name="stac-fastapi-profiler", daemon=True
+        )
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+
+    @contextmanager
+    def duckdb(self, client: DuckdbClient, href: str) -> Iterator[None]:
+        """Captures DuckDB's JSON profile of the query run inside the context.
+
+        Profiling is a setting of the whole connection, so queries from other
+        requests that run at the same moment can end up in (or overwrite) the
+        profile.  That's acceptable for a debugging aid that's off by default.
+        """
+        fd, path = tempfile.mkstemp(prefix="stac-fastapi-duckdb-", suffix=".json")
+        os.close(fd)
+        started = time.perf_counter()
+        client.execute("PRAGMA enable_profiling='json'", [])
+        client.execute(f"PRAGMA profiling_output='{path}'", [])
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            client.execute("PRAGMA disable_profiling", [])
+            try:
+                profile = json.loads(Path(path).read_text() or "null")
+            except ValueError:
+                profile = None
+            Path(path).unlink(missing_ok=True)
+            with self.lock:
+                self.queries.append(
+                    {"href": href, "seconds": seconds, "profile": profile}
+                )
+
+    def to_dict(self, scope: Scope, status: int | None) -> dict[str, Any]:
+        return {
+            "request": {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope.get("query_string", b"").decode(),
+            },
+            "status": status,
+            "seconds": time.perf_counter() - self.started,
+            "sample_interval_seconds": SAMPLE_INTERVAL_SECONDS,
+            "stacks": dict(self.stacks.most_common()),
+            "duckdb": self.queries,
+        }
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry the profiling secret in ``X-Profile``.
+
+    The profile replaces the response body as a JSON attachment, or, if
+    ``stac_fastapi_profiling_directory`` is set, is written there and the
+    normal response gets an ``X-Profile-Location`` header.  Requests without
+    the header only pay for a header lookup.
+    """
+
+    def __init__(self, app: ASGIApp, settings: Settings) -> None:
+        self.app = app
+        self.settings = settings
+
+    def authorized(self, scope: Scope) -> bool:
+        secret = self.settings.stac_fastapi_profiling_secret
+        if secret is None or not (value := Headers(scope=scope).get(PROFILE_HEADER)):
+            return False
+        return hmac.compare_digest(value.encode(), secret.get_secret_value().encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile()
+        state = scope.setdefault("state", {})
+        state["profile"] = profile
+        directory = self.settings.stac_fastapi_profiling_directory
+        path = None if directory is None else self.path(directory)
+        if path is None:
+            # The body is replaced by the profile, so it isn't worth streaming.
+            state["stream"] = False
+        status: int | None = None
+
+        async def send_with_profile(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if path is None:
+                    return  # sent with the profile once the body is done
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (PROFILE_LOCATION_HEADER.lower().encode(), str(path).encode()),
+                    ],
+                }
+            elif path is not None:
+                if not message.get("more_body"):
+                    # A streamed search runs while its body is sent, so the
+                    # profile is only finished with the last of it.
+                    self.write(path, profile.to_dict(scope, status))
+            elif message.get("more_body"):
+                return
+            else:
+                body = json.dumps(profile.to_dict(scope, status)).encode()
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 200,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (
+                                b"content-disposition",
+                                b'attachment; filename="profile.json"',
+                            ),
+                        ],
+                    }
+                )
+                message = {"type": "http.response.body", "body": body}
+            await send(message)
+
+        await self.app(scope, receive, send_with_profile)
+
+    def path(self, directory: str) -> Path:
+        now = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S")
+        return Path(directory) / f"profile-{now}-{uuid.uuid4().hex[:8]}.json"
+
+    def write(self, path: Path, profile: dict[str, Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(profile))
+        logger.info("Wrote profile of %s to %s", profile["request"]["path"], path)
@@ -0,0 +1,251 @@
+import datetime
+import threading
+from collections.abc import Hashable
+from typing import Any, cast
+
+import attr
+from rustac import DuckdbClient
+from stac_fastapi.extensions.core.filter.client import BaseFiltersClient
+from stac_fastapi.types.errors import NotFoundError
+
+from .etag import current_version
+from .schema import HrefSchemas
+
+ENUM_MAX_VALUES = 32
+"""The most values a property can have and still be listed as an ``enum``."""
+
+SKIPPED_COLUMNS = frozenset(
+    ("type", "stac_version", "stac_extensions", "links", "assets", "bbox")
+)
+"""Item columns that aren't offered as queryables."""
+
+INTEGER_TYPES = frozenset(
+    (
+        "TINYINT",
+        "SMALLINT",
+        "INTEGER",
+        "BIGINT",
+        "HUGEINT",
+        "UTINYINT",
+        "USMALLINT",
+        "UINTEGER",
+        "UBIGINT",
+        "UHUGEINT",
+    )
+)
+
+NUMBER_TYPES = frozenset(("FLOAT", "DOUBLE"))
+
+
+def column_schema(column_type: str) -> dict[str, Any]:
+    """Returns the JSON schema of values in a DuckDB column."""
+    if column_type.startswith("GEOMETRY"):
+        return {"$ref": "https://geojson.org/schema/Geometry.json"}
+    if column_type.endswith("]"):
+        return {"type": "array"}
+    if column_type.startswith(("STRUCT", "MAP")):
+        return {"type": "object"}
+    if column_type in INTEGER_TYPES:
+        return {"type": "integer"}
+    if column_type in NUMBER_TYPES or column_type.startswith("DECIMAL"):
+        return {"type": "number"}
+    if column_type == "BOOLEAN":
+        return {"type": "boolean"}
+    if column_type.startswith("TIMESTAMP"):
+        return {"type": "string", "format": "date-time"}
+    if column_type == "DATE":
+        return {"type": "string", "format": "date"}
+    return {"type": "string"}
+
+
+def parse_statistic(value: str, schema: dict[str, Any]) -> Any:
+    """Parses a footer statistic, which DuckDB reports as text."""
+    match schema.get("type"), schema.get("format"):
+        case "integer", _:
+            return int(value)
+        case "number", _:
+            return float(value)
+        case "boolean", _:
+            return value.lower() == "true"
+        case "string", "date-time":
+            parsed = datetime.datetime.fromisoformat(value)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.UTC)
+            return parsed.astimezone(datetime.UTC).isoformat().replace("+00:00", "Z")
+    return value
+
+
+def properties(
+    columns: dict[str, str], statistics: list[dict[str, Any]]
+) -> dict[str, dict[str, Any]]:
+    """Returns queryable properties for an href's columns and footer statistics.
+
+    Numbers get a ``minimum`` and ``maximum`` and date-times a
+    ``formatMinimum`` and ``formatMaximum``, from their row groups' minimums
+    and maximums.  A property whose every row group holds a single value
+    (e.g. because the file is sorted by it) gets those values as an ``enum``.
+    """
+    groups: dict[str, list[dict[str, Any]]] = {}
+    for group in statistics:
+        groups.setdefault(group["path_in_schema"], []).append(group)
+
+    result: dict[str, dict[str, Any]] = {}
+    for name, column_type in columns.items():
+        if name in SKIPPED_COLUMNS:
+            continue
+        schema = {"title": name, **column_schema(column_type)}
+        result[name] = schema
+        if "type" not in schema or schema["type"] in ("array", "object"):
+            continue
+        minimums: list[Any] = []
+        maximums: list[Any] = []
+        constant = True
+        for group in groups.get(name, []):
+            if group["stats_null_count"] == group["num_values"]:
+                continue
+            if group["stats_min_value"] is None or group["stats_max_value"] is None:
+                minimums, maximums = [], []
+                break
+            minimums.append(parse_statistic(group["stats_min_value"], schema))
+            maximums.append(parse_statistic(group["stats_max_value"], schema))
+            constant = constant and minimums[-1] == maximums[-1]
+        if not minimums:
+            continue
+        if schema["type"] in ("integer", "number"):
+            schema["minimum"] = min(minimums)
+            schema["maximum"] = max(maximums)
+        elif schema.get("format") == "date-time":
+            schema["formatMinimum"] = min(minimums)
+            schema["formatMaximum"] = max(maximums)
+        if constant and len(values := sorted(set(minimums))) <= ENUM_MAX_VALUES:
+            schema["enum"] = values
+    return result
+
+
+def merge(schemas: list[dict[str, Any]]) -> dict[str, Any] | None:
+    """Merges a property's schemas from several hrefs.
+
+    Returns None if they don't agree on its type.
+    """
+    merged = dict(schemas[0])
+    for schema in schemas[1:]:
+        if any(
+            schema.get(key) != merged.get(key) for key in ("type", "format", "$ref")
+        ):
+            return None
+        for key, choose in (
+            ("minimum", min),
+            ("maximum", max),
+            ("formatMinimum", min),
+            ("formatMaximum", max),
+        ):
+            if key in merged and key in schema:
+                merged[key] = choose(merged[key], schema[key])
+            else:
+                merged.pop(key, None)
+        if "enum" in merged and "enum" in schema:
+            values = sorted(set(merged["enum"]) | set(schema["enum"]))
+            if len(values) <= ENUM_MAX_VALUES:
+                merged["enum"] = values
+            else:
+                merged.pop("enum")
+        else:
+            merged.pop("enum", None)
+    return merged
+
+
+class HrefQueryables:
+    """The queryable properties of each collection href, kept until it changes.
+
+    They're built from the href's schema and the statistics in its parquet
+    footer, so nothing but metadata is read, and cached by the version of the
+    href like :py:class:`~stac_fastapi.geoparquet.schema.HrefSchemas`.
+    """
+
+    def __init__(self) -> None:
+        self.queryables: dict[str, tuple[Hashable, dict[str, dict[str, Any]]]] = {}
+        self.lock = threading.Lock()
+
+    def properties(
+        self,
+        client: DuckdbClient,
+        href: str,
+        version: Hashable | None,
+        columns: dict[str, str],
+    ) -> dict[str, dict[str, Any]]:
+        """Returns the queryable properties of ``href``."""
+        with self.lock:
+            cached = self.queryables.get(href)
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+        statistics = (
+            client.query_to_table(
+                "SELECT path_in_schema, stats_min_value, stats_max_value, "
+                "stats_null_count, num_values FROM parquet_metadata(?)",
+                [href],
+            )
+            .to_struct_array()
+            .to_pylist()
+        )
+        result = properties(columns, statistics)
+        if version is not None:
+            with self.lock:
+                self.queryables[href] = (version, result)
+        return result
+
+    def forget(self, hrefs: set[str]) -> None:
+        """Drops the queryables of hrefs that are no longer served."""
+        with self.lock:
+            self.queryables = {
+                href: queryables
+                for href, queryables in self.queryables.items()
+                if href in hrefs
+            }
+
+
+@attr.s
+class FiltersClient(BaseFiltersClient):
+    """Serves queryables generated from each collection's geoparquet."""
+
+    def get_queryables(
+        self, collection_id: str | None = None, **kwargs: Any
+    ) -> dict[str, Any]:
+        """Returns the queryables of a collection, or those all collections share."""
+        request = kwargs["request"]
+        client = cast(DuckdbClient, request.state.client)
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        schemas = cast(HrefSchemas, request.state.schemas)
+        queryables = cast(HrefQueryables, request.state.queryables)
+
+        if collection_id is None:
+            selected = list(hrefs.values())
+            title = "Queryables"
+        elif (href := hrefs.get(collection_id)) is not None:
+            selected = [href]
+            title = f"Queryables for {collection_id}"
+        else:
+            raise NotFoundError(f"Collection does not exist: {collection_id}")
+
+        by_href = []
+        for href in selected:
+            version = current_version(request, href)
+            by_href.append(
+                queryables.properties(
+                    client, href, version, schemas.columns(client, href, version)
+                )
+            )
+        result: dict[str, dict[str, Any]] = {}
+        if by_href:
+            for name in by_href[0]:
+                if all(name in properties for properties in by_href):
+                    merged = merge([properties[name] for properties in by_href])
+                    if merged is not None:
+                        result[name] = merged
+        return {
+            "$schema": "https://json-schema.org/draft/2020-12/schema",
+            "$id": str(request.url),
+            "type": "object",
+            "title": title,
+            "properties": result,
+            "additionalProperties": True,
+        }
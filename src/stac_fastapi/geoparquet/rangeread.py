@@ -0,0 +1,446 @@
+import datetime
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from collections.abc import Iterable
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import obstore
+from obstore.store import ObjectStore
+from rustac import DuckdbClient
+
+from .deadline import Deadline
+from .etag import HrefVersion
+from .intersects import PreparedIntersects, prepare
+from .materialize import search_href, supported
+from .settings import Settings
+from .storage import from_href
+
+logger = logging.getLogger(__name__)
+
+TAIL_BYTES = 64 * 1024
+"""How much of the end of a file is read first, hoping it holds the footer."""
+
+BBOX_COLUMNS = ("bbox, xmin", "bbox, ymin", "bbox, xmax", "bbox, ymax")
+"""The bbox covering columns, as ``parquet_metadata`` names them."""
+
+START_COLUMNS = ("datetime", "start_datetime")
+"""Columns whose minimums bound when a row group's items start."""
+
+END_COLUMNS = ("datetime", "end_datetime")
+"""Columns whose maximums bound when a row group's items end."""
+
+
+class RowGroup(NamedTuple):
+    """Where one row group of a parquet file is, and what it covers."""
+
+    first_row: int
+    """The ``file_row_number`` of the row group's first row."""
+
+    num_rows: int
+
+    ranges: list[tuple[int, int]]
+    """The byte ranges of its column chunks, coalesced."""
+
+    bbox: tuple[float, float, float, float] | None
+    """The extent of its rows' bboxes, if the file has a bbox covering column."""
+
+    interval: tuple[datetime.datetime, datetime.datetime] | None = None
+    """When its items start and end, if the file has datetime statistics."""
+
+
+def coalesce(ranges: Iterable[tuple[int, int]], gap: int) -> list[tuple[int, int]]:
+    """Merges ``[start, end)`` ranges that are at most ``gap`` bytes apart.
+
+    Reading the bytes between two ranges is cheaper than another round trip,
+    as long as there aren't too many of them.
+    """
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def split(ranges: Iterable[tuple[int, int]], size: int) -> list[tuple[int, int]]:
+    """Splits ranges into parts of at most ``size`` bytes, to read in parallel."""
+    return [
+        (part, min(part + size, end))
+        for start, end in ranges
+        for part in range(start, end, size)
+    ]
+
+
+def is_remote(href: str) -> bool:
+    return urllib.parse.urlparse(href).scheme not in ("", "file")
+
+
+class StagedFile:
+    """A local, sparse copy of a remote parquet file.
+
+    The copy is as big as the file, but only its footer, page indexes and the
+    row groups that have been read are written; DuckDB reads it one row group
+    at a time, so it never reaches the parts that are still holes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        store: ObjectStore,
+        store_path: str,
+        version: HrefVersion,
+    ) -> None:
+        self.path = path
+        self.store = store
+        self.store_path = store_path
+        self.version = version
+        self.row_groups: list[RowGroup] = []
+        self.staged: dict[int, Future[None]] = {}
+        self.lock = threading.Lock()
+
+
+class RangeReader:
+    """Reads remote parquet hrefs with coalesced, parallel range requests.
+
+    Each row group's column chunks are merged into as few ranges as
+    ``stac_fastapi_range_coalesce_bytes`` allows and fetched with obstore,
+    ``stac_fastapi_range_concurrency`` requests at a time across all searches.
+    While DuckDB searches one row group, the next one is already being
+    fetched, so a search costs about one round trip plus the time to transfer
+    the row groups it needs.
+
+    Staged files are kept by the version of their href, and replaced files
+    are only deleted on the next refresh so that searches that already picked
+    them up can finish.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.gap = settings.stac_fastapi_range_coalesce_bytes
+        self.part_size = settings.stac_fastapi_range_part_bytes
+        self.directory = Path(tempfile.mkdtemp(prefix="stac-fastapi-geoparquet-"))
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.stac_fastapi_range_concurrency,
+            thread_name_prefix="range-read",
+        )
+        self.files: dict[str, StagedFile] = {}
+        self.retired: list[StagedFile] = []
+        self.lock = threading.Lock()
+        self.opening: dict[str, threading.Lock] = {}
+        self.counter = itertools.count()
+
+    def search(
+        self,
+        client: DuckdbClient,
+        href: str,
+        version: HrefVersion | None,
+        search: dict[str, Any],
+        columns: dict[str, str],
+        prepared: PreparedIntersects | None = None,
+        rows: list[int] | None = None,
+        deadline: Deadline | None = None,
+    ) -> list[dict[str, Any]] | None:
+        """Searches a remote href one row group at a time.
+
+        Row groups are skipped if their statistics rule out ``bbox``, the
+        bounds of ``intersects`` or ``datetime``, or if they hold none of
+        ``rows``.  Returns None if the href is local or the search has to go
+        through rustac instead.  With a ``deadline``, the search gives up on
+        the footer and row groups it's waiting for once the deadline passes,
+        and they finish staging in the background.
+        """
+        if not is_remote(href) or not supported(search):
+            return None
+        if deadline is None:
+            deadline = Deadline()
+        if prepared is None and (intersects := search.get("intersects")):
+            prepared = prepare(intersects)
+        staged = deadline.wait(self.executor.submit(self.open, client, href, version))
+        groups = [
+            group
+            for group in staged.row_groups
+            if overlaps(group, search.get("bbox"))
+            and (prepared is None or overlaps(group, list(prepared.bbox)))
+            and during(group, search.get("datetime"))
+            and (
+                rows is None or any(group.first_row <= row < end(group) for row in rows)
+            )
+        ]
+        limit = search.get("limit")
+        skip = int(search.get("offset") or 0)
+        group_search = {
+            key: value
+            for key, value in search.items()
+            if key not in ("limit", "offset")
+        }
+        items: list[dict[str, Any]] = []
+        for index, group in enumerate(groups):
+            fetched = self.stage(staged, group)
+            if index + 1 < len(groups):
+                self.stage(staged, groups[index + 1])
+            deadline.wait(fetched)
+            if limit is not None:
+                group_search["limit"] = skip + int(limit) - len(items)
+            group_rows = None
+            if rows is not None:
+                group_rows = [
+                    row for row in rows if group.first_row <= row < end(group)
+                ]
+            found = search_href(
+                client,
+                str(staged.path),
+                group_search,
+                columns,
+                prepared,
+                group_rows,
+                (group.first_row, end(group)),
+            )
+            if found is None:
+                return None
+            skipped = min(skip, len(found))
+            skip -= skipped
+            items.extend(found[skipped:])
+            if limit is not None and len(items) >= int(limit):
+                break
+        return items
+
+    def open(
+        self, client: DuckdbClient, href: str, version: HrefVersion | None
+    ) -> StagedFile:
+        """Returns the staged copy of ``href``, staging its footer if it's new.
+
+        ``version`` is the href's version as of the last collections reload,
+        which is only looked up again if it isn't known.
+        """
+        with self.lock:
+            opening = self.opening.setdefault(href, threading.Lock())
+        with opening:
+            store, store_path = from_href(href)
+            size = version.size if version is not None else None
+            if version is None or size is None:
+                meta = obstore.head(store, store_path)
+                size = meta["size"]
+                version = HrefVersion(meta.get("e_tag"), meta["last_modified"], size)
+            with self.lock:
+                current = self.files.get(href)
+            if current is not None and current.version == version:
+                return current
+            path = self.directory / f"{next(self.counter)}.parquet"
+            staged = StagedFile(path, store, store_path, version)
+            with path.open("wb") as f:
+                f.truncate(size)
+            self.stage_footer(client, staged, size)
+            with self.lock:
+                self.files[href] = staged
+                if current is not None:
+                    self.retired.append(current)
+            return staged
+
+    def stage_footer(self, client: DuckdbClient, staged: StagedFile, size: int) -> None:
+        """Stages the footer and everything after the last row group."""
+        tail_start = max(size - TAIL_BYTES, 0)
+        tail = bytes(self.read(staged, tail_start, size))
+        footer_start = size - 8 - int.from_bytes(tail[-8:-4], "little")
+        if footer_start < tail_start:
+            tail = bytes(self.read(staged, footer_start, tail_start)) + tail
+            tail_start = footer_start
+        self.write(staged, tail_start, tail)
+
+        chunks = (
+            client.query_to_table(
+                "SELECT row_group_id, row_group_num_rows, path_in_schema, "
+                "coalesce(dictionary_page_offset, data_page_offset) AS start, "
+                "total_compressed_size, stats_min_value, stats_max_value, "
+                "stats_null_count, num_values "
+                "FROM parquet_metadata(?) ORDER BY row_group_id, column_id",
+                [str(staged.path)],
+            )
+            .to_struct_array()
+            .to_pylist()
+        )
+        # Page indexes and bloom filters sit between the row groups and the
+        # footer, and DuckDB may read them for any row group.
+        chunks_end = max(
+            (c["start"] + c["total_compressed_size"] for c in chunks),
+            default=tail_start,
+        )
+        for part in [
+            self.executor.submit(self.fetch, staged, start, stop)
+            for start, stop in split([(chunks_end, tail_start)], self.part_size)
+        ]:
+            part.result()
+
+        first_row = 0
+        for _, grouped in itertools.groupby(chunks, lambda c: c["row_group_id"]):
+            group_chunks = list(grouped)
+            num_rows = group_chunks[0]["row_group_num_rows"]
+            statistics = {c["path_in_schema"]: c for c in group_chunks}
+            bbox = None
+            if all(column in statistics for column in BBOX_COLUMNS):
+                try:
+                    bbox = (
+                        float(statistics["bbox, xmin"]["stats_min_value"]),
+                        float(statistics["bbox, ymin"]["stats_min_value"]),
+                        float(statistics["bbox, xmax"]["stats_max_value"]),
+                        float(statistics["bbox, ymax"]["stats_max_value"]),
+                    )
+                except (TypeError, ValueError):
+                    bbox = None
+            ranges = coalesce(
+                (
+                    (c["start"], c["start"] + c["total_compressed_size"])
+                    for c in group_chunks
+                ),
+                self.gap,
+            )
+            staged.row_groups.append(
+                RowGroup(first_row, num_rows, ranges, bbox, interval(statistics))
+            )
+            first_row += num_rows
+
+    def stage(self, staged: StagedFile, group: RowGroup) -> Future[None]:
+        """Starts fetching a row group, unless it's fetched or being fetched."""
+        with staged.lock:
+            if (fetched := staged.staged.get(group.first_row)) is not None:
+                return fetched
+            parts = [
+                self.executor.submit(self.fetch, staged, start, stop)
+                for start, stop in split(group.ranges, self.part_size)
+            ]
+            fetched = Future()
+            staged.staged[group.first_row] = fetched
+        remaining = len(parts)
+        lock = threading.Lock()
+
+        def done(part: Future[None]) -> None:
+            nonlocal remaining
+            with lock:
+                if fetched.done():
+                    return
+                error = CancelledError() if part.cancelled() else part.exception()
+                if error is not None:
+                    # A later search tries again.
+                    with staged.lock:
+                        staged.staged.pop(group.first_row, None)
+                    fetched.set_exception(error)
+                    return
+                remaining -= 1
+                if remaining == 0:
+                    fetched.set_result(None)
+
+        if not parts:
+            fetched.set_result(None)
+        for part in parts:
+            part.add_done_callback(done)
+        return fetched
+
+    def fetch(self, staged: StagedFile, start: int, stop: int) -> None:
+        self.write(staged, start, self.read(staged, start, stop))
+
+    def read(self, staged: StagedFile, start: int, stop: int) -> Any:
+        return obstore.get_range(staged.store, staged.store_path, start=start, end=stop)
+
+    def write(self, staged: StagedFile, start: int, data: Any) -> None:
+        fd = os.open(staged.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, memoryview(data), start)
+        finally:
+            os.close(fd)
+
+    def forget(self, hrefs: set[str]) -> None:
+        """Deletes staged files that were replaced or whose hrefs are gone."""
+        with self.lock:
+            retired, self.retired = self.retired, []
+            for href in list(self.files):
+                if href not in hrefs:
+                    retired.append(self.files.pop(href))
+            self.opening = {
+                href: lock for href, lock in self.opening.items() if href in hrefs
+            }
+        for staged in retired:
+            staged.path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def end(group: RowGroup) -> int:
+    return group.first_row + group.num_rows
+
+
+def interval(
+    statistics: dict[str, dict[str, Any]],
+) -> tuple[datetime.datetime, datetime.datetime] | None:
+    """Returns when a row group's items start and end, from its statistics.
+
+    Items are matched by ``start_datetime`` and ``end_datetime`` where they
+    have them, like :py:func:`~stac_fastapi.geoparquet.materialize.predicates`
+    does, so those columns widen the interval.
+    """
+    if "datetime" not in statistics:
+        return None
+    starts: list[datetime.datetime] = []
+    ends: list[datetime.datetime] = []
+    for column in ("datetime", "start_datetime", "end_datetime"):
+        if (chunk := statistics.get(column)) is None:
+            continue
+        if chunk["stats_null_count"] == chunk["num_values"]:
+            # Every value is null, so items fall back to ``datetime``.
+            continue
+        try:
+            minimum = parse_datetime(chunk["stats_min_value"])
+            maximum = parse_datetime(chunk["stats_max_value"])
+        except (TypeError, ValueError):
+            return None
+        if column in START_COLUMNS:
+            starts.append(minimum)
+        if column in END_COLUMNS:
+            ends.append(maximum)
+    if not starts or not ends:
+        return None
+    return min(starts), max(ends)
+
+
+def parse_datetime(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.UTC)
+    return parsed
+
+
+def during(group: RowGroup, interval: str | None) -> bool:
+    """Returns False if ``group``'s statistics show it has nothing in ``interval``."""
+    if not interval or group.interval is None:
+        return True
+    start, separator, end = interval.partition("/")
+    if not separator:
+        end = start
+    try:
+        if start not in ("", "..") and group.interval[1] < parse_datetime(start):
+            return False
+        if end not in ("", "..") and group.interval[0] > parse_datetime(end):
+            return False
+    except ValueError:
+        return True
+    return True
+
+
+def overlaps(group: RowGroup, bbox: list[float] | None) -> bool:
+    """Returns False if ``group``'s statistics show it has nothing in ``bbox``."""
+    if not bbox or group.bbox is None:
+        return True
+    if len(bbox) == 6:
+        bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+    if bbox[0] > bbox[2]:
+        # Crosses the antimeridian.
+        return True
+    xmin, ymin, xmax, ymax = group.bbox
+    return not (xmin > bbox[2] or xmax < bbox[0] or ymin > bbox[3] or ymax < bbox[1])
@@ -0,0 +1,47 @@
+import threading
+from collections.abc import Hashable
+
+from rustac import DuckdbClient
+
+
+class HrefSchemas:
+    """The columns of each collection href, kept until the href changes.
+
+    Describing a remote file reads its footer, so schemas are cached by the
+    version of the href that was current when they were read.  Hrefs without
+    a known version are described every time.
+    """
+
+    def __init__(self) -> None:
+        self.schemas: dict[str, tuple[Hashable, dict[str, str]]] = {}
+        self.lock = threading.Lock()
+
+    def columns(
+        self, client: DuckdbClient, href: str, version: Hashable | None
+    ) -> dict[str, str]:
+        """Returns the names and DuckDB types of the columns in ``href``."""
+        with self.lock:
+            cached = self.schemas.get(href)
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+        columns = {
+            row["column_name"]: row["column_type"]
+            for row in client.query_to_table(
+                "SELECT column_name, column_type "
+                "FROM (DESCRIBE SELECT * FROM read_parquet(?))",
+                [href],
+            )
+            .to_struct_array()
+            .to_pylist()
+        }
+        if version is not None:
+            with self.lock:
+                self.schemas[href] = (version, columns)
+        return columns
+
+    def forget(self, hrefs: set[str]) -> None:
+        """Drops the schemas of hrefs that are no longer served."""
+        with self.lock:
+            self.schemas = {
+                href: schema for href, schema in self.schemas.items() if href in hrefs
+            }
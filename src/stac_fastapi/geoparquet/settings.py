@@ -1,5 +1,11 @@
+import re
+
+from pydantic import NonNegativeInt, PositiveInt, SecretStr, field_validator
 from stac_fastapi.types.config import ApiSettings
 
+MEMORY_SIZE = re.compile(r"^\d+(\.\d+)?\s*([KMGT]i?)?B$", re.IGNORECASE)
+"""A size that DuckDB accepts, e.g. ``512MB`` or ``4GiB``."""
+
 
 class Settings(ApiSettings):
     """stac-fastapi-geoparquet settings"""
@@ -16,3 +22,182 @@ class Settings(ApiSettings):
     """The href of a stac-geoparquet file.
 
     The items in the file will be used to auto-generate one or more collections."""
+
+    stac_fastapi_admission_cheap_concurrency: int = 32
+    """The number of cheap searches that can run at the same time (default: 32)."""
+
+    stac_fastapi_admission_expensive_concurrency: int = 4
+    """The number of expensive searches that can run at the same time (default: 4)."""
+
+    stac_fastapi_admission_expensive_cost: float = 10_000
+    """The estimated cost at or above which a search is considered expensive.
+
+    The cost is roughly the number of rows a search could return across all of
+    its collections, weighted up for filters and large files (default: 10,000)."""
+
+    stac_fastapi_admission_queue_seconds: float = 10
+    """How long a search waits for a free slot before getting a 503 (default: 10)."""
+
+    stac_fastapi_query_timeout_seconds: float | None = None
+    """The default deadline for a search, in seconds (default: no deadline).
+
+    Can be overridden per request with the ``X-Query-Timeout`` header.  The
+    deadline is checked between queries and while range reads are fetched;
+    a DuckDB query that has started runs to completion."""
+
+    stac_fastapi_query_timeout_max_seconds: float = 300
+    """The maximum deadline a request can ask for, in seconds (default: 300)."""
+
+    stac_fastapi_materialized_collections: list[str] = []
+    """Ids of collections to load into in-memory, indexed DuckDB tables.
+
+    Collections can also opt in by setting
+    ``stac-fastapi-geoparquet:materialize`` to ``true`` on their geoparquet
+    asset.  Only use this for collections that comfortably fit in memory."""
+
+    stac_fastapi_shared_state_directory: str | None = None
+    """A local directory that worker processes use to share collections.
+
+    When set, one worker at a time reads ``stac_fastapi_collections_href`` and
+    publishes a snapshot here, and the other workers on the host read that
+    snapshot instead of fetching and reloading the collections themselves."""
+
+    stac_fastapi_tile_max_features: int = 10_000
+    """The maximum number of items per collection in a vector tile (default: 10,000)."""
+
+    stac_fastapi_tile_cache_size: int = 1024
+    """The number of rendered vector tile layers to keep in memory (default: 1024).
+
+    Set to zero to disable the cache."""
+
+    stac_fastapi_batch_max_items: int = 10_000
+    """The most items that can be fetched in one ``POST /items`` request.
+
+    (default: 10,000)"""
+
+    stac_fastapi_profiling_secret: SecretStr | None = None
+    """A secret that turns on profiling for requests that send it.
+
+    Requests with an ``X-Profile`` header equal to this secret get a Python
+    stack sample and DuckDB query profiles of their search (default: profiling
+    is off)."""
+
+    stac_fastapi_admin_secret: SecretStr | None = None
+    """A secret that turns on the admin endpoints, e.g. ``/search/explain``.
+
+    Requests to them have to send it as a bearer token (default: the admin
+    endpoints don't exist)."""
+
+    stac_fastapi_profiling_directory: str | None = None
+    """A directory to write profiles to.
+
+    When unset, a profiled request gets its profile back instead of its
+    response body, which isn't streamed."""
+
+    stac_fastapi_slow_query_seconds: float | None = 1.0
+    """Searches that take at least this many seconds are logged (default: 1).
+
+    Set to nothing to turn off slow search logging."""
+
+    stac_fastapi_slow_query_fingerprints: int = 1000
+    """The number of search fingerprints kept for ``/admin/slow-queries``.
+
+    (default: 1,000)"""
+
+    stac_fastapi_cache_control: str | None = None
+    """A ``Cache-Control`` header for responses that have an ``ETag``.
+
+    E.g. ``public, max-age=60`` lets CDNs and browsers reuse responses for a
+    minute and then revalidate them (default: no header)."""
+
+    stac_fastapi_prefetch: bool = False
+    """Compute the next page of a paginated search before it's requested.
+
+    Pages are prefetched after their previous page has been sent, and only
+    while the server isn't busy (default: off)."""
+
+    stac_fastapi_prefetch_timeout_seconds: float = 10
+    """The deadline for computing a prefetched page, in seconds (default: 10)."""
+
+    stac_fastapi_prefetch_ttl_seconds: float = 30
+    """How long a prefetched page is kept, in seconds (default: 30)."""
+
+    stac_fastapi_prefetch_cache_size: int = 16
+    """The most prefetched pages kept at once (default: 16)."""
+
+    stac_fastapi_max_response_bytes: int | None = None
+    """The most bytes of items in one page of search results (default: no maximum).
+
+    Pages stop early once their items reach this size, and the next link
+    continues from there.  E.g. ``5_000_000`` keeps responses under AWS
+    Lambda's 6 MB limit."""
+
+    stac_fastapi_stream_responses: bool = False
+    """Send search results as they're read, instead of once the page is complete.
+
+    Items are read ``stac_fastapi_stream_batch_size`` at a time and sent as
+    each batch is ready, so the first bytes arrive sooner and a large page is
+    never held in memory all at once.  An error after the first batch (e.g. a
+    passed deadline) ends the response early instead of changing its status."""
+
+    stac_fastapi_stream_batch_size: int = 1_000
+    """The number of items read at a time when streaming (default: 1,000)."""
+
+    stac_fastapi_duckdb_threads: PositiveInt | None = None
+    """The number of threads DuckDB runs queries with (default: DuckDB's).
+
+    Lower it when several server workers share a machine, so that their
+    queries don't compete for the same cores."""
+
+    stac_fastapi_duckdb_memory_limit: str | None = None
+    """The most memory DuckDB uses for all queries at once, e.g. ``2GB``.
+
+    Queries that need more (e.g. large sorts) spill to
+    ``stac_fastapi_duckdb_temp_directory``, or fail if they can't."""
+
+    stac_fastapi_duckdb_temp_directory: str | None = None
+    """A directory that DuckDB spills to when it reaches its memory limit."""
+
+    stac_fastapi_duckdb_max_temp_directory_size: str | None = None
+    """The most that DuckDB spills to its temp directory, e.g. ``10GB``."""
+
+    stac_fastapi_duckdb_extension_directory: str | None = None
+    """The directory DuckDB loads (and installs) its extensions from."""
+
+    stac_fastapi_duckdb_external_file_cache: bool | None = None
+    """Whether DuckDB keeps the parquet data it reads in memory for later queries."""
+
+    stac_fastapi_duckdb_parquet_metadata_cache: bool | None = None
+    """Whether DuckDB keeps parquet footers in memory for later queries."""
+
+    stac_fastapi_duckdb_http_metadata_cache: bool | None = None
+    """Whether DuckDB keeps the sizes and modification times of remote files.
+
+    Only turn this on if hrefs are never replaced in place."""
+
+    stac_fastapi_range_reads: bool = False
+    """Whether remote hrefs are read with obstore rather than by DuckDB.
+
+    Searches that rustac doesn't have to answer then fetch each row group's
+    column chunks with coalesced, parallel range requests, fetching the next
+    row group while DuckDB searches the current one.  Fetched row groups are
+    kept in a temporary directory until their href changes."""
+
+    stac_fastapi_range_coalesce_bytes: NonNegativeInt = 1024 * 1024
+    """Ranges at most this many bytes apart are read with one request."""
+
+    stac_fastapi_range_part_bytes: PositiveInt = 8 * 1024 * 1024
+    """Ranges larger than this are split into parts that are read in parallel."""
+
+    stac_fastapi_range_concurrency: PositiveInt = 8
+    """The most range requests in flight at once, across all searches."""
+
+    @field_validator(
+        "stac_fastapi_duckdb_memory_limit",
+        "stac_fastapi_duckdb_max_temp_directory_size",
+    )
+    @classmethod
+    def validate_memory_size(cls, value: str | None) -> str | None:
+        if value is not None and not MEMORY_SIZE.match(value.strip()):
+            raise ValueError(f"not a size like 512MB or 4GiB: {value}")
+        return value
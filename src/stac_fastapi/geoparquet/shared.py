@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE_NAME = "reloader.lock"
+CURRENT_FILE_NAME = "current"
+SNAPSHOT_PREFIX = "collections-"
+
+STALE_RELOADS = 3
+"""How many reload intervals a snapshot can miss before it's considered stale."""
+
+MIN_STALE_SECONDS = 60.0
+"""The youngest a snapshot can be and still be considered stale."""
+
+
+def max_age(reload_seconds: float) -> float:
+    """Returns how old a snapshot can be before workers stop trusting it.
+
+    The reloader only publishes when one of its own requests triggers a
+    reload, so a quiet reloader leaves snapshots older than one interval;
+    only a reloader that's missed several is taken to be stuck.
+    """
+    return max(STALE_RELOADS * reload_seconds, MIN_STALE_SECONDS)
+
+
+class SharedCollections:
+    """Collections shared by every worker process through a directory.
+
+    One process at a time holds an exclusive lock on the directory and becomes
+    the reloader: it's the only one that reads ``collections.json`` from object
+    storage, and it publishes each new version as an immutable snapshot file
+    before atomically pointing ``current`` at it.  Every other worker reads the
+    current snapshot from local disk (and the OS page cache, which is shared),
+    and only re-parses it when the version changes.  If the reloader
+    exits its lock is released and the next worker to refresh takes over.
+
+    ``current`` also records when the reloader last published, so workers
+    can tell a snapshot that's kept up to date from one whose reloader is
+    stuck.
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock_fd: int | None = None
+        self.version: str | None = None
+        self.collections: list[dict[str, Any]] = []
+
+    def acquire(self) -> bool:
+        """Tries to become the reloader, and returns whether this process is it."""
+        if self.lock_fd is None:
+            fd = os.open(self.directory / LOCK_FILE_NAME, os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self.lock_fd = fd
+            logger.info("Process %d is the collections reloader", os.getpid())
+        return True
+
+    def close(self) -> None:
+        """Gives up the reloader lock, if this process holds it."""
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def publish(self, collections: list[dict[str, Any]]) -> str:
+        """Writes a new snapshot (if it changed) and makes it current.
+
+        ``current`` is rewritten even if the snapshot didn't change, to record
+        that it's still up to date.
+        """
+        data = json.dumps(collections).encode()
+        version = hashlib.sha256(data).hexdigest()[:16]
+        changed = version != self.current_version()
+        if changed:
+            self.write(SNAPSHOT_PREFIX + version + ".json", data)
+        self.write(CURRENT_FILE_NAME, f"{version} {time.time()}".encode())
+        if changed:
+            for path in self.directory.glob(SNAPSHOT_PREFIX + "*.json"):
+                if path.name not in (
+                    SNAPSHOT_PREFIX + version + ".json",
+                    SNAPSHOT_PREFIX + f"{self.version}.json",
+                ):
+                    # The previous snapshot is kept for readers that read
+                    # ``current`` just before it changed.
+                    path.unlink(missing_ok=True)
+        self.version = version
+        self.collections = collections
+        return version
+
+    def read(self, max_age: float | None = None) -> list[dict[str, Any]] | None:
+        """Returns the current snapshot, or None if nothing was published yet.
+
+        Also returns None if the snapshot was last published more than
+        ``max_age`` seconds ago.
+        """
+        if (current := self.current()) is None:
+            return None
+        version, published = current
+        if max_age is not None and time.time() - published > max_age:
+            return None
+        if version != self.version:
+            path = self.directory / (SNAPSHOT_PREFIX + version + ".json")
+            try:
+                collections = json.loads(path.read_bytes())
+            except FileNotFoundError:
+                # A newer snapshot replaced this one between the two reads
+                return self.read(max_age)
+            self.version = version
+            self.collections = collections
+        return self.collections
+
+    def current(self) -> tuple[str, float] | None:
+        """Returns the current version and when it was last published."""
+        try:
+            text = (self.directory / CURRENT_FILE_NAME).read_text()
+        except FileNotFoundError:
+            return None
+        version, _, published = text.strip().partition(" ")
+        if not version:
+            return None
+        try:
+            return version, float(published)
+        except ValueError:
+            # Written before publish times were recorded.
+            return version, 0.0
+
+    def current_version(self) -> str | None:
+        return current[0] if (current := self.current()) else None
+
+    def write(self, name: str, data: bytes) -> None:
+        """Writes a file so that readers see either nothing or all of it."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.directory / name)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
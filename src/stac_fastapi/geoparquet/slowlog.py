@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+from typing import Any, cast
+
+import attr
+from fastapi import APIRouter, Depends, FastAPI
+from stac_fastapi.types.extension import ApiExtension
+from starlette.requests import Request
+
+from .admin import require_admin
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS = ("bbox", "datetime", "ids", "intersects", "include", "exclude")
+"""Search parameters whose presence, but not value, is part of a fingerprint."""
+
+
+def filter_shape(filter: Any) -> Any:
+    """Returns a CQL2 filter with its literals replaced by ``?``.
+
+    Property names and operators are kept, so filters that only differ in the
+    values they compare against share a shape.
+    """
+    if isinstance(filter, str):
+        shape = re.sub(r"'(?:[^']|'')*'", "?", filter)
+        shape = re.sub(r"(?<![\w:])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?", "?", shape)
+        return " ".join(shape.split())
+    if isinstance(filter, dict):
+        if "property" in filter:
+            return filter
+        if "op" in filter:
+            return {
+                "op": filter["op"],
+                "args": [filter_shape(arg) for arg in filter.get("args", [])],
+            }
+    return "?"
+
+
+def limit_bucket(limit: int) -> str:
+    """Rounds a limit up to a power of ten, e.g. ``<=100`` for 42."""
+    return f"<={10 ** max(0, math.ceil(math.log10(max(limit, 1))))}"
+
+
+def sort_shape(sortby: list[Any]) -> list[str]:
+    """Returns sort fields as ``+field`` or ``-field``, for GET and POST alike."""
+    shape = []
+    for sort in sortby:
+        if isinstance(sort, str):
+            shape.append(sort if sort[:1] in "+-" else "+" + sort)
+        else:
+            direction = "-" if sort.get("direction") == "desc" else "+"
+            shape.append(direction + sort["field"])
+    return shape
+
+
+def fingerprint(
+    search_dict: dict[str, Any], collections: list[str], limit: int
+) -> dict[str, Any]:
+    """Returns the normalized shape of a search, without any of its values."""
+    return {
+        "collections": sorted(set(collections)),
+        "filter": filter_shape(search_dict["filter"])
+        if "filter" in search_dict
+        else None,
+        "sortby": sort_shape(search_dict.get("sortby") or []),
+        "limit": limit_bucket(limit),
+        "parameters": [key for key in PARAMETERS if search_dict.get(key)],
+    }
+
+
+def fingerprint_id(shape: dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class SlowQueryLog:
+    """Aggregates search timings by fingerprint and logs slow searches.
+
+    Every search is added to the table, so the top fingerprints reflect the
+    whole workload rather than only its outliers.  The table keeps at most
+    ``stac_fastapi_slow_query_fingerprints`` entries; when it's full, the
+    fingerprint with the least total time makes room for a new one.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.threshold = settings.stac_fastapi_slow_query_seconds
+        self.size = settings.stac_fastapi_slow_query_fingerprints
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        shape: dict[str, Any],
+        seconds: float,
+        collections: list[dict[str, Any]],
+    ) -> None:
+        """Adds a finished search, and logs it if it was slow."""
+        key = fingerprint_id(shape)
+        rows = sum(collection["rows"] for collection in collections)
+        slow = self.threshold is not None and seconds >= self.threshold
+        with self.lock:
+            if (entry := self.entries.get(key)) is None:
+                if len(self.entries) >= max(self.size, 1):
+                    smallest = min(
+                        self.entries, key=lambda k: self.entries[k]["total_seconds"]
+                    )
+                    del self.entries[smallest]
+                entry = self.entries[key] = {
+                    "fingerprint": key,
+                    "shape": shape,
+                    "count": 0,
+                    "slow_count": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                }
+            entry["count"] += 1
+            entry["slow_count"] += slow
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["rows"] += rows
+        if slow:
+            logger.warning(
+                "Slow search: %s",
+                json.dumps(
+                    {
+                        "fingerprint": key,
+                        "shape": shape,
+                        "seconds": seconds,
+                        "rows": rows,
+                        "collections": collections,
+                    }
+                ),
+            )
+
+    def top(self, limit: int) -> list[dict[str, Any]]:
+        """Returns the fingerprints with the most total time, most first."""
+        with self.lock:
+            entries = sorted(
+                self.entries.values(), key=lambda e: e["total_seconds"], reverse=True
+            )
+            return [
+                {**entry, "mean_seconds": entry["total_seconds"] / entry["count"]}
+                for entry in entries[:limit]
+            ]
+
+
+@attr.s
+class SlowQueriesExtension(ApiExtension):
+    """An admin endpoint listing the search fingerprints with the most total time.
+
+    See :py:func:`~stac_fastapi.geoparquet.admin.require_admin`.
+    """
+
+    def register(self, app: FastAPI) -> None:
+        router = APIRouter()
+        router.add_api_route(
+            name="Get Slow Queries",
+            path="/admin/slow-queries",
+            endpoint=self.get_slow_queries,
+            methods=["GET"],
+            dependencies=[Depends(require_admin)],
+        )
+        app.include_router(router, tags=["Admin"])
+
+    def get_slow_queries(self, request: Request, limit: int = 20) -> dict[str, Any]:
+        """Returns the top search fingerprints by total time."""
+        slow_queries = cast(SlowQueryLog, request.state.slow_queries)
+        return {
+            "threshold_seconds": slow_queries.threshold,
+            "fingerprints": slow_queries.top(limit),
+        }
@@ -0,0 +1,20 @@
+import urllib.parse
+from pathlib import Path
+
+import obstore.store
+from obstore.store import ObjectStore
+
+
+def from_href(href: str) -> tuple[ObjectStore, str]:
+    """Split an href into an object store for its parent and the object's path.
+
+    Hrefs without a scheme are treated as local file paths, and plain
+    ``http://`` hrefs are allowed, as DuckDB allows them.
+    """
+    scheme = urllib.parse.urlparse(href).scheme
+    if not scheme:
+        href = "file://" + str(Path(href).absolute())
+    prefix, path = href.rsplit("/", 1)
+    if scheme == "http":
+        return obstore.store.from_url(prefix, client_options={"allow_http": True}), path
+    return obstore.store.from_url(prefix), path
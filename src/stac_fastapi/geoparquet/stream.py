@@ -0,0 +1,76 @@
+import json
+from collections.abc import Generator, Iterator
+from typing import Any
+
+from stac_fastapi.api.models import GeoJSONResponse
+from stac_fastapi.types.stac import Item, ItemCollection
+from starlette.responses import Response, StreamingResponse
+
+ItemBatches = Generator[list[Item], None, ItemCollection]
+"""A search's items, in batches, then its page without them."""
+
+
+class StreamingGeoJSONResponse(StreamingResponse):
+    """GeoJSON that's sent as it's written."""
+
+    media_type = "application/geo+json"
+
+
+def collect(batches: ItemBatches) -> ItemCollection:
+    """Reads every batch of a search into one page."""
+    items: list[Item] = []
+    while True:
+        try:
+            items.extend(next(batches))
+        except StopIteration as stop:
+            item_collection: ItemCollection = stop.value
+            item_collection["features"] = items
+            return item_collection
+
+
+def stream(batches: ItemBatches) -> Response:
+    """Responds with a search's items as each batch of them is read.
+
+    The first batch is read before responding, so a search that fails before
+    it finds any items (a bad request, a full queue, or a deadline) still gets
+    its own status code.  A failure after that ends the body early.
+    """
+    try:
+        first = next(batches)
+    except StopIteration as stop:
+        return GeoJSONResponse(stop.value)
+    return StreamingGeoJSONResponse(encode(first, batches))
+
+
+def encode(first: list[Item], batches: ItemBatches) -> Iterator[bytes]:
+    """Encodes a FeatureCollection, one chunk per batch of items.
+
+    Its other members are written after the features, because the next link
+    is only known once the last batch has been read.
+    """
+    yield b'{"type":"FeatureCollection","features":[' + encode_items(first)
+    while True:
+        try:
+            batch = next(batches)
+        except StopIteration as stop:
+            item_collection = stop.value
+            break
+        if batch:
+            yield b"," + encode_items(batch)
+    members = (
+        b"," + dumps(key) + b":" + dumps(value)
+        for key, value in item_collection.items()
+        if key not in ("type", "features")
+    )
+    yield b"]" + b"".join(members) + b"}"
+
+
+def encode_items(items: list[Item]) -> bytes:
+    return b",".join(dumps(item) for item in items)
+
+
+def dumps(value: Any) -> bytes:
+    # Matches how JSONResponse renders a page that isn't streamed.
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
@@ -0,0 +1,306 @@
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import Collection, Hashable
+from typing import Annotated, Any, cast
+
+import attr
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from rustac import DuckdbClient
+from stac_fastapi.types.extension import ApiExtension
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .deadline import Deadline
+from .etag import current_version
+from .materialize import MaterializedCollections, predicates
+from .schema import HrefSchemas
+from .settings import Settings
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+EXTENT = 4096
+"""The size of a tile in MVT coordinates."""
+
+BUFFER = 256
+"""How far (in MVT coordinates) geometries are kept past the tile edge."""
+
+MAX_ZOOM = 24
+WEB_MERCATOR_WIDTH = 2 * math.pi * 6378137
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Returns the longitude/latitude bounds of a web mercator tile."""
+    n = 2**z
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def tile_query(
+    source: str,
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    search: dict[str, Any],
+    max_features: int,
+    columns: Collection[str],
+) -> tuple[str, list[str]]:
+    """Builds SQL that renders the items in ``source`` as one MVT layer.
+
+    The tile bounds are checked against the ``bbox`` column first, so parquet
+    row groups whose bbox statistics are outside the tile are never read.
+    Geometries are simplified to about one tile pixel before being clipped.
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    where, params = predicates(search, columns)
+    where.extend(
+        [
+            "bbox.xmin <= ?::DOUBLE",
+            "bbox.xmax >= ?::DOUBLE",
+            "bbox.ymin <= ?::DOUBLE",
+            "bbox.ymax >= ?::DOUBLE",
+        ]
+    )
+    params.extend(str(v) for v in (east, west, north, south))
+    tolerance = WEB_MERCATOR_WIDTH / 2**z / EXTENT
+    geometry = (
+        "ST_AsMVTGeom(ST_Simplify(ST_Transform(geometry, 'EPSG:4326', "
+        f"'EPSG:3857', always_xy := true), {tolerance}), "
+        f"ST_Extent(ST_TileEnvelope({z}, {x}, {y})), {EXTENT}, {BUFFER}, true)"
+    )
+    sql = (
+        f"SELECT ST_AsMVT({{'geometry': {geometry}, 'id': id, "
+        f"'datetime': datetime::VARCHAR}}, {literal(layer)}, {EXTENT}, "
+        "'geometry') AS tile, count(*) AS features "
+        f"FROM (SELECT id, datetime, geometry FROM {source} "
+        f"WHERE {' AND '.join(where)} LIMIT {int(max_features)})"
+    )
+    return sql, params
+
+
+class TileCache:
+    """A least-recently-used cache of rendered tiles.
+
+    Keys include the version of each collection's href, so tiles of a changed
+    file are never served; they just age out.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.tiles: OrderedDict[Hashable, bytes] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self.lock:
+            if (tile := self.tiles.get(key)) is not None:
+                self.tiles.move_to_end(key)
+            return tile
+
+    def put(self, key: Hashable, tile: bytes) -> None:
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.tiles[key] = tile
+            self.tiles.move_to_end(key)
+            while len(self.tiles) > self.size:
+                self.tiles.popitem(last=False)
+
+
+@attr.s
+class TilesExtension(ApiExtension):
+    """Mapbox Vector Tiles of item footprints, rendered by DuckDB.
+
+    Each collection becomes a layer named after the collection, with the item
+    ``id`` and ``datetime`` as feature properties.
+    """
+
+    settings: Settings = attr.ib(factory=Settings)
+    cache: TileCache = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.cache = TileCache(self.settings.stac_fastapi_tile_cache_size)
+
+    def register(self, app: FastAPI) -> None:
+        router = APIRouter()
+        responses: dict[int | str, dict[str, Any]] = {
+            200: {"content": {MVT_MEDIA_TYPE: {}}, "description": "A vector tile"}
+        }
+        router.add_api_route(
+            name="Get Collection Tile",
+            path="/collections/{collection_id}/tiles/{z}/{x}/{y}",
+            endpoint=self.get_collection_tile,
+            methods=["GET"],
+            response_class=Response,
+            responses=responses,
+        )
+        router.add_api_route(
+            name="Get Tile",
+            path="/tiles/{z}/{x}/{y}",
+            endpoint=self.get_tile,
+            methods=["GET"],
+            response_class=Response,
+            responses=responses,
+        )
+        app.include_router(router, tags=["Tiles"])
+
+    def get_collection_tile(
+        self,
+        request: Request,
+        collection_id: str,
+        z: int,
+        x: int,
+        y: int,
+        datetime: str | None = None,
+        ids: str | None = None,
+        filter: str | None = None,
+        filter_lang: Annotated[str | None, Query(alias="filter-lang")] = None,
+    ) -> Response:
+        """Renders one collection's items as a vector tile."""
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        if collection_id not in hrefs:
+            raise HTTPException(404, f"Collection does not exist: {collection_id}")
+        return self.render(
+            request, [collection_id], z, x, y, datetime, ids, filter, filter_lang
+        )
+
+    def get_tile(
+        self,
+        request: Request,
+        z: int,
+        x: int,
+        y: int,
+        collections: str | None = None,
+        datetime: str | None = None,
+        ids: str | None = None,
+        filter: str | None = None,
+        filter_lang: Annotated[str | None, Query(alias="filter-lang")] = None,
+    ) -> Response:
+        """Renders the items of several collections, one layer each."""
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        if collections:
+            collection_ids = [c for c in collections.split(",") if c in hrefs]
+        else:
+            collection_ids = list(hrefs)
+        return self.render(
+            request, collection_ids, z, x, y, datetime, ids, filter, filter_lang
+        )
+
+    def render(
+        self,
+        request: Request,
+        collection_ids: list[str],
+        z: int,
+        x: int,
+        y: int,
+        datetime: str | None,
+        ids: str | None,
+        filter: str | None,
+        filter_lang: str | None,
+    ) -> Response:
+        if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2**z and 0 <= y < 2**z):
+            raise HTTPException(400, f"invalid tile: {z}/{x}/{y}")
+        client = cast(DuckdbClient, request.state.client)
+        hrefs = cast(dict[str, str], request.state.hrefs)
+        deadline = cast(Deadline, request.state.deadline)
+        materialized = cast(MaterializedCollections, request.state.materialized)
+        schemas = cast(HrefSchemas, request.state.schemas)
+
+        search: dict[str, Any] = {}
+        if datetime:
+            search["datetime"] = datetime
+        if ids:
+            search["ids"] = ids.split(",")
+
+        tile = b""
+        for collection_id in collection_ids:
+            deadline.check()
+            href = hrefs[collection_id]
+            columns: Collection[str]
+            if table := materialized.tables.get(collection_id):
+                source = table.name
+                version: Hashable | None = table.version
+                columns = table.columns
+            else:
+                # Versions are checked when the collections are reloaded,
+                # so tile requests never wait on the object store for them.
+                source = f"read_parquet({literal(href)})"
+                version = current_version(request, href)
+                columns = ()
+                if datetime:
+                    columns = schemas.columns(client, href, version)
+            key = (
+                href,
+                version,
+                collection_id,
+                z,
+                x,
+                y,
+                datetime,
+                ids,
+                filter,
+                filter_lang,
+            )
+            if (layer := self.cache.get(key)) is None:
+                layer = self.render_layer(
+                    client,
+                    href,
+                    source,
+                    collection_id,
+                    z,
+                    x,
+                    y,
+                    search,
+                    filter,
+                    filter_lang,
+                    columns,
+                )
+                if version is not None:
+                    self.cache.put(key, layer)
+            # Tiles are repeated layer messages, so layers just concatenate
+            tile += layer
+        return Response(tile, media_type=MVT_MEDIA_TYPE)
+
+    def render_layer(
+        self,
+        client: DuckdbClient,
+        href: str,
+        source: str,
+        layer: str,
+        z: int,
+        x: int,
+        y: int,
+        search: dict[str, Any],
+        filter: str | None,
+        filter_lang: str | None,
+        columns: Collection[str],
+    ) -> bytes:
+        max_features = self.settings.stac_fastapi_tile_max_features
+        if filter:
+            # DuckDB can't evaluate CQL2 directly, so rustac finds the matching
+            # ids and the tile query only has to look those up.
+            # ``include`` isn't used because rustac applies it before the filter.
+            table = client.search_to_arrow(
+                href,
+                **{
+                    **search,
+                    "bbox": list(tile_bounds(z, x, y)),
+                    "filter": filter,
+                    "filter-lang": filter_lang or "cql2-text",
+                    "limit": max_features,
+                },
+            )
+            if table is None or table.num_rows == 0:
+                return b""
+            search = {"ids": table.column("id").to_pylist()}
+        sql, params = tile_query(source, layer, z, x, y, search, max_features, columns)
+        row = client.query_to_table(sql, params).to_struct_array().to_pylist()[0]
+        if not row["features"]:
+            return b""
+        return bytes(row["tile"])
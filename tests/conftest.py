@@ -9,6 +9,7 @@ from stac_fastapi.geoparquet import Settings
 
 COLLECTIONS_PATH = Path(__file__).parents[1] / "data" / "collections.json"
 NAIP_PATH = Path(__file__).parents[1] / "data" / "naip.parquet"
+ADMIN_SECRET = "an-admin-secret"
 
 
 @pytest.fixture
@@ -17,3 +18,17 @@ def client() -> Iterator[TestClient]:
     api = stac_fastapi.geoparquet.api.create(settings)
     with TestClient(api.app) as client:
         yield client
+
+
+@pytest.fixture
+def admin_client() -> Iterator[TestClient]:
+    """A client that's allowed to use the admin endpoints."""
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_admin_secret=ADMIN_SECRET,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(
+        api.app, headers={"Authorization": f"Bearer {ADMIN_SECRET}"}
+    ) as client:
+        yield client
@@ -0,0 +1,303 @@
+"""A local stand-in for a remote object store, for measuring remote I/O.
+
+:py:class:`LatencyServer` serves a directory over HTTP with range requests,
+like S3 or any other object store behind an ``https://`` href, and adds a
+configurable round-trip latency, bandwidth limit, and error rate.  Every
+request it answers is recorded, so tests can assert how many requests and
+bytes a search costs, and :py:func:`replay` runs a captured request log
+against ``api.create()`` and reports those costs per request.
+
+To benchmark a request log against a simulated remote store::
+
+    python -m tests.objectstore requests.jsonl --latency 0.05
+"""
+
+import argparse
+import email.utils
+import http.server
+import json
+import multiprocessing
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, NamedTuple, cast
+
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+
+DATA_DIRECTORY = Path(__file__).parents[1] / "data"
+
+
+class ObjectRequest(NamedTuple):
+    """One request answered by a :py:class:`LatencyServer`."""
+
+    method: str
+    path: str
+    range: str | None
+    status: int
+    bytes: int
+
+
+class ObjectStore(http.server.ThreadingHTTPServer):
+    """The HTTP server behind a :py:class:`LatencyServer`, in its own process."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        directory: Path,
+        latency: float,
+        bandwidth: float | None,
+        error_rate: float,
+        seed: int,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), ObjectStoreHandler)
+        self.directory = directory
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests: list[ObjectRequest] = []
+        self.lock = threading.Lock()
+
+    def fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def record(self, request: ObjectRequest) -> None:
+        with self.lock:
+            self.requests.append(request)
+
+    def reset(self) -> list[ObjectRequest]:
+        with self.lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+
+class ObjectStoreHandler(http.server.BaseHTTPRequestHandler):
+    server: ObjectStore
+
+    def do_HEAD(self) -> None:
+        self.respond(body=False)
+
+    def do_GET(self) -> None:
+        self.respond(body=True)
+
+    def respond(self, body: bool) -> None:
+        time.sleep(self.server.latency)
+        range_header = self.headers.get("Range")
+        directory = self.server.directory
+        path = directory / self.path.split("?")[0].lstrip("/")
+        if self.server.fails():
+            self.finish_response(503, {}, b"", range_header)
+            return
+        if not path.is_file() or directory not in path.parents:
+            self.finish_response(404, {}, b"", range_header)
+            return
+        stat = path.stat()
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+        }
+        start, end = 0, stat.st_size
+        status = 200
+        if range_header:
+            if (byte_range := parse_range(range_header, stat.st_size)) is None:
+                headers["Content-Range"] = f"bytes */{stat.st_size}"
+                self.finish_response(416, headers, b"", range_header)
+                return
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{stat.st_size}"
+        headers["Content-Length"] = str(end - start)
+        data = b""
+        if body:
+            with path.open("rb") as f:
+                f.seek(start)
+                data = f.read(end - start)
+        self.finish_response(status, headers, data, range_header)
+
+    def finish_response(
+        self,
+        status: int,
+        headers: dict[str, str],
+        data: bytes,
+        range_header: str | None,
+    ) -> None:
+        # Recorded before anything is sent, so a request is always counted by
+        # the time its client has the response.
+        self.server.record(
+            ObjectRequest(self.command, self.path, range_header, status, len(data))
+        )
+        self.send_response(status)
+        headers.setdefault("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data:
+            if self.server.bandwidth:
+                time.sleep(len(data) / self.server.bandwidth)
+            self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(connection: Connection, *args: Any) -> None:
+    """Runs an :py:class:`ObjectStore`, taking commands from ``connection``."""
+    server = ObjectStore(*args)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection.send(server.server_address[1])
+    while (command := connection.recv()) != "stop":
+        if command == "reset":
+            connection.send(server.reset())
+    server.shutdown()
+    server.server_close()
+    connection.close()
+
+
+class LatencyServer:
+    """Serves a directory like a remote object store, with simulated latency.
+
+    The server runs in its own process, because searches hold the GIL while
+    DuckDB waits on its responses.
+
+    Args:
+        directory: The directory to serve.
+        latency: Seconds added before every response, i.e. the round trip.
+        bandwidth: Bytes per second that response bodies are sent at, or None
+            for no limit.
+        error_rate: The fraction of requests answered with a ``503``.
+        seed: Seeds which requests fail, so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        directory: Path = DATA_DIRECTORY,
+        *,
+        latency: float = 0.0,
+        bandwidth: float | None = None,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.args = (directory.absolute(), latency, bandwidth, error_rate, seed)
+        self.port: int | None = None
+
+    @property
+    def url(self) -> str:
+        if self.port is None:
+            raise RuntimeError("the server isn't running")
+        return f"http://127.0.0.1:{self.port}"
+
+    def href(self, name: str) -> str:
+        """Returns the href of a file in the served directory."""
+        return f"{self.url}/{name}"
+
+    def __enter__(self) -> "LatencyServer":
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=serve, args=(child, *self.args), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.port = self.connection.recv()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.connection.send("stop")
+        self.process.join()
+        self.process.close()
+        self.connection.close()
+        self.port = None
+
+    def reset(self) -> list[ObjectRequest]:
+        """Returns the requests answered since the last reset, and forgets them."""
+        self.connection.send("reset")
+        return cast(list[ObjectRequest], self.connection.recv())
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parses a single-range ``Range`` header into a ``[start, end)`` pair."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= end:
+        return None
+    return start, end
+
+
+def create_client(server: LatencyServer, **settings: Any) -> TestClient:
+    """Creates an app whose collections and data are read from ``server``."""
+    api = stac_fastapi.geoparquet.api.create(
+        Settings(
+            stac_fastapi_collections_href=server.href("collections.json"),
+            **settings,
+        )
+    )
+    return TestClient(api.app)
+
+
+def replay(
+    client: TestClient, server: LatencyServer, requests: Iterable[dict[str, Any]]
+) -> Iterator[dict[str, Any]]:
+    """Replays a request log, reporting each request's remote I/O.
+
+    Each logged request has a ``method`` (default ``GET``), a ``path`` that
+    may include a query string, and for POSTs a JSON ``body``.  Requests are
+    sent one at a time, so the object store requests between one response
+    and the next are attributed to it.
+    """
+    for request in requests:
+        server.reset()
+        started = time.perf_counter()
+        response = client.request(
+            request.get("method", "GET"), request["path"], json=request.get("body")
+        )
+        seconds = time.perf_counter() - started
+        object_requests = server.reset()
+        yield {
+            "request": request,
+            "status": response.status_code,
+            "seconds": seconds,
+            "object_requests": len(object_requests),
+            "object_bytes": sum(r.bytes for r in object_requests),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay a request log against data/ served as a remote store"
+    )
+    parser.add_argument("log", type=Path, help="JSON lines of requests")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--bandwidth", type=float, help="bytes per second")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    requests = [
+        json.loads(line) for line in args.log.read_text().splitlines() if line.strip()
+    ]
+    with LatencyServer(
+        latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate
+    ) as server:
+        with create_client(server) as client:
+            for result in replay(client, server, requests):
+                print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
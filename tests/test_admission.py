@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio
+import anyio.to_thread
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.admission import AdmissionController
+
+from .conftest import COLLECTIONS_PATH, NAIP_PATH
+
+
+def test_estimate_cost() -> None:
+    admission = AdmissionController(Settings())
+    hrefs = [str(NAIP_PATH)]
+    assert admission.size(str(NAIP_PATH)) > 0
+    assert admission.estimate_cost(hrefs, 10) < admission.estimate_cost(hrefs, 100)
+    assert admission.estimate_cost(hrefs, 10) < admission.estimate_cost(
+        hrefs, 10, has_filter=True
+    )
+    assert admission.estimate_cost(hrefs, 10) < admission.estimate_cost(hrefs * 2, 10)
+    assert admission.estimate_cost(hrefs, 10_000, ids=["an-id"]) < 10
+    assert admission.estimate_cost([], 10_000) == 0
+
+
+def test_unknown_size() -> None:
+    admission = AdmissionController(Settings())
+    assert admission.size("not-a-file.parquet") == 0
+
+
+def test_busy() -> None:
+    admission = AdmissionController(
+        Settings(stac_fastapi_admission_cheap_concurrency=2)
+    )
+
+    async def search() -> None:
+        assert not admission.busy()
+        async with admission.admit(1):
+            assert admission.busy()
+        assert not admission.busy()
+
+    anyio.run(search)
+
+
+def test_queued_searches_leave_the_threadpool_free() -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_admission_cheap_concurrency=1,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        assert client.portal is not None
+
+        async def use_one_thread() -> None:
+            anyio.to_thread.current_default_thread_limiter().total_tokens = 1
+
+        client.portal.call(use_one_thread)
+        admission: AdmissionController = api.app.state.admission
+        slot = admission.admit(1)
+        client.portal.call(slot.__aenter__)
+        with ThreadPoolExecutor(1) as executor:
+            queued = executor.submit(client.get, "/search", params={"limit": 1})
+            while not admission.waiting:
+                time.sleep(0.01)
+            # The queued search doesn't hold the only worker thread.
+            assert client.get("/collections").status_code == 200
+            assert not queued.done()
+            client.portal.call(slot.__aexit__, None, None, None)
+            assert queued.result().status_code == 200
+
+
+def test_expensive_search_rejected() -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_admission_expensive_concurrency=0,
+        stac_fastapi_admission_queue_seconds=0,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        response = client.get("/search", params={"limit": 10_000})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        response = client.get("/collections/naip/items/ne_m_4110264_sw_13_060_20220827")
+        assert response.status_code == 200, response.text
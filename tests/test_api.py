@@ -1,9 +1,11 @@
+import json
 from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
+from pydantic import ValidationError
 from rustac import DuckdbClient
 
 import stac_fastapi.geoparquet.api
@@ -28,6 +30,41 @@ def test_create(extension_directory: Path) -> None:
         assert response.status_code == 200
 
 
+def test_create_with_duckdb_settings(tmp_path: Path) -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_duckdb_threads=2,
+        stac_fastapi_duckdb_memory_limit="512MB",
+        stac_fastapi_duckdb_temp_directory=str(tmp_path / "it's spilled"),
+        stac_fastapi_duckdb_parquet_metadata_cache=True,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings=settings)
+    duckdb_client: DuckdbClient = api.app.extra["duckdb_client"]
+    table = duckdb_client.query_to_table(
+        "SELECT current_setting('threads') AS threads, "
+        "current_setting('memory_limit') AS memory_limit, "
+        "current_setting('temp_directory') AS temp_directory, "
+        "current_setting('parquet_metadata_cache') AS parquet_metadata_cache"
+    )
+    assert table.to_struct_array().to_pylist() == [
+        {
+            "threads": 2,
+            "memory_limit": "488.2 MiB",
+            "temp_directory": str(tmp_path / "it's spilled"),
+            "parquet_metadata_cache": True,
+        }
+    ]
+    with TestClient(api.app) as client:
+        response = client.get("/search", params={"sortby": "-datetime"})
+        assert response.status_code == 200
+
+
+@pytest.mark.parametrize("memory_limit", ["lots", "512", "-1GB"])
+def test_invalid_duckdb_memory_limit(memory_limit: str) -> None:
+    with pytest.raises(ValidationError):
+        Settings(stac_fastapi_duckdb_memory_limit=memory_limit)
+
+
 def test_create_from_parquet_file() -> None:
     settings = Settings(stac_fastapi_geoparquet_href=str(NAIP_PATH))
     api = stac_fastapi.geoparquet.api.create(settings=settings)
@@ -66,6 +103,58 @@ def test_collections_reload_on_ttl_expiry() -> None:
         assert response.json()["collections"] == []
 
 
+def test_collections_reload_is_incremental() -> None:
+    settings = Settings(stac_fastapi_collections_href=str(COLLECTIONS_PATH))
+    api = stac_fastapi.geoparquet.api.create(settings=settings)
+    raw = json.loads(COLLECTIONS_PATH.read_text())
+
+    with TestClient(api.app) as client:
+        client.get("/collections").raise_for_status()
+        state = api.app.state
+        naip, naip_10 = state.collections["naip"], state.collections["naip-10"]
+        index = state.collections_index
+
+        # Nothing changes: collections and the index are kept
+        state.collections_last_updated = datetime.now() - timedelta(seconds=120)
+        with patch(
+            "stac_fastapi.geoparquet.api.load_collections",
+            new_callable=AsyncMock,
+            return_value=raw,
+        ):
+            client.get("/collections")
+        assert state.collections["naip"] is naip
+        assert state.collections_index is index
+
+        # One collection changes: only it is replaced
+        raw[0]["description"] = "An updated description"
+        state.collections_last_updated = datetime.now() - timedelta(seconds=120)
+        with patch(
+            "stac_fastapi.geoparquet.api.load_collections",
+            new_callable=AsyncMock,
+            return_value=raw,
+        ):
+            client.get("/collections")
+        assert state.collections["naip"] is not naip
+        assert state.collections["naip-10"] is naip_10
+        assert state.collections_index is not index
+        response = client.get("/collections/naip")
+        assert response.json()["description"] == "An updated description"
+
+
+def test_diff_collections() -> None:
+    diff = stac_fastapi.geoparquet.api._diff_collections(
+        {"a": {"id": "a"}, "b": {"id": "b"}, "c": {"id": "c"}},
+        {"a": "a.parquet", "b": "b.parquet"},
+        {"b": {"id": "b", "title": "B"}, "c": {"id": "c"}, "d": {"id": "d"}},
+        {"b": "b.parquet", "c": "c.parquet", "d": "d.parquet"},
+    )
+    assert diff.added == {"d"}
+    assert diff.removed == {"a"}
+    assert diff.changed == {"b"}
+    assert diff.hrefs_changed == {"a", "c", "d"}
+    assert not diff.empty
+
+
 def test_collections_no_reload_within_ttl() -> None:
     settings = Settings(
         stac_fastapi_collections_href=str(COLLECTIONS_PATH),
@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+
+from stac_fastapi.geoparquet.batch import ItemReference, group_ids
+
+
+def test_group_ids() -> None:
+    references = [
+        ItemReference(collection="a", id="1"),
+        ItemReference(collection="b", id="2"),
+        ItemReference(collection="a", id="3"),
+        ItemReference(collection="a", id="1"),
+    ]
+    assert group_ids(references) == {"a": ["1", "3"], "b": ["2"]}
+
+
+def test_get_items(client: TestClient) -> None:
+    ids = [
+        item["id"]
+        for item in client.get(
+            "/search", params={"collections": "naip", "limit": 50}
+        ).json()["features"]
+    ]
+    references = [{"collection": "naip", "id": id} for id in ids]
+    references.append({"collection": "naip-10", "id": ids[0]})
+    references.append({"collection": "naip", "id": "not-an-item"})
+    response = client.post("/items", json={"items": references})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/geo+json"
+    data = response.json()
+    assert data["type"] == "FeatureCollection"
+    assert sorted((item["collection"], item["id"]) for item in data["features"]) == (
+        sorted([("naip", id) for id in ids] + [("naip-10", ids[0])])
+    )
+    link = next(link for link in data["features"][0]["links"] if link["rel"] == "self")
+    assert link["href"].endswith(f"/collections/naip/items/{ids[0]}")
+
+
+def test_get_items_empty(client: TestClient) -> None:
+    response = client.post("/items", json={"items": []})
+    assert response.status_code == 200, response.text
+    assert response.json()["features"] == []
+
+
+def test_get_items_errors(client: TestClient) -> None:
+    response = client.post(
+        "/items", json={"items": [{"collection": "not-a-collection", "id": "a"}]}
+    )
+    assert response.status_code == 404
+    response = client.post(
+        "/items",
+        json={"items": [{"collection": "naip", "id": str(i)} for i in range(10_001)]},
+    )
+    assert response.status_code == 400
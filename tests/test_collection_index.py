@@ -0,0 +1,41 @@
+from typing import Any
+
+from stac_fastapi.geoparquet.collection_index import CollectionIndex
+
+
+def collection(id: str, bbox: list[float], **kwargs: Any) -> dict[str, Any]:
+    return {
+        "id": id,
+        "extent": {
+            "spatial": {"bbox": [bbox]},
+            "temporal": {"interval": [[None, None]]},
+        },
+        **kwargs,
+    }
+
+
+def test_antimeridian() -> None:
+    index = CollectionIndex(
+        [
+            collection("fiji", [177, -20, -178, -15]),
+            collection("null-island", [0, 0, 0, 0]),
+        ]
+    )
+    assert index.search(bbox=[-179, -18, -179, -18]) == ["fiji"]
+    assert index.search(bbox=[178, -18, 179, -17]) == ["fiji"]
+    assert index.search(bbox=[-1, -1, 1, 1]) == ["null-island"]
+    assert index.search(bbox=[170, -19, -170, -16]) == ["fiji"]
+
+
+def test_text() -> None:
+    index = CollectionIndex(
+        [
+            collection("a", [0, 0, 1, 1], title="Sentinel-2 Level-2A"),
+            collection("b", [0, 0, 1, 1], keywords=["landsat", "USGS"]),
+        ]
+    )
+    assert index.search(q=["sentinel"]) == ["a"]
+    assert index.search(q=["level 2a"]) == ["a"]
+    assert index.search(q=["level 2b"]) == []
+    assert index.search(q=["usgs", "sentinel"]) == ["a", "b"]
+    assert index.search(q=["usgs"], bbox=[2, 2, 3, 3]) == []
@@ -11,3 +11,42 @@ def test_get_collection(client: TestClient) -> None:
 
     response = client.get("/collections/not-a-collection")
     assert response.status_code == 404
+
+
+def test_collection_search(client: TestClient) -> None:
+    def search(**params: str) -> list[str]:
+        response = client.get("/collections", params=params)
+        assert response.status_code == 200, response.text
+        return [c["id"] for c in response.json()["collections"]]
+
+    assert search() == ["naip", "naip-10", "openaerialmap-10", "openaerialmap"]
+    assert search(q="naip") == ["naip", "naip-10"]
+    assert search(q="openaerialmap,10") == [
+        "naip-10",
+        "openaerialmap-10",
+        "openaerialmap",
+    ]
+    assert search(bbox="-109,37,-108,38") == ["naip", "openaerialmap"]
+    assert search(datetime="2021-01-01T00:00:00Z/2021-12-31T23:59:59Z") == [
+        "naip",
+        "openaerialmap",
+    ]
+    assert search(q="naip", datetime="2022-08-20T00:00:00Z") == ["naip", "naip-10"]
+
+
+def test_collection_search_paging(client: TestClient) -> None:
+    response = client.get("/collections", params={"limit": 3})
+    response.raise_for_status()
+    data = response.json()
+    assert [c["id"] for c in data["collections"]] == [
+        "naip",
+        "naip-10",
+        "openaerialmap-10",
+    ]
+    assert data["numberMatched"] == 4
+    assert data["numberReturned"] == 3
+    next_link = next(link for link in data["links"] if link["rel"] == "next")
+    data = client.get(next_link["href"]).json()
+    assert [c["id"] for c in data["collections"]] == ["openaerialmap"]
+    assert not any(link["rel"] == "next" for link in data["links"])
+    assert any(link["rel"] == "prev" for link in data["links"])
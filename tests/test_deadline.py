@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.types import Message, Receive, Scope, Send
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.deadline import Deadline, DeadlineMiddleware
+
+from .conftest import COLLECTIONS_PATH
+
+
+def test_deadline() -> None:
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    deadline.check()
+
+    deadline = Deadline(0)
+    with pytest.raises(HTTPException) as e:
+        deadline.check()
+    assert e.value.status_code == 504
+
+    deadline = Deadline(60)
+    deadline.cancel()
+    with pytest.raises(HTTPException) as e:
+        deadline.check()
+    assert e.value.status_code == 499
+
+
+def test_wait() -> None:
+    future: Future[int] = Future()
+    future.set_result(1)
+    assert Deadline().wait(future) == 1
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as e:
+        Deadline(0.1).wait(Future())
+    assert e.value.status_code == 504
+    assert time.monotonic() - started < 1
+
+    deadline = Deadline()
+    threading.Timer(0.1, deadline.cancel).start()
+    with pytest.raises(HTTPException) as e:
+        deadline.wait(Future())
+    assert e.value.status_code == 499
+
+
+def test_query_timeout_header(client: TestClient) -> None:
+    response = client.get("/search", headers={"X-Query-Timeout": "0.000001"})
+    assert response.status_code == 504
+
+    response = client.get("/search", headers={"X-Query-Timeout": "not-a-number"})
+    assert response.status_code == 400
+
+    response = client.get("/search", headers={"X-Query-Timeout": "-1"})
+    assert response.status_code == 400
+
+    response = client.get("/search", headers={"X-Query-Timeout": "60"})
+    assert response.status_code == 200
+
+
+def test_query_timeout_capped() -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_query_timeout_seconds=1e-6,
+        stac_fastapi_query_timeout_max_seconds=1e-6,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        assert client.get("/search").status_code == 504
+        response = client.get("/search", headers={"X-Query-Timeout": "60"})
+        assert response.status_code == 504
+
+
+async def test_cancel_on_disconnect() -> None:
+    deadlines: list[Deadline] = []
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        assert (await receive())["type"] == "http.request"
+        deadline = scope["state"]["deadline"]
+        deadlines.append(deadline)
+        for _ in range(100):
+            if deadline.cancelled.is_set():
+                return
+            await asyncio.sleep(0.01)
+
+    messages: list[Message] = [
+        {"type": "http.request", "body": b"", "more_body": False},
+        {"type": "http.disconnect"},
+    ]
+
+    async def receive() -> Message:
+        return messages.pop(0)
+
+    async def send(message: Message) -> None:
+        pass
+
+    middleware = DeadlineMiddleware(app, Settings())
+    await middleware({"type": "http", "headers": []}, receive, send)
+    assert deadlines[0].cancelled.is_set()
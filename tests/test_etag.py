@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+
+from .conftest import COLLECTIONS_PATH, NAIP_PATH
+
+
+def test_etag(client: TestClient) -> None:
+    response = client.get("/collections/naip/items", params={"limit": 1})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert "last-modified" in response.headers
+    assert "cache-control" not in response.headers
+
+    response = client.get(
+        "/collections/naip/items",
+        params={"limit": 1},
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get(
+        "/collections/naip/items",
+        params={"limit": 1},
+        headers={"If-None-Match": '"something-else"'},
+    )
+    assert response.status_code == 200
+
+
+def test_etag_covers_touched_hrefs(client: TestClient) -> None:
+    naip = client.get("/search", params={"collections": "naip"}).headers["etag"]
+    both = client.get("/search", params={"collections": "naip,naip-10"})
+    assert both.headers["etag"] != naip
+    assert "etag" in client.get("/collections").headers
+    assert "etag" in client.get("/collections/naip").headers
+    assert "etag" not in client.post("/search", json={}).headers
+
+
+@pytest.mark.parametrize("path", ["/collections/nope", "/collections/nope/items"])
+def test_unknown_collection_is_not_modified(client: TestClient, path: str) -> None:
+    response = client.get(path, headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+    assert "etag" not in response.headers
+
+
+def test_etag_changes_with_data(tmp_path: Path) -> None:
+    href = tmp_path / "naip.parquet"
+    shutil.copyfile(NAIP_PATH, href)
+    collections = json.loads(COLLECTIONS_PATH.read_text())
+    collection = next(c for c in collections if c["id"] == "naip")
+    for asset in collection["assets"].values():
+        asset["href"] = str(href)
+    collections_path = tmp_path / "collections.json"
+    collections_path.write_text(json.dumps([collection]))
+    settings = Settings(
+        stac_fastapi_collections_href=str(collections_path),
+        stac_fastapi_collections_reload_seconds=0,
+        stac_fastapi_cache_control="public, max-age=60",
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        response = client.get("/collections/naip/items", params={"limit": 1})
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "public, max-age=60"
+
+        stat = href.stat()
+        os.utime(href, (stat.st_atime + 60, stat.st_mtime + 60))
+        # The first request after the change triggers the reload
+        client.get("/collections")
+
+        response = client.get(
+            "/collections/naip/items",
+            params={"limit": 1},
+            headers={"If-None-Match": etag},
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+
+from .conftest import ADMIN_SECRET, COLLECTIONS_PATH
+
+
+def test_explain(admin_client: TestClient) -> None:
+    response = admin_client.post(
+        "/search/explain",
+        json={"collections": ["naip"], "bbox": [-105, 40, -104, 41], "limit": 5},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert "features" not in data
+    (explanation,) = data["collections"]
+    assert explanation["collection"] == "naip"
+    assert "read_parquet" in explanation["sql"]
+    assert explanation["returned"] == 5
+    assert explanation["rows"]["total"] == 10000
+    assert 0 < explanation["bytes"]["read"] < explanation["bytes"]["total"]
+    assert explanation["row_groups"] == {"matching_statistics": 1, "total": 1}
+    assert explanation["plan"][0]["operator"]
+
+
+def test_explain_pruned(admin_client: TestClient) -> None:
+    response = admin_client.post(
+        "/search/explain",
+        json={"collections": ["naip", "naip-10"], "bbox": [0, 0, 1, 1]},
+    )
+    assert response.status_code == 200, response.text
+    explanations = response.json()["collections"]
+    assert [e["collection"] for e in explanations] == ["naip", "naip-10"]
+    for explanation in explanations:
+        assert explanation["returned"] == 0
+        assert explanation["row_groups"]["matching_statistics"] == 0
+
+
+def test_explain_datetime(admin_client: TestClient) -> None:
+    response = admin_client.post(
+        "/search/explain",
+        json={
+            "collections": ["naip"],
+            "datetime": "1900-01-01T00:00:00Z/1901-01-01T00:00:00Z",
+        },
+    )
+    assert response.json()["collections"][0]["row_groups"]["matching_statistics"] == 0
+
+
+def test_explain_is_off_by_default(client: TestClient) -> None:
+    response = client.post("/search/explain", json={"collections": ["naip"]})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer not-the-secret", ADMIN_SECRET])
+def test_explain_requires_admin_secret(authorization: str | None) -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_admin_secret=ADMIN_SECRET,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    headers = {"Authorization": authorization} if authorization else {}
+    with TestClient(api.app) as client:
+        response = client.post(
+            "/search/explain", json={"collections": ["naip"]}, headers=headers
+        )
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_explain_intersects(admin_client: TestClient) -> None:
+    response = admin_client.post(
+        "/search/explain",
+        json={
+            "collections": ["naip"],
+            "intersects": {
+                "type": "Polygon",
+                "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]],
+            },
+        },
+    )
+    assert response.status_code == 200, response.text
+    (explanation,) = response.json()["collections"]
+    # The same bbox prefilter that /search runs, not rustac's query.
+    assert "bbox.xmin <=" in explanation["sql"]
+    assert "ST_GeomFromGeoJSON" in explanation["sql"]
+    assert explanation["returned"] == 0
+    assert explanation["row_groups"]["matching_statistics"] == 0
+    assert not explanation["range_reads"]
@@ -0,0 +1,168 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from rustac import DuckdbClient
+
+import stac_fastapi.geoparquet.freetext
+from stac_fastapi.geoparquet.collection_index import tokenize
+from stac_fastapi.geoparquet.freetext import TextIndex
+
+from .conftest import COLLECTIONS_PATH
+
+OPENAERIALMAP_PATH = COLLECTIONS_PATH.parent / "openaerialmap.parquet"
+
+
+def test_text_index() -> None:
+    index = TextIndex(
+        ids=["a", "b", "c"],
+        texts=[
+            ["Coastal flooding", None, ["ocean"]],
+            ["Inland flooding", "A river", None],
+            [None, None, ["ocean", "coast"]],
+        ],
+        positional=True,
+    )
+    assert index.search(["flooding"]) == [0, 1]
+    assert index.search(["coastal flooding"]) == [0]
+    assert index.search(["river", "coast"]) == [1, 2]
+    assert index.search(["OCEAN"]) == [0, 2]
+    assert index.search(["ocean"], ids=["c"]) == [2]
+    assert index.search(["desert"]) == []
+
+
+def expected_ids(*terms: str) -> list[str]:
+    rows = (
+        DuckdbClient()
+        .query_to_table(
+            "SELECT id, title FROM read_parquet(?)", [str(OPENAERIALMAP_PATH)]
+        )
+        .to_struct_array()
+        .to_pylist()
+    )
+    return [
+        row["id"]
+        for row in rows
+        if any(
+            set(tokenize(term)) <= set(tokenize(row["title"] or "")) for term in terms
+        )
+    ]
+
+
+@pytest.mark.parametrize("q", ["london", "Taichung river", "denver,london", "zzz"])
+def test_search_q(client: TestClient, q: str) -> None:
+    response = client.get(
+        "/search", params={"collections": "openaerialmap", "q": q, "limit": 10_000}
+    )
+    assert response.status_code == 200, response.text
+    ids = [item["id"] for item in response.json()["features"]]
+    assert ids == expected_ids(*q.split(","))
+
+
+def test_post_search_q(client: TestClient) -> None:
+    response = client.post(
+        "/search",
+        json={
+            "collections": ["openaerialmap"],
+            "q": ["london", "denver"],
+            "limit": 10_000,
+        },
+    )
+    assert response.status_code == 200, response.text
+    ids = [item["id"] for item in response.json()["features"]]
+    assert ids == expected_ids("london", "denver")
+
+
+def test_item_collection_q(client: TestClient) -> None:
+    response = client.get("/collections/openaerialmap/items", params={"q": "london"})
+    assert response.status_code == 200, response.text
+    ids = [item["id"] for item in response.json()["features"]]
+    assert ids == expected_ids("london")[:10]
+
+
+def test_search_q_paging(client: TestClient) -> None:
+    params: dict[str, str] | None = {
+        "collections": "openaerialmap",
+        "q": "london",
+        "limit": "100",
+    }
+    ids = []
+    url: str | None = "/search"
+    while url:
+        response = client.get(url, params=params)
+        assert response.status_code == 200, response.text
+        ids.extend(item["id"] for item in response.json()["features"])
+        url = next(
+            (
+                link["href"]
+                for link in response.json()["links"]
+                if link["rel"] == "next"
+            ),
+            None,
+        )
+        params = None
+    assert ids == expected_ids("london")
+
+
+def test_search_q_with_other_parameters(client: TestClient) -> None:
+    london = expected_ids("london")
+    response = client.get(
+        "/search",
+        params={
+            "collections": "openaerialmap",
+            "q": "denver,london",
+            "ids": ",".join([london[0], "not-an-item"]),
+            "limit": 10_000,
+        },
+    )
+    assert [item["id"] for item in response.json()["features"]] == [
+        id for id in expected_ids("denver", "london") if id == london[0]
+    ]
+
+    # Filters go through rustac, narrowed to the matching ids.
+    response = client.get(
+        "/search",
+        params={
+            "collections": "openaerialmap",
+            "q": "denver,london",
+            "filter": "platform = 'UAV'",
+            "limit": 10_000,
+        },
+    )
+    assert response.status_code == 200, response.text
+    features = response.json()["features"]
+    assert len(features) == len(london)
+    for item in features:
+        assert item["properties"]["platform"] == "UAV"
+        assert "london" in tokenize(item["properties"]["title"])
+
+
+def test_search_q_without_text_columns(client: TestClient) -> None:
+    response = client.get("/search", params={"collections": "naip", "q": "naip"})
+    assert response.status_code == 200, response.text
+    assert response.json()["features"] == []
+
+
+def test_text_index_is_cached(client: TestClient) -> None:
+    with patch.object(
+        stac_fastapi.geoparquet.freetext,
+        "build",
+        wraps=stac_fastapi.geoparquet.freetext.build,
+    ) as build:
+        for q in ("london", "denver"):
+            response = client.get(
+                "/search", params={"collections": "openaerialmap", "q": q}
+            )
+            assert response.status_code == 200, response.text
+    assert build.call_count == 1
+
+
+def test_search_q_reads_matching_rows(admin_client: TestClient) -> None:
+    response = admin_client.post(
+        "/search/explain",
+        json={"collections": ["openaerialmap"], "q": ["taichung"], "limit": 5},
+    )
+    assert response.status_code == 200, response.text
+    explanation = response.json()["collections"][0]
+    assert "file_row_number IN" in explanation["sql"]
+    assert explanation["returned"] == 5
@@ -0,0 +1,111 @@
+import json
+import urllib.parse
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from rustac import DuckdbClient
+
+from stac_fastapi.geoparquet.intersects import intersects_predicates, prepare
+from stac_fastapi.geoparquet.materialize import search_href
+from stac_fastapi.geoparquet.schema import HrefSchemas
+
+from .conftest import COLLECTIONS_PATH
+
+DATA_PATH = COLLECTIONS_PATH.parent
+
+SQUARE = {
+    "type": "Polygon",
+    "coordinates": [[[-104, 40], [-103, 40], [-103, 41], [-104, 41], [-104, 40]]],
+}
+
+
+def test_prepare() -> None:
+    prepared = prepare(SQUARE)
+    assert prepared.bbox == (-104, 40, -103, 41)
+    assert json.loads(prepared.geojson) == SQUARE
+    assert prepare(json.dumps(SQUARE)) == prepared
+
+    collection = {
+        "type": "GeometryCollection",
+        "geometries": [
+            {"type": "Point", "coordinates": [1, 2]},
+            {"type": "LineString", "coordinates": [[-1, 5], [3, -2]]},
+        ],
+    }
+    assert prepare(collection).bbox == (-1, -2, 3, 5)
+
+
+def test_bbox_first() -> None:
+    where, params = intersects_predicates(prepare(SQUARE), ["bbox", "geometry"])
+    assert where[0].startswith("bbox.")
+    assert where[-1].startswith("ST_Intersects")
+    assert params[:4] == ["-103", "-104", "41", "40"]
+    where, _ = intersects_predicates(prepare(SQUARE), ["geometry"])
+    assert len(where) == 1
+
+
+@pytest.mark.parametrize(
+    "name,search",
+    [
+        ("naip", {"intersects": SQUARE, "limit": 100}),
+        ("naip", {"intersects": SQUARE, "limit": 10, "offset": 20}),
+        (
+            "naip",
+            {
+                "intersects": SQUARE,
+                "datetime": "2021-01-01T00:00:00Z/2021-12-31T23:59:59Z",
+                "limit": 100,
+            },
+        ),
+        (
+            "openaerialmap",
+            {
+                "intersects": {"type": "Point", "coordinates": [-105.0475, 39.94]},
+                "datetime": "2016-06-01T00:00:00Z",
+            },
+        ),
+    ],
+)
+def test_search_href_matches_rustac(name: str, search: dict[str, Any]) -> None:
+    client = DuckdbClient()
+    href = str(DATA_PATH / f"{name}.parquet")
+    expected = client.search(href, **search)
+    columns = HrefSchemas().columns(client, href, None)
+    actual = search_href(client, href, search, columns, prepare(search["intersects"]))
+    assert actual
+
+    def summary(items: list[dict[str, Any]]) -> list[Any]:
+        # Datetimes are formatted differently, e.g. "Z" instead of "+00:00",
+        # and a null datetime is kept rather than dropped.
+        return [
+            (
+                item["id"],
+                item["geometry"],
+                sorted(k for k, v in item["properties"].items() if v is not None),
+            )
+            for item in items
+        ]
+
+    assert summary(actual) == summary(expected)
+
+
+def test_search_href_fallback() -> None:
+    client = DuckdbClient()
+    search = {"intersects": SQUARE, "filter": "naip:year='2022'"}
+    assert search_href(client, "x.parquet", search, [], prepare(SQUARE)) is None
+
+
+def test_paging_intersects(client: TestClient) -> None:
+    params = {"collections": "naip", "intersects": json.dumps(SQUARE), "limit": 5}
+    response = client.get("/search", params=params)
+    response.raise_for_status()
+    first = [item["id"] for item in response.json()["features"]]
+    next_link = next(link for link in response.json()["links"] if link["rel"] == "next")
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(next_link["href"]).query)
+    assert json.loads(query["intersects"][0]) == SQUARE
+    response = client.get(next_link["href"])
+    response.raise_for_status()
+    second = [item["id"] for item in response.json()["features"]]
+    everything = client.get("/search", params={**params, "limit": 10}).json()
+    assert first + second == [item["id"] for item in everything["features"]]
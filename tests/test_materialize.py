@@ -0,0 +1,117 @@
+import shutil
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from rustac import DuckdbClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.etag import href_versions
+from stac_fastapi.geoparquet.materialize import (
+    MaterializedCollections,
+    table_query,
+    to_items,
+)
+
+from .conftest import COLLECTIONS_PATH, NAIP_PATH
+
+
+@pytest.fixture
+def materialized_client() -> Iterator[TestClient]:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_materialized_collections=["naip", "openaerialmap"],
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        assert set(api.app.state.materialized.tables) == {"naip", "openaerialmap"}
+        yield client
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"limit": 5},
+        {"limit": 5, "offset": 3},
+        {"bbox": "-105,40,-104,41", "limit": 100},
+        {"intersects": '{"type": "Point", "coordinates": [-103.95, 41.03]}'},
+        {"datetime": "2021-01-01T00:00:00Z/2021-12-31T23:59:59Z", "limit": 100},
+        {"datetime": "../2021-09-09T16:00:00Z", "limit": 100},
+        {"filter": "naip:year='2022'", "limit": 5},
+        {
+            "collections": "openaerialmap",
+            "datetime": "2021-01-01T00:00:00Z/2021-12-31T23:59:59Z",
+            "limit": 1000,
+        },
+        {
+            "collections": "openaerialmap",
+            "datetime": "2015-01-01T00:00:00Z/2025-01-01T00:00:00Z",
+            "limit": 1000,
+        },
+        {
+            "collections": "openaerialmap",
+            "datetime": "../2018-01-01T00:00:00Z",
+            "limit": 1000,
+        },
+    ],
+)
+def test_search_matches_href(
+    client: TestClient, materialized_client: TestClient, params: dict[str, str]
+) -> None:
+    params = {"collections": "naip", **params}
+    expected = client.get("/search", params=params).raise_for_status().json()
+    actual = materialized_client.get("/search", params=params).raise_for_status().json()
+    assert actual["features"]
+    assert actual["features"] == expected["features"]
+
+
+def test_get_item(materialized_client: TestClient) -> None:
+    response = materialized_client.get(
+        "/collections/naip/items/ne_m_4110264_sw_13_060_20220827"
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["collection"] == "naip"
+
+
+@pytest.mark.parametrize("name", ["naip.parquet", "openaerialmap.parquet"])
+def test_to_items_matches_rustac(name: str) -> None:
+    href = str(COLLECTIONS_PATH.parent / name)
+    client = DuckdbClient()
+    table = client.query_to_table(
+        "SELECT * REPLACE (ST_AsWKB(geometry) AS geometry) FROM read_parquet(?)",
+        [href],
+    )
+    assert to_items(table) == client.search(href)
+
+
+def test_table_query_fallback() -> None:
+    assert table_query("t", {"limit": 1, "include": [], "exclude": []}, ())
+    assert table_query("t", {"filter": "naip:year='2022'"}, ()) is None
+    assert table_query("t", {"sortby": [{"field": "datetime"}]}, ()) is None
+    assert table_query("t", {"include": ["id"]}, ()) is None
+
+
+def test_refresh(tmp_path: Path) -> None:
+    href = str(tmp_path / "naip.parquet")
+    shutil.copy(NAIP_PATH, href)
+    client = DuckdbClient()
+    materialized = MaterializedCollections()
+
+    versions = href_versions([href, str(NAIP_PATH)])
+
+    materialized.refresh(client, {"naip": href}, {"naip"}, versions)
+    table = materialized.tables["naip"]
+    materialized.refresh(client, {"naip": href}, {"naip"}, versions)
+    assert materialized.tables["naip"] is table
+
+    materialized.refresh(client, {"naip": str(NAIP_PATH)}, {"naip"}, versions)
+    assert materialized.tables["naip"].name != table.name
+    assert materialized.retired == [table.name]
+    items = materialized.search(client, "naip", {"limit": 1})
+    assert items and items[0]["id"] == "ne_m_4110264_sw_13_060_20220827"
+
+    materialized.refresh(client, {"naip": str(NAIP_PATH)}, set(), versions)
+    assert materialized.tables == {}
+    assert materialized.search(client, "naip", {"limit": 1}) is None
@@ -0,0 +1,93 @@
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from .objectstore import LatencyServer, create_client, replay
+
+
+def test_range_requests() -> None:
+    with LatencyServer() as server:
+        request = urllib.request.Request(
+            server.href("naip-10.parquet"), headers={"Range": "bytes=0-3"}
+        )
+        with urllib.request.urlopen(request) as response:
+            assert response.status == 206
+            assert response.read() == b"PAR1"
+        (recorded,) = server.reset()
+        assert recorded.range == "bytes=0-3"
+        assert recorded.bytes == 4
+        assert server.reset() == []
+
+
+def test_error_injection() -> None:
+    with LatencyServer(error_rate=1.0) as server:
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(server.href("naip-10.parquet"))
+        assert excinfo.value.code == 503
+        excinfo.value.close()
+
+
+def test_search_reads() -> None:
+    size = (Path(__file__).parents[1] / "data" / "naip-10.parquet").stat().st_size
+    with LatencyServer(latency=0.01) as server:
+        with create_client(server) as client:
+            server.reset()
+            response = client.get("/search", params={"collections": "naip-10"})
+            assert response.status_code == 200
+            assert len(response.json()["features"]) == 10
+            requests = server.reset()
+    gets = [request for request in requests if request.method == "GET"]
+    assert all(request.range for request in gets), "unranged read of a whole file"
+    assert len(gets) <= 2
+    assert sum(request.bytes for request in gets) <= size
+    assert len(requests) - len(gets) <= 3
+
+
+def test_replay() -> None:
+    log = [
+        {"path": "/collections"},
+        {"path": "/search?collections=naip-10&limit=1"},
+        {"method": "POST", "path": "/search", "body": {"collections": ["naip-10"]}},
+    ]
+    with LatencyServer(latency=0.01) as server:
+        with create_client(server) as client:
+            results = list(replay(client, server, log))
+    assert [result["status"] for result in results] == [200, 200, 200]
+    assert results[0]["object_requests"] == 0
+    assert results[1]["object_requests"] > 0
+    assert results[1]["object_bytes"] > 0
+
+
+def test_versions_are_looked_up_once() -> None:
+    with LatencyServer() as server:
+        with create_client(server, stac_fastapi_range_reads=True) as client:
+            heads = [
+                request.path for request in server.reset() if request.method == "HEAD"
+            ]
+            # Schemas are read by DuckDB, which does its own HEAD.
+            client.get("/collections/openaerialmap/queryables")
+            server.reset()
+            response = client.get("/search", params={"collections": "openaerialmap"})
+            assert response.status_code == 200
+            searched = server.reset()
+    assert heads and len(heads) == len(set(heads))
+    assert not [request for request in searched if request.method == "HEAD"]
+
+
+def test_query_timeout_during_range_reads() -> None:
+    with LatencyServer(latency=1.0) as server:
+        with create_client(server, stac_fastapi_range_reads=True) as client:
+            # DuckDB reads schemas itself, and can't be interrupted.
+            client.get("/collections/naip-10/queryables")
+            started = time.monotonic()
+            response = client.get(
+                "/search",
+                params={"collections": "naip-10"},
+                headers={"X-Query-Timeout": "0.2"},
+            )
+            seconds = time.monotonic() - started
+    assert response.status_code == 504
+    assert seconds < 0.9
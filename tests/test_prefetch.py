@@ -0,0 +1,81 @@
+import time
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.prefetch import PrefetchMiddleware, cache_key
+
+from .conftest import COLLECTIONS_PATH
+
+
+@pytest.fixture
+def prefetch_client() -> Iterator[TestClient]:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_prefetch=True,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        yield client
+
+
+def wait_for_prefetch(client: TestClient) -> None:
+    middleware = client.app.middleware_stack  # type: ignore[attr-defined]
+    while not isinstance(middleware, PrefetchMiddleware):
+        middleware = middleware.app
+    deadline = time.monotonic() + 10
+    while middleware.tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def next_link(response: Any) -> dict[str, Any]:
+    return next(link for link in response.json()["links"] if link["rel"] == "next")
+
+
+def test_cache_key_ignores_json_formatting() -> None:
+    assert cache_key("POST", "h", "/search", "", b'{"a": 1, "b": 2}') == cache_key(
+        "POST", "h", "/search", "", b'{"b":2,"a":1}'
+    )
+
+
+def test_get_prefetch(prefetch_client: TestClient) -> None:
+    response = prefetch_client.get("/search", params={"limit": 1})
+    assert "x-prefetch" not in response.headers
+    wait_for_prefetch(prefetch_client)
+
+    link = next_link(response)
+    response = prefetch_client.get(link["href"])
+    assert response.status_code == 200
+    assert response.headers["x-prefetch"] == "hit"
+    assert response.json()["features"][0]["id"] == "ne_m_4110263_sw_13_060_20220820"
+    wait_for_prefetch(prefetch_client)
+
+    # Serving a prefetched page prefetches the one after it
+    response = prefetch_client.get(next_link(response)["href"])
+    assert response.headers["x-prefetch"] == "hit"
+    wait_for_prefetch(prefetch_client)
+
+    # Prefetched pages are only served once
+    response = prefetch_client.get(link["href"])
+    assert "x-prefetch" not in response.headers
+
+
+def test_post_prefetch(prefetch_client: TestClient) -> None:
+    response = prefetch_client.post(
+        "/search", json={"collections": ["naip"], "limit": 2}
+    )
+    wait_for_prefetch(prefetch_client)
+    link = next_link(response)
+    response = prefetch_client.post(link["href"], json=link["body"])
+    assert response.headers["x-prefetch"] == "hit"
+    assert len(response.json()["features"]) == 2
+
+
+def test_no_prefetch_by_default(client: TestClient) -> None:
+    response = client.get("/search", params={"limit": 1})
+    response = client.get(next_link(response)["href"])
+    assert "x-prefetch" not in response.headers
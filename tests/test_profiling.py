@@ -0,0 +1,132 @@
+import asyncio
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.profiling import Profile, ProfilingMiddleware
+
+from .conftest import COLLECTIONS_PATH
+
+SECRET = "let-me-profile"
+
+
+def profiling_client(**kwargs: str) -> Iterator[TestClient]:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_profiling_secret=SECRET,
+        **kwargs,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        yield client
+
+
+@pytest.fixture
+def profiled_client() -> Iterator[TestClient]:
+    yield from profiling_client()
+
+
+def test_not_profiled_without_secret(profiled_client: TestClient) -> None:
+    response = profiled_client.get("/search", params={"collections": "naip"})
+    assert response.status_code == 200
+    assert response.json()["type"] == "FeatureCollection"
+
+    response = profiled_client.get(
+        "/search", params={"collections": "naip"}, headers={"X-Profile": "wrong"}
+    )
+    assert response.json()["type"] == "FeatureCollection"
+
+
+def test_not_profiled_by_default(client: TestClient) -> None:
+    response = client.get(
+        "/search", params={"collections": "naip"}, headers={"X-Profile": SECRET}
+    )
+    assert response.json()["type"] == "FeatureCollection"
+
+
+def test_profile_attachment(profiled_client: TestClient) -> None:
+    response = profiled_client.get(
+        "/search", params={"collections": "naip"}, headers={"X-Profile": SECRET}
+    )
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+    profile = response.json()
+    assert profile["status"] == 200
+    assert profile["request"]["path"] == "/search"
+    assert profile["duckdb"][0]["href"].endswith("naip.parquet")
+    assert profile["duckdb"][0]["profile"]["rows_returned"] > 0
+    assert isinstance(profile["stacks"], dict)
+
+
+def test_profile_directory(tmp_path: Path) -> None:
+    for client in profiling_client(stac_fastapi_profiling_directory=str(tmp_path)):
+        response = client.post(
+            "/search", json={"collections": ["naip"]}, headers={"X-Profile": SECRET}
+        )
+        assert response.json()["type"] == "FeatureCollection"
+        path = Path(response.headers["x-profile-location"])
+        assert path.parent == tmp_path
+        assert json.loads(path.read_text())["request"]["method"] == "POST"
+
+
+def profile_streamed(**kwargs: str) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    """Profiles an app that keeps working after its response has started."""
+    seen: dict[str, Any] = {}
+    sent: list[dict[str, Any]] = []
+
+    async def app(scope: dict[str, Any], receive: Any, send: Any) -> None:
+        seen["stream"] = scope["state"].get("stream", True)
+        profile: Profile = scope["state"]["profile"]
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for i in range(3):
+            profile.queries.append({"href": f"{i}.parquet"})
+            await send(
+                {"type": "http.response.body", "body": b"[]", "more_body": i < 2}
+            )
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+
+    middleware = ProfilingMiddleware(
+        app,
+        Settings(
+            stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+            stac_fastapi_profiling_secret=SECRET,
+            **kwargs,
+        ),
+    )
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/search",
+        "headers": [(b"x-profile", SECRET.encode())],
+    }
+    asyncio.run(middleware(scope, None, send))
+    return seen, sent
+
+
+def test_profile_attachment_of_stream() -> None:
+    seen, sent = profile_streamed()
+    assert seen["stream"] is False
+    start, body = sent
+    assert start["status"] == 200
+    profile = json.loads(body["body"])
+    assert len(profile["duckdb"]) == 3
+
+
+def test_profile_directory_of_stream(tmp_path: Path) -> None:
+    seen, sent = profile_streamed(stac_fastapi_profiling_directory=str(tmp_path))
+    assert seen["stream"] is True
+    assert len(sent) == 4
+    (location,) = (
+        value for name, value in sent[0]["headers"] if name == b"x-profile-location"
+    )
+    profile = json.loads(Path(location.decode()).read_text())
+    assert profile["status"] == 200
+    assert len(profile["duckdb"]) == 3
@@ -0,0 +1,126 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from stac_fastapi.geoparquet.queryables import merge, properties
+
+
+def test_collection_queryables(client: TestClient) -> None:
+    response = client.get("/collections/naip/queryables")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/schema+json"
+    queryables = response.json()
+    assert queryables["$id"] == "http://testserver/collections/naip/queryables"
+    props = queryables["properties"]
+    assert "links" not in props and "assets" not in props
+    assert props["geometry"] == {
+        "title": "geometry",
+        "$ref": "https://geojson.org/schema/Geometry.json",
+    }
+    assert props["datetime"] == {
+        "title": "datetime",
+        "type": "string",
+        "format": "date-time",
+        "formatMinimum": "2019-09-19T00:00:00Z",
+        "formatMaximum": "2022-08-27T16:00:00Z",
+    }
+    assert props["proj:epsg"] == {
+        "title": "proj:epsg",
+        "type": "integer",
+        "minimum": 26912,
+        "maximum": 26913,
+    }
+    assert props["gsd"]["enum"] == [0.6]
+    assert props["proj:bbox"]["type"] == "array"
+
+
+def test_collection_queryables_filter(client: TestClient) -> None:
+    props = client.get("/collections/naip/queryables").json()["properties"]
+    response = client.get(
+        "/search",
+        params={
+            "collections": "naip",
+            "filter": f'"proj:epsg" = {props["proj:epsg"]["maximum"]}',
+        },
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["features"]
+
+
+def test_queryables(client: TestClient) -> None:
+    response = client.get("/queryables")
+    assert response.status_code == 200, response.text
+    props = response.json()["properties"]
+    # Only properties that every collection has.
+    assert "proj:epsg" not in props and "platform" not in props
+    assert props["collection"]["enum"] == ["naip", "openaerialmap"]
+    assert props["gsd"]["minimum"] < 0.6 < props["gsd"]["maximum"]
+    assert "enum" not in props["gsd"]
+
+
+def test_collection_queryables_not_found(client: TestClient) -> None:
+    assert client.get("/collections/does-not-exist/queryables").status_code == 404
+
+
+def test_queryables_are_cached(client: TestClient) -> None:
+    with patch(
+        "stac_fastapi.geoparquet.queryables.properties", wraps=properties
+    ) as built:
+        for _ in range(2):
+            assert client.get("/collections/naip/queryables").status_code == 200
+    assert built.call_count == 1
+
+
+def test_properties() -> None:
+    statistics = [
+        {
+            "path_in_schema": "cloud_cover",
+            "stats_min_value": str(minimum),
+            "stats_max_value": str(maximum),
+            "stats_null_count": 0,
+            "num_values": 10,
+        }
+        for minimum, maximum in ((3, 3), (1, 1), (3, 3))
+    ] + [
+        {
+            "path_in_schema": "platform",
+            "stats_min_value": None,
+            "stats_max_value": None,
+            "stats_null_count": 10,
+            "num_values": 10,
+        },
+        {
+            "path_in_schema": "platform",
+            "stats_min_value": "a",
+            "stats_max_value": "b",
+            "stats_null_count": 0,
+            "num_values": 10,
+        },
+    ]
+    props = properties(
+        {"cloud_cover": "BIGINT", "platform": "VARCHAR", "links": "STRUCT(a INT)[]"},
+        statistics,
+    )
+    assert props == {
+        "cloud_cover": {
+            "title": "cloud_cover",
+            "type": "integer",
+            "minimum": 1,
+            "maximum": 3,
+            "enum": [1, 3],
+        },
+        "platform": {"title": "platform", "type": "string"},
+    }
+
+
+def test_merge() -> None:
+    a = {"type": "integer", "minimum": 1, "maximum": 3, "enum": [1, 3]}
+    b = {"type": "integer", "minimum": 2, "maximum": 5, "enum": [2]}
+    assert merge([a, b]) == {
+        "type": "integer",
+        "minimum": 1,
+        "maximum": 5,
+        "enum": [1, 2, 3],
+    }
+    assert merge([a, {"type": "integer"}]) == {"type": "integer"}
+    assert merge([a, {"type": "string"}]) is None
@@ -0,0 +1,231 @@
+import datetime
+import json
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from rustac import DuckdbClient
+
+from stac_fastapi.geoparquet.rangeread import (
+    RowGroup,
+    coalesce,
+    during,
+    interval,
+    overlaps,
+    split,
+)
+
+from .conftest import COLLECTIONS_PATH, NAIP_PATH
+from .objectstore import LatencyServer, create_client
+
+ROW_GROUP_SIZE = 2048
+
+
+def test_coalesce() -> None:
+    ranges = [(100, 200), (0, 10), (15, 20), (205, 300), (1000, 1010)]
+    assert coalesce(ranges, 0) == [
+        (0, 10),
+        (15, 20),
+        (100, 200),
+        (205, 300),
+        (1000, 1010),
+    ]
+    assert coalesce(ranges, 5) == [(0, 20), (100, 300), (1000, 1010)]
+    assert coalesce(ranges, 1000) == [(0, 1010)]
+    assert coalesce([(0, 100), (10, 20)], 0) == [(0, 100)]
+
+
+def test_split() -> None:
+    assert split([(0, 25), (30, 40)], 10) == [(0, 10), (10, 20), (20, 25), (30, 40)]
+    assert split([(5, 5)], 10) == []
+
+
+def test_overlaps() -> None:
+    group = RowGroup(0, 10, [], (-110.0, 36.0, -109.0, 37.0))
+    assert overlaps(group, None)
+    assert overlaps(group, [-109.5, 36.5, -100.0, 40.0])
+    assert not overlaps(group, [-100.0, 36.5, -99.0, 40.0])
+    assert not overlaps(group, [-110.0, 38.0, 0.0, -109.0, 39.0, 10.0])
+    assert overlaps(group, [170.0, 36.5, -109.5, 40.0])
+    assert overlaps(RowGroup(0, 10, [], None), [0.0, 0.0, 1.0, 1.0])
+
+
+def test_during() -> None:
+    def chunk(minimum: str | None, maximum: str | None) -> dict[str, Any]:
+        nulls = 10 if minimum is None else 0
+        return {
+            "stats_min_value": minimum,
+            "stats_max_value": maximum,
+            "stats_null_count": nulls,
+            "num_values": 10,
+        }
+
+    statistics = {
+        "datetime": chunk("2020-01-01 00:00:00+00", "2020-02-01 00:00:00+00"),
+        "end_datetime": chunk("2020-01-02 00:00:00+00", "2020-03-01 00:00:00+00"),
+        "start_datetime": chunk(None, None),
+    }
+    span = interval(statistics)
+    assert span == (
+        datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC),
+        datetime.datetime(2020, 3, 1, tzinfo=datetime.UTC),
+    )
+    group = RowGroup(0, 10, [], None, span)
+    assert during(group, None)
+    assert during(group, "2020-02-15T00:00:00Z/..")
+    assert during(group, "../2020-01-01T00:00:00Z")
+    assert not during(group, "2020-03-02T00:00:00Z/..")
+    assert not during(group, "2019-01-01T00:00:00Z/2019-12-31T00:00:00Z")
+    assert not during(group, "2021-01-01T00:00:00Z")
+    assert interval({"id": chunk("a", "b")}) is None
+
+
+@pytest.fixture(scope="module")
+def directory(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """NAIP, rewritten with several row groups."""
+    directory = tmp_path_factory.mktemp("rangeread")
+    DuckdbClient().execute(
+        f"COPY (SELECT * FROM read_parquet('{NAIP_PATH}')) TO "
+        f"'{directory / 'naip.parquet'}' "
+        f"(FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_SIZE})"
+    )
+    collections = json.loads(COLLECTIONS_PATH.read_text())
+    (directory / "collections.json").write_text(
+        json.dumps([c for c in collections if c["id"] == "naip"])
+    )
+    return directory
+
+
+@pytest.fixture(scope="module")
+def server(directory: Path) -> Iterator[LatencyServer]:
+    with LatencyServer(directory, latency=0.01) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def clients(server: LatencyServer) -> Iterator[tuple[TestClient, TestClient]]:
+    with create_client(server) as client:
+        with create_client(
+            server,
+            stac_fastapi_range_reads=True,
+            stac_fastapi_range_coalesce_bytes=64 * 1024,
+            stac_fastapi_range_part_bytes=128 * 1024,
+        ) as range_client:
+            yield client, range_client
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"limit": "10"},
+        {"limit": "3000"},
+        {"limit": "10000"},
+        {"bbox": "-105,39,-104,40", "limit": "500"},
+        {"datetime": "2021-01-01T00:00:00Z/..", "limit": "2500"},
+        {"ids": "az_m_3610908_ne_12_060_20211103,co_m_3910402_nw_13_060_20210711"},
+        {"bbox": "0,0,1,1"},
+    ],
+)
+def test_search_matches_duckdb(
+    clients: tuple[TestClient, TestClient], params: dict[str, str]
+) -> None:
+    client, range_client = clients
+    params = {"collections": "naip", **params}
+    expected = client.get("/search", params=params)
+    actual = range_client.get("/search", params=params)
+    assert actual.status_code == expected.status_code == 200, actual.text
+    assert actual.json()["features"] == expected.json()["features"]
+
+
+def test_search_pages_match_duckdb(clients: tuple[TestClient, TestClient]) -> None:
+    client, range_client = clients
+    path = "/collections/naip/items?limit=1500"
+    for _ in range(3):
+        expected = client.get(path).json()
+        actual = range_client.get(path).json()
+        assert actual == expected
+        path = next(link["href"] for link in actual["links"] if link["rel"] == "next")
+
+
+def test_search_reads(directory: Path, server: LatencyServer) -> None:
+    size = (directory / "naip.parquet").stat().st_size
+    with create_client(server, stac_fastapi_range_reads=True) as client:
+        server.reset()
+        response = client.get("/search", params={"collections": "naip", "limit": 5})
+        assert response.status_code == 200
+        gets = [
+            request
+            for request in server.reset()
+            if request.method == "GET" and "naip.parquet" in request.path
+        ]
+        assert all(request.range for request in gets), "unranged read of a whole file"
+        # The footer, then the first row group and the next one, prefetched.
+        assert 0 < sum(request.bytes for request in gets) < size * 3 / 5
+        (staged,) = client.app.state.range_reader.files.values()
+        assert len(staged.row_groups) == 5
+        assert sorted(staged.staged) == [0, ROW_GROUP_SIZE]
+
+        # Row groups that are already staged aren't read again, and row groups
+        # whose bboxes are elsewhere aren't read at all.
+        for params in ({"limit": 5}, {"bbox": "0,0,1,1"}):
+            response = client.get("/search", params={"collections": "naip", **params})
+            assert response.status_code == 200
+            assert not [
+                request
+                for request in server.reset()
+                if request.method == "GET" and "naip.parquet" in request.path
+            ]
+        assert sorted(staged.staged) == [0, ROW_GROUP_SIZE]
+
+
+def test_search_prunes_by_intersects_and_datetime(
+    directory: Path, server: LatencyServer
+) -> None:
+    size = (directory / "naip.parquet").stat().st_size
+    with create_client(server, stac_fastapi_range_reads=True) as client:
+        server.reset()
+        for params in (
+            {
+                "intersects": json.dumps(
+                    {
+                        "type": "Polygon",
+                        "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]],
+                    }
+                )
+            },
+            {"datetime": "2000-01-01T00:00:00Z/2001-01-01T00:00:00Z"},
+        ):
+            response = client.get("/search", params={"collections": "naip", **params})
+            assert response.status_code == 200, response.text
+            assert response.json()["features"] == []
+        gets = [
+            request
+            for request in server.reset()
+            if request.method == "GET" and "naip.parquet" in request.path
+        ]
+        # Only the footer is read; no row group overlaps either search.
+        assert sum(request.bytes for request in gets) < size / 5
+        (staged,) = client.app.state.range_reader.files.values()
+        assert not staged.staged
+
+        # The file is sorted by datetime, newest first, so only the last row
+        # group holds items from September 2019.
+        response = client.get(
+            "/search",
+            params={
+                "collections": "naip",
+                "datetime": "2019-09-01T00:00:00Z/2019-10-01T00:00:00Z",
+                "limit": 5,
+            },
+        )
+        assert response.status_code == 200, response.text
+        assert len(response.json()["features"]) == 5
+        gets = [
+            request
+            for request in server.reset()
+            if request.method == "GET" and "naip.parquet" in request.path
+        ]
+        assert sum(request.bytes for request in gets) < size * 2 / 5
+        assert sorted(staged.staged) == [4 * ROW_GROUP_SIZE]
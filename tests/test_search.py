@@ -1,7 +1,14 @@
 import urllib.parse
-from typing import Any
+from typing import Any, cast
 
 from fastapi.testclient import TestClient
+from stac_fastapi.types.stac import Item
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.client import FIRST_BATCH_SIZE, ByteBudget
+
+from .conftest import COLLECTIONS_PATH
 
 
 def test_get_search(client: TestClient) -> None:
@@ -176,3 +183,146 @@ def test_paging_bbox(client: TestClient) -> None:
     next_link = next(link for link in response.json()["links"] if link["rel"] == "next")
     response = client.get(next_link["href"])
     response.raise_for_status()
+
+
+def test_sort_multiple_collections(client: TestClient) -> None:
+    params = {
+        "collections": "naip,naip-10",
+        "filter": "id >= 'ne_m_4110260_sw_13_060_20200707'",
+        "sortby": "id",
+    }
+    everything = client.get("/search", params={**params, "limit": 30}).json()
+    ids = [item["id"] for item in everything["features"]]
+    assert ids == sorted(ids)
+    assert {item["collection"] for item in everything["features"]} == {
+        "naip",
+        "naip-10",
+    }
+
+    items: list[dict[str, Any]] = []
+    next_link: dict[str, Any] | None = {
+        "href": "/search?" + urllib.parse.urlencode({**params, "limit": 3})
+    }
+    while next_link and len(items) < len(ids):
+        response = client.get(next_link["href"])
+        response.raise_for_status()
+        data = response.json()
+        items.extend(data["features"])
+        next_link = next(
+            (link for link in data["links"] if link["rel"] == "next"), None
+        )
+    assert [item["id"] for item in items] == ids
+
+
+def test_sort_multiple_collections_ties(client: TestClient) -> None:
+    # Every naip item in this range has the same datetime.
+    params = {
+        "collections": "naip,openaerialmap-10",
+        "datetime": "2021-09-05T00:00:00Z/2021-09-05T23:59:59Z",
+        "sortby": "datetime",
+        "limit": 100,
+    }
+    items: list[dict[str, Any]] = []
+    next_link: dict[str, Any] | None = {
+        "href": "/search?" + urllib.parse.urlencode(params)
+    }
+    while next_link:
+        response = client.get(next_link["href"])
+        response.raise_for_status()
+        data = response.json()
+        items.extend(data["features"])
+        next_link = next(
+            (link for link in data["links"] if link["rel"] == "next"), None
+        )
+    ids = [item["id"] for item in items]
+    assert len(ids) == len(set(ids)) == 721
+    assert ids == sorted(ids)
+
+
+def test_sort_multiple_collections_offset(client: TestClient) -> None:
+    body = {
+        "collections": ["naip", "naip-10"],
+        "sortby": [{"field": "id", "direction": "asc"}],
+        "limit": 4,
+    }
+    everything = client.post("/search", json={**body, "limit": 16}).json()
+    response = client.post("/search", json={**body, "offset": 8})
+    response.raise_for_status()
+    data = response.json()
+    assert [item["id"] for item in data["features"]] == [
+        item["id"] for item in everything["features"][8:12]
+    ]
+    next_link = next(link for link in data["links"] if link["rel"] == "next")
+    assert "offset" not in next_link["body"]
+    response = client.post("/search", json=next_link["body"])
+    response.raise_for_status()
+    assert [item["id"] for item in response.json()["features"]] == [
+        item["id"] for item in everything["features"][12:16]
+    ]
+
+
+def test_invalid_token(client: TestClient) -> None:
+    response = client.get(
+        "/search",
+        params={
+            "collections": "naip-10,openaerialmap-10",
+            "sortby": "id",
+            "token": "x",
+        },
+    )
+    assert response.status_code == 400
+
+
+def test_item_links(client: TestClient) -> None:
+    response = client.post("/search", json={"collections": ["naip"], "limit": 2})
+    assert response.headers["content-type"] == "application/geo+json"
+    for item in response.json()["features"]:
+        links = {link["rel"]: link["href"] for link in item["links"]}
+        assert links["self"] == f"http://testserver/collections/naip/items/{item['id']}"
+        assert links["parent"] == "http://testserver/collections/naip"
+        assert "preview" in links
+        assert client.get(links["self"]).json()["id"] == item["id"]
+
+
+def test_max_response_bytes() -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_max_response_bytes=10_000,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        first = client.get("/search", params={"limit": 100}).json()
+        assert len(first["features"]) < 100
+        assert any(link["rel"] == "next" for link in first["links"])
+
+        items: list[dict[str, Any]] = []
+        params = {"collections": "naip-10,openaerialmap-10", "limit": 30}
+        next_link: dict[str, Any] | None = {
+            "href": "/search?" + urllib.parse.urlencode(params)
+        }
+        while next_link:
+            response = client.get(next_link["href"])
+            response.raise_for_status()
+            data = response.json()
+            assert 0 < len(data["features"]) <= 30
+            items.extend(data["features"])
+            next_link = next(
+                (link for link in data["links"] if link["rel"] == "next"), None
+            )
+    unbudgeted = stac_fastapi.geoparquet.api.create(
+        Settings(stac_fastapi_collections_href=str(COLLECTIONS_PATH))
+    )
+    with TestClient(unbudgeted.app) as client:
+        expected = client.get("/search", params=params).json()
+    assert not any(link["rel"] == "next" for link in expected["links"])
+    assert [item["id"] for item in items] == [
+        item["id"] for item in expected["features"]
+    ]
+
+
+def test_byte_budget() -> None:
+    budget = ByteBudget(100)
+    assert budget.batch_size(1000) == FIRST_BATCH_SIZE
+    assert budget.add(cast(Item, {"id": "x" * 200}))
+    assert not budget.add(cast(Item, {"id": "y"}))
+    assert budget.batch_size(1000) == 1
@@ -0,0 +1,95 @@
+import time
+from pathlib import Path
+
+import anyio
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.shared import SharedCollections
+
+from .conftest import COLLECTIONS_PATH
+
+
+def test_one_reloader(tmp_path: Path) -> None:
+    reloader = SharedCollections(tmp_path)
+    worker = SharedCollections(tmp_path)
+    assert reloader.acquire()
+    assert not worker.acquire()
+    assert worker.read() is None
+
+    reloader.publish([{"id": "a"}])
+    assert worker.read() == [{"id": "a"}]
+    reloader.publish([{"id": "b"}])
+    assert worker.read() == [{"id": "b"}]
+    reloader.publish([{"id": "c"}])
+    assert len(list(tmp_path.glob("collections-*.json"))) == 2
+
+    reloader.close()
+    assert worker.acquire()
+
+
+def test_stale_snapshot(tmp_path: Path) -> None:
+    reloader = SharedCollections(tmp_path)
+    worker = SharedCollections(tmp_path)
+    assert reloader.acquire()
+    reloader.publish([{"id": "a"}])
+    current = reloader.current()
+    assert current is not None
+    version, published = current
+    assert worker.read(60) == [{"id": "a"}]
+
+    # The reloader is stuck: it still holds the lock, but stopped publishing.
+    (tmp_path / "current").write_text(f"{version} {time.time() - 120}")
+    assert worker.read(60) is None
+    assert worker.read() == [{"id": "a"}]
+    assert not worker.acquire()
+
+    # Publishing the same collections again shows they're still current.
+    reloader.publish([{"id": "a"}])
+    current = reloader.current()
+    assert current is not None and current[0] == version
+    assert current[1] >= published
+    assert worker.read(60) == [{"id": "a"}]
+    reloader.close()
+
+
+def test_workers_read_the_href_if_the_snapshot_is_stale(tmp_path: Path) -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_collections_reload_seconds=60,
+    )
+    reloader = SharedCollections(tmp_path)
+    worker = SharedCollections(tmp_path)
+    assert reloader.acquire()
+    reloader.publish([{"id": "a"}])
+    read_collections = stac_fastapi.geoparquet.api.read_collections
+    assert anyio.run(read_collections, settings, worker) == [{"id": "a"}]
+
+    # A quiet reloader doesn't publish for a while, but isn't stuck.
+    version = reloader.current_version()
+    (tmp_path / "current").write_text(f"{version} {time.time() - 90}")
+    assert anyio.run(read_collections, settings, worker) == [{"id": "a"}]
+
+    (tmp_path / "current").write_text(f"{version} {time.time() - 240}")
+    collections = anyio.run(read_collections, settings, worker)
+    assert {c["id"] for c in collections} > {"naip"}
+    reloader.close()
+
+
+def test_api_publishes_collections(tmp_path: Path) -> None:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_shared_state_directory=str(tmp_path),
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        response = client.get("/collections")
+        response.raise_for_status()
+        worker = SharedCollections(tmp_path)
+        assert not worker.acquire()
+        snapshot = worker.read()
+        assert snapshot and {c["id"] for c in snapshot} == {
+            c["id"] for c in response.json()["collections"]
+        }
+    assert worker.acquire()
@@ -0,0 +1,100 @@
+import logging
+from collections.abc import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+from stac_fastapi.geoparquet.slowlog import (
+    SlowQueryLog,
+    filter_shape,
+    fingerprint,
+    limit_bucket,
+)
+
+from .conftest import ADMIN_SECRET, COLLECTIONS_PATH
+
+
+def test_filter_shape() -> None:
+    assert filter_shape("naip:year = '2022' AND gsd < 0.6") == (
+        "naip:year = ? AND gsd < ?"
+    )
+    assert filter_shape({"op": "=", "args": [{"property": "naip:year"}, "2022"]}) == {
+        "op": "=",
+        "args": [{"property": "naip:year"}, "?"],
+    }
+
+
+def test_limit_bucket() -> None:
+    assert limit_bucket(0) == "<=1"
+    assert limit_bucket(10) == "<=10"
+    assert limit_bucket(42) == "<=100"
+
+
+def test_fingerprint() -> None:
+    a = fingerprint(
+        {"bbox": [0, 0, 1, 1], "sortby": ["-datetime"], "filter": "gsd < 1"},
+        ["b", "a"],
+        10,
+    )
+    b = fingerprint(
+        {
+            "bbox": [2, 2, 3, 3],
+            "sortby": [{"field": "datetime", "direction": "desc"}],
+            "filter": "gsd < 2",
+        },
+        ["a", "b"],
+        5,
+    )
+    assert a == b
+    assert a["parameters"] == ["bbox"]
+
+
+def test_top_evicts_least_total_time() -> None:
+    log = SlowQueryLog(Settings(stac_fastapi_slow_query_fingerprints=2))
+    for limit, seconds in ((1, 0.1), (10, 0.5), (100, 0.2)):
+        log.record(fingerprint({}, ["a"], limit), seconds, [])
+    top = log.top(10)
+    assert [entry["shape"]["limit"] for entry in top] == ["<=10", "<=100"]
+
+
+@pytest.fixture
+def logging_client() -> Iterator[TestClient]:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_slow_query_seconds=0,
+        stac_fastapi_admin_secret=ADMIN_SECRET,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_slow_queries(
+    logging_client: TestClient, caplog: pytest.LogCaptureFixture
+) -> None:
+    with caplog.at_level(logging.WARNING, logger="stac_fastapi.geoparquet.slowlog"):
+        for year in ("2020", "2022"):
+            response = logging_client.get(
+                "/search",
+                params={"collections": "naip", "filter": f"naip:year='{year}'"},
+            )
+            assert response.status_code == 200
+    assert len(caplog.records) == 2
+    assert '"collection": "naip"' in caplog.records[0].getMessage()
+
+    response = logging_client.get("/admin/slow-queries")
+    assert response.status_code == 401
+    response = logging_client.get(
+        "/admin/slow-queries", headers={"Authorization": f"Bearer {ADMIN_SECRET}"}
+    )
+    assert response.status_code == 200
+    (entry,) = response.json()["fingerprints"]
+    assert entry["count"] == 2
+    assert entry["shape"]["filter"] == "naip:year=?"
+    assert entry["rows"] > 0
+
+
+def test_slow_queries_are_off_by_default(client: TestClient) -> None:
+    assert client.get("/admin/slow-queries").status_code == 404
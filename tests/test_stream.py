@@ -0,0 +1,132 @@
+import json
+import time
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stac_fastapi.geoparquet.api
+from stac_fastapi.geoparquet import Settings
+
+from .conftest import COLLECTIONS_PATH
+
+LAMBDA_BUFFERED_LIMIT = 6 * 1024 * 1024
+"""The most bytes a buffered (not streamed) AWS Lambda response can have."""
+
+
+class StubStreamingRuntime:
+    """Stands in for Lambda's response streaming, behind the Lambda Web Adapter.
+
+    Each body message the app sends is passed on as it's sent, and recorded
+    with when it was sent and whether the body was complete by then.
+    """
+
+    def __init__(self, client: TestClient) -> None:
+        self.client = client
+        self.status: int | None = None
+        self.chunks: list[tuple[float, bytes, bool]] = []
+
+    def get(self, path: str, query: str = "") -> bytes:
+        assert self.client.portal is not None
+        self.client.portal.call(self.invoke, path, query)
+        return b"".join(chunk for _, chunk, _ in self.chunks)
+
+    async def invoke(self, path: str, query: str) -> None:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "client": ("lambda", 0),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": [(b"host", b"testserver")],
+            "state": self.client.app_state.copy(),
+        }
+        sent = False
+
+        async def receive() -> dict[str, Any]:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Like a client that waits for the whole response.
+            await self.client.portal.sleep_forever()  # type: ignore[union-attr]
+            raise AssertionError("unreachable")
+
+        async def send(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                self.status = message["status"]
+            elif message["type"] == "http.response.body":
+                more_body = message.get("more_body", False)
+                self.chunks.append((time.monotonic(), message["body"], more_body))
+
+        await self.client.app(scope, receive, send)
+
+
+@pytest.fixture
+def streaming_client() -> Iterator[TestClient]:
+    settings = Settings(
+        stac_fastapi_collections_href=str(COLLECTIONS_PATH),
+        stac_fastapi_stream_responses=True,
+        stac_fastapi_stream_batch_size=100,
+    )
+    api = stac_fastapi.geoparquet.api.create(settings)
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_stream_matches_buffered(
+    client: TestClient, streaming_client: TestClient
+) -> None:
+    for params in (
+        {"collections": "naip,openaerialmap", "limit": "250"},
+        {"collections": "naip", "limit": "5", "sortby": "-datetime"},
+        {"collections": "naip", "ids": "does-not-exist"},
+    ):
+        expected = client.get("/search", params=params)
+        actual = streaming_client.get("/search", params=params)
+        assert actual.status_code == expected.status_code == 200
+        assert actual.headers["content-type"] == "application/geo+json"
+        assert actual.json() == expected.json()
+
+
+def test_stream_item_collection(
+    client: TestClient, streaming_client: TestClient
+) -> None:
+    path = "/collections/naip/items"
+    expected = client.get(path, params={"limit": 150}).json()
+    assert streaming_client.get(path, params={"limit": 150}).json() == expected
+
+
+def test_stream_errors_before_first_batch(streaming_client: TestClient) -> None:
+    response = streaming_client.get("/search", params={"bbox": "not,a,bbox"})
+    assert response.status_code == 400
+
+
+def test_stream_chunks(streaming_client: TestClient) -> None:
+    runtime = StubStreamingRuntime(streaming_client)
+    body = runtime.get("/search", "collections=naip&limit=1000")
+    assert runtime.status == 200
+    item_collection = json.loads(body)
+    assert len(item_collection["features"]) == 1000
+    # The first items went out while the rest were still being read.
+    assert len(runtime.chunks) > 2
+    first_sent, first, more_body = runtime.chunks[0]
+    assert first and more_body
+    assert first_sent < runtime.chunks[-1][0]
+    assert not runtime.chunks[-1][2]
+
+
+def test_stream_beyond_buffered_limit(streaming_client: TestClient) -> None:
+    runtime = StubStreamingRuntime(streaming_client)
+    body = runtime.get("/search", "limit=100000")
+    assert runtime.status == 200
+    assert len(body) > LAMBDA_BUFFERED_LIMIT
+    assert max(len(chunk) for _, chunk, _ in runtime.chunks) < LAMBDA_BUFFERED_LIMIT
+    json.loads(body)
@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from stac_fastapi.geoparquet.tiles import MVT_MEDIA_TYPE, tile_bounds
+
+NAIP_TILE = "7/27/47"
+
+
+def test_tile_bounds() -> None:
+    assert tile_bounds(0, 0, 0) == pytest.approx((-180, -85.0511288, 180, 85.0511288))
+    west, south, east, north = tile_bounds(7, 27, 47)
+    assert west < -104 < east and south < 41 < north
+
+
+def test_collection_tile(client: TestClient) -> None:
+    response = client.get(f"/collections/naip/tiles/{NAIP_TILE}")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == MVT_MEDIA_TYPE
+    assert b"naip" in response.content
+    assert b"ne_m_4110264_sw_13_060_20220827" in response.content
+
+    response = client.get("/collections/naip/tiles/7/0/0")
+    assert response.status_code == 200, response.text
+    assert response.content == b""
+
+
+def test_collection_tile_filters(client: TestClient) -> None:
+    url = f"/collections/naip/tiles/{NAIP_TILE}"
+    matching = client.get(url, params={"filter": "naip:year='2022'"}).content
+    assert b"ne_m_4110264_sw_13_060_20220827" in matching
+    assert client.get(url, params={"filter": "naip:year='1900'"}).content == b""
+    assert client.get(url, params={"datetime": "1900-01-01T00:00:00Z"}).content == b""
+    content = client.get(url, params={"ids": "ne_m_4110264_sw_13_060_20220827"}).content
+    assert content and len(content) < len(matching)
+
+
+def test_tile(client: TestClient) -> None:
+    response = client.get(f"/tiles/{NAIP_TILE}", params={"collections": "naip,naip-10"})
+    assert response.status_code == 200, response.text
+    assert b"naip-10" in response.content
+    assert len(response.content) > len(
+        client.get(f"/collections/naip/tiles/{NAIP_TILE}").content
+    )
+
+
+def test_tile_cache(client: TestClient) -> None:
+    extension = next(
+        route
+        for route in client.app.routes  # type: ignore[attr-defined]
+        if getattr(route, "name", None) == "Get Tile"
+    ).endpoint.__self__
+    first = client.get(f"/collections/naip/tiles/{NAIP_TILE}").content
+    assert len(extension.cache.tiles) == 1
+    assert client.get(f"/collections/naip/tiles/{NAIP_TILE}").content == first
+    assert len(extension.cache.tiles) == 1
+
+
+def test_invalid_tile(client: TestClient) -> None:
+    assert client.get("/collections/naip/tiles/1/2/0").status_code == 400
+    assert client.get("/collections/not-a-collection/tiles/0/0/0").status_code == 404
+
+
+def test_tile_datetime_range(client: TestClient) -> None:
+    # These items only have start_datetime and end_datetime
+    url = "/collections/openaerialmap-10/tiles/12/852/1551"
+    content = client.get(url, params={"datetime": "2016-06-01T00:00:00Z"}).content
+    assert b"5bcfb652e5203200052aeea9" in content
+    assert b"5f1ec3b157ddda00054a0321" not in content
+
+
+def test_tile_cache_uses_reloaded_versions(client: TestClient) -> None:
+    client.get(f"/collections/naip/tiles/{NAIP_TILE}").raise_for_status()
+    with patch("stac_fastapi.geoparquet.etag.from_href") as from_href:
+        client.get(f"/collections/naip/tiles/{NAIP_TILE}").raise_for_status()
+        from_href.assert_not_called()